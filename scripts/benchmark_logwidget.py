@@ -0,0 +1,59 @@
+"""
+Measures what logging to the LogWidget costs the thread that logs, and how long the GUI thread spends writing batches.
+
+    python scripts/benchmark_logwidget.py [number of records]
+
+Records are logged from a worker thread at debug level, the way the controllers log while scraping. Run it with src on
+the PYTHONPATH, like the other scripts.
+"""
+
+import sys
+import time
+import logging
+import threading
+
+from PySide2.QtWidgets import QApplication, QTextEdit
+
+from gui.logwidget import LogWidget
+
+
+if __name__ == '__main__':
+    numRecords = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    app = QApplication()
+    edit = QTextEdit()
+    edit.show()
+
+    lw = LogWidget(edit)
+    lw.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    lw.setLevel(logging.DEBUG)
+    lw.addLogger("controller.benchmark", "rgba(100, 100, 0, 0.2)")
+    logger = logging.getLogger("controller.benchmark")
+    logger.setLevel(logging.DEBUG)
+
+    def logRecords():
+        for i in range(numRecords):
+            logger.debug(f"Scraped card {i}")
+            if i % 1000 == 0:
+                logger.info(f"{i} cards scraped")
+
+    writes = []
+    writeRecords = lw.writeRecords
+
+    def timedWrite():
+        start = time.perf_counter()
+        writeRecords()
+        writes.append(time.perf_counter() - start)
+
+    lw.timer.timeout.disconnect(writeRecords)
+    lw.timer.timeout.connect(timedWrite)
+
+    worker = threading.Thread(target=logRecords)
+    worker.start()
+    while worker.is_alive():
+        app.processEvents()
+    timedWrite()
+
+    print(f"{numRecords} records: {lw.emitCost():.2f} us per record in emit, "
+          f"{len(writes)} batches written, slowest batch {max(writes) * 1000:.2f} ms, "
+          f"{edit.document().blockCount()} lines kept")
@@ -0,0 +1,76 @@
+"""
+Measures how long each frame takes to draw while dragging the selection circle around the connection map.
+
+    python scripts/benchmark_map.py [number of locations] [frames]
+
+The locations are random points that are geocoded by a stub, against an in-memory SQLite database, so the benchmark
+doesn't need the network or the production database. Run it with src on the PYTHONPATH, like the other scripts.
+"""
+
+import os
+import sys
+import time
+import random
+
+os.environ.setdefault("SOCIAL_DATABASE_URL", "sqlite://")
+
+import numpy as np
+from matplotlib.pyplot import Circle
+from PySide2.QtWidgets import QApplication
+from PySide2.QtCore import QThreadPool
+
+from database.migrations import prepareDatabase
+from database.geocoding import StaticGeocoder, GeocodeResolver
+from gui.mapdialog import MapDialog
+
+
+def benchmarkDrag(dialog: MapDialog, frames: int = 200) -> dict:
+    """
+    Drags the dialog's selection circle across the map and measures how long each frame takes to draw.
+
+    :return: The mean, 95th percentile, and slowest frame times in milliseconds
+    """
+    if not dialog.point:
+        dialog.point = Circle((0, 0), .5, color='#0381ab')
+        dialog.circle = Circle((0, 0), dialog.radius, color='#05abe3', alpha=0.5)
+        dialog.ax.add_artist(dialog.circle)
+        dialog.ax.add_artist(dialog.point)
+        dialog.refreshBackground()
+
+    times = []
+    for frame in range(frames):
+        x = -170 + 340 * frame / frames
+        y = 60 * np.sin(frame / 10)
+
+        start = time.perf_counter()
+        dialog.circle.center = dialog.point.center = x, y
+        dialog.redrawSelection()
+        dialog.updateMiles()
+        QApplication.processEvents()
+        times.append((time.perf_counter() - start) * 1000)
+
+    times = np.array(times)
+    return {'mean': times.mean(), 'p95': np.percentile(times, 95), 'max': times.max()}
+
+
+if __name__ == '__main__':
+    numLocations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    app = QApplication()
+    prepareDatabase()
+
+    coordinates = {f"Location {i}": (random.uniform(-60, 70), random.uniform(-180, 180)) for i in range(numLocations)}
+    locations = random.choices(list(coordinates), k=numLocations * 2)
+
+    resolver = GeocodeResolver(StaticGeocoder(coordinates), maxRequestsPerSecond=0)
+    dialog = MapDialog(None, locations, resolver=resolver)
+    dialog.show()
+
+    # Wait for the world map and the locations to be loaded and plotted
+    QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+
+    results = benchmarkDrag(dialog, frames)
+    print(f"{numLocations} locations, {frames} frames: mean {results['mean']:.2f} ms, "
+          f"95th percentile {results['p95']:.2f} ms, slowest {results['max']:.2f} ms")
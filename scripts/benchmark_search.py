@@ -0,0 +1,46 @@
+"""
+Measures how long the connection search takes for each keystroke while typing into the search box.
+
+    python scripts/benchmark_search.py [number of connections]
+
+The connections are random names, positions and locations, so the benchmark doesn't need the database. Run it with src
+on the PYTHONPATH, like the other scripts.
+"""
+
+import sys
+import time
+import random
+import string
+
+from common.search import TrigramIndex, connectionDocument
+
+FRAME_MS = 1000 / 60
+
+
+def randomWord():
+    return ''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))).title()
+
+
+if __name__ == '__main__':
+    numConnections = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    names = [f"{randomWord()} {randomWord()}" for _ in range(numConnections)]
+    documents = [connectionDocument(name, f"{randomWord()} at {randomWord()}", f"{randomWord()}, {randomWord()}")
+                 for name in names]
+
+    start = time.perf_counter()
+    index = TrigramIndex(documents)
+    print(f"Indexed {numConnections} connections in {time.perf_counter() - start:.2f} s")
+
+    # Type a name from the middle of the list, then erase it
+    name = names[numConnections // 2]
+    typed = [name[:i] for i in range(1, len(name) + 1)]
+    worst = 0
+    for text in typed + typed[-2::-1] + [""]:
+        start = time.perf_counter()
+        found = len(index.search(text))
+        elapsed = (time.perf_counter() - start) * 1000
+        worst = max(worst, elapsed)
+        print(f"{text!r:>24}: {found:>7} matches in {elapsed:6.2f} ms")
+
+    print(f"Slowest keystroke: {worst:.2f} ms ({'within' if worst <= FRAME_MS else 'over'} a {FRAME_MS:.1f} ms frame)")
@@ -1,78 +1,142 @@
+import logging
+import threading
+from ftplib import all_errors
+
 from PySide2.QtWidgets import QApplication
-from PySide2.QtCore import QThreadPool
-from database.credentials import file_host, file_port, file_password, file_username
-from ftplib import FTP
+from PySide2.QtCore import QObject, QThreadPool, QTimer, Signal
 from common.threading import Task
+from common.sync import CriticalSections
+from common.filehost import FileHostSession, remoteSignature
 
-ftp = FTP()
-ftp.connect(host=file_host, port=file_port)
-ftp.login(user=file_username, passwd=file_password)
+logger = logging.getLogger("root")
 
 View = None
-Lock = False  # This allows the currently running function to finish before the app is forcefully exited
+Critical = CriticalSections()  # Lets the running critical functions finish before the app is forcefully exited
 Waiting = False
 
 
 # To check if social is allowed to be running, we use the following
 
-def checkRun():
+class KillSwitch:
+    """
+    Reads whether Social is allowed to run from a file on the file host (its first line is "True" if it is).
+
+    The FTP session is kept open between checks (and reopened if it drops). Each check first asks for the file's
+    modification time and size, and the file is only downloaded again when one of them changed, so most checks are two
+    short commands. If the server can't be reached, the last known answer stands.
+    """
+
+    FILE = 'social.txt'
+
+    def __init__(self, session: FileHostSession = None, path: str = FILE):
+        self.session = session or FileHostSession()
+        self.path = path
+        self.allowed = None  # Unknown until the first successful check
+        self.signature = None
+        self.downloads = 0
+        self._lock = threading.Lock()
+
+    def check(self) -> bool:
+        """
+        Checks whether Social may run, downloading the file only if it changed since the last check.
+
+        :return: The answer, or the last known answer (None if there isn't one) if the server couldn't be reached.
+                 It never raises.
+        """
+        with self._lock:
+            try:
+                self.session.run(self._read)
+            except all_errors as e:
+                logger.warning(f"Couldn't check whether Social may run: {e}")
+            except Exception:
+                # Anything else (a garbled reply, a bug) must not stop the poller either
+                logger.exception("Couldn't check whether Social may run")
+            return self.allowed
+
+    def _read(self, ftp):
+        signature = remoteSignature(ftp, self.path)
+        if signature is not None and signature == self.signature and self.allowed is not None:
+            return
+
+        lines = []
+        ftp.retrlines(f'RETR {self.path}', callback=lines.append)
+        self.downloads += 1
+        self.signature = signature
+        self.allowed = bool(lines) and lines[0].strip() == 'True'
+
+
+class KillSwitchPoller(QObject):
+    """
+    Checks the kill switch every so often on a worker thread, so a slow file host never holds up the GUI. Emits
+    stateChanged(allowed) whenever the answer changes (including the first time there is one).
+    """
+
+    stateChanged = Signal(bool)
+
+    INTERVAL_MS = 10_000
+
+    def __init__(self, killSwitch: KillSwitch, intervalMs: int = INTERVAL_MS, parent=None):
+        QObject.__init__(self, parent)
+        self.killSwitch = killSwitch
+        self.allowed = killSwitch.allowed
+        self.checking = False
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(intervalMs)
+        self.timer.timeout.connect(self.poll)
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def poll(self):
+        """Starts a check unless the previous one is still running."""
+        if self.checking:
+            return
+        self.checking = True
+        task = Task(self.killSwitch.check)
+        task.finished.connect(self.onChecked)
+        QThreadPool.globalInstance().start(task)
+
+    def onChecked(self, allowed):
+        self.checking = False  # check() never raises, so this always runs
+        if allowed is not None and allowed != self.allowed:
+            self.allowed = allowed
+            self.stateChanged.emit(allowed)
+
+
+killSwitch = KillSwitch()
+
+
+def shutDown():
+    """Lets the running critical functions finish, then closes the browsers and quits."""
     global Waiting
-    global Lock
-    global View
-    firstLine = True
-
-    if not Waiting:
-        def handler(valid):
-            global Waiting
-            nonlocal firstLine
-
-            if firstLine:
-                firstLine = False
-                if valid in ('True', 'True\r\n'):
-                    return
-                else:
-                    def waitForCurrentFunctionToFinish():
-                        while Lock:
-                            pass
-
-                    def closeApp():
-                        QThreadPool.globalInstance().clear()
-                        View.closeAllBrowsers()
-                        QApplication.instance().quit()
-
-                    Waiting = True
-                    t = Task(waitForCurrentFunctionToFinish)
-                    t.finished.connect(closeApp)
-                    QThreadPool.globalInstance().start(t)
-
-        ftp.retrlines('RETR social.txt', callback=handler)
 
+    if Waiting:
+        return
 
-def canRun():
-    global Waiting
-    firstLine = True
-    result = False
-
-    def handler(valid):
-        global Waiting
-        nonlocal firstLine
-        nonlocal result
+    def waitForCurrentFunctionToFinish():
+        Critical.waitUntilFinished()
 
-        if firstLine:
-            firstLine = False
+    def closeApp():
+        QThreadPool.globalInstance().clear()
+        View.closeAllBrowsers()
+        QApplication.instance().quit()
 
-            if valid in ('True', 'True\r\n'):
-                result = True
-            else:
-                result = False
+    Waiting = True
+    t = Task(waitForCurrentFunctionToFinish)
+    t.finished.connect(closeApp)
+    QThreadPool.globalInstance().start(t)
 
-            Waiting = False
 
-    Waiting = True
-    
-    ftp.retrlines('RETR social.txt', callback=handler)
+def checkRun(allowed: bool):
+    """Shuts Social down as soon as the kill switch says it may no longer run."""
+    if not allowed:
+        shutDown()
 
-    while Waiting:
-        pass
 
-    return result
+def canRun():
+    """Checks (once, right away) whether Social may run. Social may not run if the answer can't be determined."""
+    return bool(killSwitch.check())
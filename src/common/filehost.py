@@ -0,0 +1,83 @@
+import threading
+from ftplib import FTP, all_errors, error_perm
+
+TIMEOUT = 30  # seconds, for connecting and for each command
+
+
+def connectToFileHost() -> FTP:
+    """
+    Opens a new, logged in session with the file host. The credentials are only imported here, so the rest of this
+    module (and what's built on it, like the kill switch) can be used without them.
+    """
+    from database.credentials import file_host, file_port, file_password, file_username
+
+    ftp = FTP(timeout=TIMEOUT)
+    ftp.connect(host=file_host, port=file_port)
+    ftp.login(user=file_username, passwd=file_password)
+    return ftp
+
+
+def remoteSignature(ftp: FTP, path: str):
+    """
+    Identifies the current version of a file on the server from its modification time (MDTM) and size (SIZE), without
+    downloading it.
+
+    :return: (modification time, size), or None if the server doesn't support those commands
+    """
+    try:
+        ftp.voidcmd('TYPE I')  # Some servers only answer SIZE in binary mode
+        modified = ftp.sendcmd(f'MDTM {path}').split()[-1]
+        size = ftp.size(path)
+    except error_perm:
+        return None
+    return modified, size
+
+
+class FileHostSession:
+    """
+    A session with the file host that's shared between calls instead of being opened for each of them.
+
+    The session is opened on first use. If a call fails because the connection dropped (or the server went away), the
+    session is reopened and the call is tried once more. Calls are serialized, so the session can be used from any
+    thread.
+
+    The connect function opens the session, so tests can connect to a local FTP server instead.
+
+    >>> session = FileHostSession()
+    >>> session.run(lambda ftp: ftp.size('social.txt'))
+    """
+
+    def __init__(self, connect=connectToFileHost):
+        self.connect = connect
+        self.ftp = None
+        self._lock = threading.RLock()
+
+    def run(self, func):
+        """
+        Calls func with the open FTP session and returns what it returns.
+
+        :raises ftplib.Error, OSError, EOFError: If the call failed even after reconnecting
+        """
+        with self._lock:
+            try:
+                return func(self._session())
+            except error_perm:
+                raise  # The server answered, the request itself was refused
+            except all_errors:
+                self.close()
+                return func(self._session())
+
+    def _session(self) -> FTP:
+        if self.ftp is None:
+            self.ftp = self.connect()
+        return self.ftp
+
+    def close(self):
+        """Closes the session. The next call opens a new one."""
+        with self._lock:
+            if self.ftp is not None:
+                try:
+                    self.ftp.quit()
+                except all_errors:
+                    self.ftp.close()
+                self.ftp = None
@@ -0,0 +1,128 @@
+"""
+Bundled place names used to parse connection locations without a geocoding service.
+
+COUNTRIES maps each country's name to its other common spellings. REGIONS maps a country to its first level divisions
+(the "state" of a location) and their abbreviations. CITIES maps well known cities to the region and country they're
+in, so that locations which only name a city or metropolitan area ("Greater Denver Area") can still be placed.
+
+Names are matched case insensitively. Keep the canonical spelling the way LinkedIn writes it.
+"""
+
+COUNTRIES = {
+    "Afghanistan": [], "Albania": [], "Algeria": [], "Andorra": [], "Angola": [], "Antigua and Barbuda": [],
+    "Argentina": [], "Armenia": [], "Australia": ["AU", "AUS"], "Austria": [], "Azerbaijan": [], "Bahamas": [],
+    "Bahrain": [], "Bangladesh": [], "Barbados": [], "Belarus": [], "Belgium": [], "Belize": [], "Benin": [],
+    "Bhutan": [], "Bolivia": [], "Bosnia and Herzegovina": [], "Botswana": [], "Brazil": ["Brasil"], "Brunei": [],
+    "Bulgaria": [], "Burkina Faso": [], "Burundi": [], "Cambodia": [], "Cameroon": [], "Canada": ["CA", "CAN"],
+    "Cape Verde": ["Cabo Verde"], "Central African Republic": [], "Chad": [], "Chile": [], "China": ["PRC"],
+    "Colombia": [], "Comoros": [], "Congo": [], "Costa Rica": [], "Croatia": [], "Cuba": [], "Cyprus": [],
+    "Czechia": ["Czech Republic"], "Democratic Republic of the Congo": ["DRC"], "Denmark": [], "Djibouti": [],
+    "Dominica": [], "Dominican Republic": [], "Ecuador": [], "Egypt": [], "El Salvador": [], "Equatorial Guinea": [],
+    "Eritrea": [], "Estonia": [], "Eswatini": ["Swaziland"], "Ethiopia": [], "Fiji": [], "Finland": [], "France": [],
+    "Gabon": [], "Gambia": [], "Georgia": [], "Germany": ["Deutschland"], "Ghana": [], "Greece": [], "Grenada": [],
+    "Guatemala": [], "Guinea": [], "Guinea-Bissau": [], "Guyana": [], "Haiti": [], "Honduras": [], "Hong Kong": [],
+    "Hungary": [], "Iceland": [], "India": [], "Indonesia": [], "Iran": [], "Iraq": [], "Ireland": [], "Israel": [],
+    "Italy": ["Italia"], "Ivory Coast": ["Côte d'Ivoire", "Cote d'Ivoire"], "Jamaica": [], "Japan": [], "Jordan": [],
+    "Kazakhstan": [], "Kenya": [], "Kiribati": [], "Kosovo": [], "Kuwait": [], "Kyrgyzstan": [], "Laos": [],
+    "Latvia": [], "Lebanon": [], "Lesotho": [], "Liberia": [], "Libya": [], "Liechtenstein": [], "Lithuania": [],
+    "Luxembourg": [], "Madagascar": [], "Malawi": [], "Malaysia": [], "Maldives": [], "Mali": [], "Malta": [],
+    "Marshall Islands": [], "Mauritania": [], "Mauritius": [], "Mexico": ["México"], "Micronesia": [],
+    "Moldova": [], "Monaco": [], "Mongolia": [], "Montenegro": [], "Morocco": [], "Mozambique": [],
+    "Myanmar": ["Burma"], "Namibia": [], "Nauru": [], "Nepal": [], "Netherlands": ["The Netherlands", "Holland"],
+    "New Zealand": ["NZ"], "Nicaragua": [], "Niger": [], "Nigeria": [], "North Korea": [], "North Macedonia": [],
+    "Norway": [], "Oman": [], "Pakistan": [], "Palau": [], "Palestine": [], "Panama": [], "Papua New Guinea": [],
+    "Paraguay": [], "Peru": [], "Philippines": [], "Poland": [], "Portugal": [], "Puerto Rico": [], "Qatar": [],
+    "Romania": [], "Russia": ["Russian Federation"], "Rwanda": [], "Saint Kitts and Nevis": [], "Saint Lucia": [],
+    "Saint Vincent and the Grenadines": [], "Samoa": [], "San Marino": [], "Sao Tome and Principe": [],
+    "Saudi Arabia": [], "Senegal": [], "Serbia": [], "Seychelles": [], "Sierra Leone": [], "Singapore": [],
+    "Slovakia": [], "Slovenia": [], "Solomon Islands": [], "Somalia": [], "South Africa": [],
+    "South Korea": ["Korea", "Republic of Korea"], "South Sudan": [], "Spain": ["España"], "Sri Lanka": [],
+    "Sudan": [], "Suriname": [], "Sweden": [], "Switzerland": [], "Syria": [], "Taiwan": [], "Tajikistan": [],
+    "Tanzania": [], "Thailand": [], "Timor-Leste": ["East Timor"], "Togo": [], "Tonga": [],
+    "Trinidad and Tobago": [], "Tunisia": [], "Turkey": ["Türkiye"], "Turkmenistan": [], "Tuvalu": [], "Uganda": [],
+    "Ukraine": [], "United Arab Emirates": ["UAE"], "United Kingdom": ["UK", "Great Britain", "Britain", "GB"],
+    "United States": ["US", "USA", "U.S.", "U.S.A.", "United States of America", "America"], "Uruguay": [],
+    "Uzbekistan": [], "Vanuatu": [], "Vatican City": [], "Venezuela": [], "Vietnam": ["Viet Nam"], "Yemen": [],
+    "Zambia": [], "Zimbabwe": [],
+}
+
+REGIONS = {
+    "United States": {
+        "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR", "California": "CA", "Colorado": "CO",
+        "Connecticut": "CT", "Delaware": "DE", "District of Columbia": "DC", "Florida": "FL", "Georgia": "GA",
+        "Hawaii": "HI", "Idaho": "ID", "Illinois": "IL", "Indiana": "IN", "Iowa": "IA", "Kansas": "KS",
+        "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD", "Massachusetts": "MA",
+        "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS", "Missouri": "MO", "Montana": "MT",
+        "Nebraska": "NE", "Nevada": "NV", "New Hampshire": "NH", "New Jersey": "NJ", "New Mexico": "NM",
+        "New York": "NY", "North Carolina": "NC", "North Dakota": "ND", "Ohio": "OH", "Oklahoma": "OK",
+        "Oregon": "OR", "Pennsylvania": "PA", "Rhode Island": "RI", "South Carolina": "SC", "South Dakota": "SD",
+        "Tennessee": "TN", "Texas": "TX", "Utah": "UT", "Vermont": "VT", "Virginia": "VA", "Washington": "WA",
+        "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY",
+    },
+    "Canada": {
+        "Alberta": "AB", "British Columbia": "BC", "Manitoba": "MB", "New Brunswick": "NB",
+        "Newfoundland and Labrador": "NL", "Northwest Territories": "NT", "Nova Scotia": "NS", "Nunavut": "NU",
+        "Ontario": "ON", "Prince Edward Island": "PE", "Quebec": "QC", "Saskatchewan": "SK", "Yukon": "YT",
+    },
+    "Australia": {
+        "Australian Capital Territory": "ACT", "New South Wales": "NSW", "Northern Territory": "NT",
+        "Queensland": "QLD", "South Australia": "SA", "Tasmania": "TAS", "Victoria": "VIC",
+        "Western Australia": "WA",
+    },
+    "United Kingdom": {
+        "England": "", "Northern Ireland": "", "Scotland": "", "Wales": "",
+    },
+}
+
+CITIES = {
+    # United States
+    "Atlanta": ("Georgia", "United States"), "Austin": ("Texas", "United States"),
+    "Baltimore": ("Maryland", "United States"), "Boston": ("Massachusetts", "United States"),
+    "Charlotte": ("North Carolina", "United States"), "Chicago": ("Illinois", "United States"),
+    "Cincinnati": ("Ohio", "United States"), "Cleveland": ("Ohio", "United States"),
+    "Columbus": ("Ohio", "United States"), "Dallas": ("Texas", "United States"),
+    "Denver": ("Colorado", "United States"), "Detroit": ("Michigan", "United States"),
+    "Fort Worth": ("Texas", "United States"), "Honolulu": ("Hawaii", "United States"),
+    "Houston": ("Texas", "United States"), "Indianapolis": ("Indiana", "United States"),
+    "Jacksonville": ("Florida", "United States"), "Kansas City": ("Missouri", "United States"),
+    "Las Vegas": ("Nevada", "United States"), "Los Angeles": ("California", "United States"),
+    "Memphis": ("Tennessee", "United States"), "Miami": ("Florida", "United States"),
+    "Milwaukee": ("Wisconsin", "United States"), "Minneapolis": ("Minnesota", "United States"),
+    "Nashville": ("Tennessee", "United States"), "New Orleans": ("Louisiana", "United States"),
+    "New York City": ("New York", "United States"), "Oklahoma City": ("Oklahoma", "United States"),
+    "Orlando": ("Florida", "United States"), "Philadelphia": ("Pennsylvania", "United States"),
+    "Phoenix": ("Arizona", "United States"), "Pittsburgh": ("Pennsylvania", "United States"),
+    "Portland": ("Oregon", "United States"), "Raleigh": ("North Carolina", "United States"),
+    "Sacramento": ("California", "United States"), "Salt Lake City": ("Utah", "United States"),
+    "San Antonio": ("Texas", "United States"), "San Diego": ("California", "United States"),
+    "San Francisco": ("California", "United States"), "San Jose": ("California", "United States"),
+    "Seattle": ("Washington", "United States"), "St. Louis": ("Missouri", "United States"),
+    "Tampa": ("Florida", "United States"), "Washington D.C.": ("District of Columbia", "United States"),
+    # Canada
+    "Calgary": ("Alberta", "Canada"), "Edmonton": ("Alberta", "Canada"), "Montreal": ("Quebec", "Canada"),
+    "Ottawa": ("Ontario", "Canada"), "Toronto": ("Ontario", "Canada"), "Vancouver": ("British Columbia", "Canada"),
+    # Elsewhere
+    "Amsterdam": ("", "Netherlands"), "Bangalore": ("", "India"), "Barcelona": ("", "Spain"),
+    "Beijing": ("", "China"), "Berlin": ("", "Germany"), "Brisbane": ("Queensland", "Australia"),
+    "Brussels": ("", "Belgium"), "Buenos Aires": ("", "Argentina"), "Cape Town": ("", "South Africa"),
+    "Copenhagen": ("", "Denmark"), "Dubai": ("", "United Arab Emirates"), "Dublin": ("", "Ireland"),
+    "Frankfurt": ("", "Germany"), "Hamburg": ("", "Germany"), "Johannesburg": ("", "South Africa"),
+    "Lagos": ("", "Nigeria"), "Lisbon": ("", "Portugal"), "London": ("England", "United Kingdom"),
+    "Madrid": ("", "Spain"), "Manchester": ("England", "United Kingdom"), "Melbourne": ("Victoria", "Australia"),
+    "Mexico City": ("", "Mexico"), "Milan": ("", "Italy"), "Mumbai": ("", "India"), "Munich": ("", "Germany"),
+    "Nairobi": ("", "Kenya"), "New Delhi": ("", "India"), "Oslo": ("", "Norway"), "Paris": ("", "France"),
+    "Perth": ("Western Australia", "Australia"), "Rome": ("", "Italy"), "São Paulo": ("", "Brazil"),
+    "Seoul": ("", "South Korea"), "Shanghai": ("", "China"), "Stockholm": ("", "Sweden"),
+    "Sydney": ("New South Wales", "Australia"), "Tel Aviv": ("", "Israel"), "Tokyo": ("", "Japan"),
+    "Vienna": ("", "Austria"), "Warsaw": ("", "Poland"), "Zurich": ("", "Switzerland"),
+}
+
+# Other names LinkedIn and people commonly use for the cities above. They only place a city, its name is kept as
+# the location writes it.
+CITY_ALIASES = {
+    "New York": "New York City", "NYC": "New York City", "San Francisco Bay": "San Francisco",
+    "Bay": "San Francisco", "Dallas/Fort Worth": "Dallas", "Dallas-Fort Worth": "Dallas",
+    "Minneapolis-St. Paul": "Minneapolis", "Washington DC": "Washington D.C.",
+    "Saint Louis": "St. Louis", "Bengaluru": "Bangalore", "Delhi": "New Delhi", "Sao Paulo": "São Paulo",
+    "Montréal": "Montreal", "Zürich": "Zurich", "München": "Munich",
+}
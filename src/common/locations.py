@@ -0,0 +1,139 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from common.gazetteer import COUNTRIES, REGIONS, CITIES, CITY_ALIASES
+
+LocationParts = namedtuple("LocationParts", ["city", "state", "country", "zip_code"])
+NO_LOCATION = LocationParts("", "", "", "")
+
+Region = namedtuple("Region", ["name", "country"])
+City = namedtuple("City", ["name", "region", "country"])
+
+# US ZIP (and ZIP+4) codes and Canadian postal codes
+POSTAL_CODE_PATTERN = re.compile(r"\b(\d{5}(?:-\d{4})?|[A-Za-z]\d[A-Za-z] ?\d[A-Za-z]\d)\b")
+
+# "Greater Denver Area", "San Francisco Bay Area", "Dallas/Fort Worth Metropolitan Area", ...
+METRO_AREA_PATTERN = re.compile(r"^(greater\s+)?(.*?)(\s+(?:metropolitan\s+|metro\s+|bay\s+)?area)?$", re.IGNORECASE)
+
+
+# --- Gazetteer Indexes ------------------------------------------------------------------------------------------------
+# Built once when the module is imported so that every lookup while parsing is a single dictionary access.
+
+_countries = {}
+for _name, _aliases in COUNTRIES.items():
+    for _alias in [_name] + _aliases:
+        _countries[_alias.casefold()] = _name
+
+_regions = {}
+_regionAbbreviations = {}
+for _country, _countryRegions in REGIONS.items():
+    for _name, _abbreviation in _countryRegions.items():
+        _regions.setdefault(_name.casefold(), []).append(Region(_name, _country))
+        if _abbreviation:
+            _regionAbbreviations.setdefault(_abbreviation.casefold(), []).append(Region(_name, _country))
+
+_cities = {_name.casefold(): City(_name, *_place) for _name, _place in CITIES.items()}
+for _alias, _name in CITY_ALIASES.items():
+    _cities[_alias.casefold()] = _cities[_name.casefold()]
+
+
+def findCountry(text: str) -> str:
+    """Gets the canonical name of a country from its name or one of its other spellings, or "" if it isn't known."""
+    return _countries.get(text.casefold(), "")
+
+
+def findRegion(text: str, country: str = "", allowAbbreviation: bool = True):
+    """
+    Finds a state, province, or other first level division by name (or by abbreviation).
+
+    :param country: If known, only regions in this country are considered
+    :return: The Region, or None if it isn't known
+    """
+    key = text.casefold()
+    candidates = _regions.get(key, []) + (_regionAbbreviations.get(key, []) if allowAbbreviation else [])
+    for region in candidates:
+        if not country or region.country == country:
+            return region
+    return None
+
+
+def findCity(text: str):
+    """Finds one of the gazetteer's cities by name or alias. Returns the City, or None if it isn't known."""
+    return _cities.get(text.casefold())
+
+
+def metroAreaCore(text: str):
+    """
+    Strips the metropolitan area wording from a location ("Greater Denver Area" -> "Denver").
+
+    :return: The remaining text and whether any wording was stripped
+    """
+    greater, core, area = METRO_AREA_PATTERN.match(text).groups()
+    return core.strip(), bool(greater or area)
+
+
+@lru_cache(maxsize=100000)
+def parseLocation(location: str) -> LocationParts:
+    """
+    Splits a free text LinkedIn location into its city, state, country, and zip code using the bundled gazetteer.
+
+    LinkedIn writes locations as "City, State, Country", "City, Country", "Greater City Area", or just a region or
+    country, so the parts are read from the end of the location and matched against the gazetteer. Components that
+    can't be determined are "". Results are cached since an account's connections share a small number of locations.
+
+    >>> parseLocation("Greater Denver Area")
+    LocationParts(city='Denver', state='Colorado', country='United States', zip_code='')
+    """
+    if not location:
+        return NO_LOCATION
+
+    text = " ".join(location.split())
+    zipCode = ""
+    match = POSTAL_CODE_PATTERN.search(text)
+    if match:
+        zipCode = match.group(1).upper()
+        text = text[:match.start()] + text[match.end():]
+
+    parts = [part.strip() for part in text.split(",") if part.strip()]
+    cityText = state = country = ""
+
+    # The country is always last, but some names are both a country and a region. After a city, a region's
+    # abbreviation is read as the region ("San Diego, CA") and its full name only when the city is in it ("Atlanta,
+    # Georgia", but "Tbilisi, Georgia").
+    if parts and findCountry(parts[-1]):
+        isRegion = False
+        if len(parts) > 1:
+            region = findRegion(parts[-1], allowAbbreviation=False)
+            city = findCity(metroAreaCore(parts[0])[0])
+            if region:
+                isRegion = bool(city and city.country == region.country)
+            else:
+                isRegion = findRegion(parts[-1]) is not None
+        if not isRegion:
+            country = findCountry(parts.pop())
+
+    if len(parts) >= 2:
+        region = findRegion(parts[-1], country)
+        state = region.name if region else parts[-1]
+        country = country or (region.country if region else "")
+        cityText = parts[0]
+
+    elif len(parts) == 1:
+        core, isMetroArea = metroAreaCore(parts[0])
+        region = None if isMetroArea else findRegion(core, country, allowAbbreviation=False)
+        if region:
+            state, country = region.name, country or region.country
+        else:
+            cityText = parts[0]
+
+    city = ""
+    if cityText:
+        core, isMetroArea = metroAreaCore(cityText)
+        known = findCity(core)
+        city = core  # As the profile writes it, the gazetteer's name only places it
+        if known and (not country or country == known.country) and (not state or state == known.region):
+            state = state or known.region
+            country = country or known.country
+
+    return LocationParts(city, state, country, zipCode)
@@ -1,17 +1,27 @@
 
 import os
+import gzip
+import queue
+import atexit
 import shutil
 import logging.config
+import logging.handlers
 from datetime import datetime
 import yaml
 
 LOG_FILES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "logs"))
 initial_timestamp = datetime.now().strftime("%Y-%m-%d~%Hh-%Mm-%Ss")
 
+MAX_LOG_BYTES = 10 * 1024 * 1024  # A log file is rotated once it reaches this size...
+LOG_BACKUPS = 5                   # ...and this many compressed rotations are kept
+
+os.makedirs(LOG_FILES_DIR, exist_ok=True)
+
+
 def archive_logs():
     """
     Moves all log files into their own directory with a unique timestamp. The idea is that we're cleaning up any
-    lingering log files.
+    lingering log files. This can take a while when many logs have piled up, so run it in the background at startup.
     """
     if not os.path.exists(LOG_FILES_DIR):
         os.mkdir(LOG_FILES_DIR)
@@ -34,7 +44,65 @@ def archive_logs():
 
             shutil.move(curFile, newFile)
 
-archive_logs()
+
+def gzipRotation(source, dest):
+    """Compresses a rotated log file"""
+    with open(source, 'rb') as log, gzip.open(dest, 'wb') as compressed:
+        shutil.copyfileobj(log, compressed)
+    os.remove(source)
+
+
+def compressRotations(handler: logging.handlers.RotatingFileHandler) -> logging.handlers.RotatingFileHandler:
+    """Makes a rotating file handler gzip the files it rotates out (log.1.gz, log.2.gz, ...)"""
+    handler.namer = lambda name: name + ".gz"
+    handler.rotator = gzipRotation
+    return handler
+
+
+class LogListener(logging.handlers.QueueListener):
+    """
+    The logging thread. It takes (handler, record) pairs off the queue and has the handler handle the record, so one
+    thread does the writing (and rotating and compressing) for every queued handler.
+    """
+
+    def handle(self, item):
+        handler, record = item
+        if record.levelno >= handler.level:
+            handler.handle(record)
+
+
+log_queue = queue.Queue(-1)
+log_listener = LogListener(log_queue)
+
+
+class QueuedHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to another handler on the logging thread. Logging through it only formats the message and puts it on
+    a queue, so the thread that logs never waits on the disk.
+    """
+
+    def __init__(self, target: logging.Handler):
+        super().__init__(log_queue)
+        self.target = target
+        self.setLevel(target.level)
+
+    def enqueue(self, record):
+        self.queue.put_nowait((self.target, record))
+
+    def close(self):
+        self.target.close()
+        super().close()
+
+
+def queueFileHandlers(logger: logging.Logger):
+    """Moves the logger's file handlers to the logging thread, compressing their rotations."""
+    for handler in list(logger.handlers):
+        if isinstance(handler, logging.FileHandler):
+            if isinstance(handler, logging.handlers.RotatingFileHandler):
+                compressRotations(handler)
+            logger.removeHandler(handler)
+            logger.addHandler(QueuedHandler(handler))
+
 
 ########################################################################################################################
 # LOGGING CONFIGURATION:                                                                                               #
@@ -65,16 +133,22 @@ handlers:
     formatter: short
     stream: ext://sys.stdout
   linkedin_controller_file:
-    class: logging.FileHandler
+    class: logging.handlers.RotatingFileHandler
     level: DEBUG
     encoding: UTF-8
     formatter: precise
+    maxBytes: {MAX_LOG_BYTES}
+    backupCount: {LOG_BACKUPS}
+    delay: true
     filename: {os.path.join(LOG_FILES_DIR, f"{initial_timestamp}--Linkedin_Controllers.log")}
   main_file:
-    class: logging.FileHandler
+    class: logging.handlers.RotatingFileHandler
     level: DEBUG
     encoding: UTF-8
     formatter: precise
+    maxBytes: {MAX_LOG_BYTES}
+    backupCount: {LOG_BACKUPS}
+    delay: true
     filename: {os.path.join(LOG_FILES_DIR, f"{initial_timestamp}--main.log")}
 
 loggers:
@@ -102,6 +176,13 @@ root:
 
 logging.config.dictConfig(yaml.safe_load(logging_config_YAML))
 
+# The files configured above are written on the logging thread, which is stopped (flushing whatever is still queued)
+# before the logging module shuts down
+queueFileHandlers(logging.getLogger())
+queueFileHandlers(logging.getLogger("controller.linkedin"))
+log_listener.start()
+atexit.register(log_listener.stop)
+
 ########################################################################################################################
 # LOGGERS:                                                                                                             #
 #   A variety of loggers can be used to separate logging information in logical ways. As new loggers are added, they   #
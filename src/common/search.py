@@ -0,0 +1,86 @@
+from array import array
+from collections import OrderedDict
+
+
+def normalizeSearch(text: str) -> str:
+    """Normalizes text for searching (case is ignored)"""
+    return text.casefold() if text else ""
+
+
+def connectionDocument(name: str, position: str, location: str) -> str:
+    """
+    Gets the text a connection is searched by: its name, position and location. The fields are separated by newlines
+    so a search can't match across two of them.
+    """
+    return f"{name or ''}\n{position or ''}\n{location or ''}"
+
+
+class TrigramIndex:
+    """
+    Finds the documents containing a string, fast enough to search again on every keystroke.
+
+    Each document is indexed by the trigrams (three character substrings) it contains. A search for three characters or
+    more only looks at the documents that have the search's rarest trigram, and confirms each one with a substring test,
+    so it costs about as much as the number of documents that could possibly match. Searches that extend the previous
+    one (typing another character) only look at the previous results, and recent results are kept so erasing characters
+    is free. Shorter searches scan every document.
+
+    Results are positions into the documents, in the order the documents were given.
+
+    >>> index = TrigramIndex(["Ada Lovelace", "Alan Turing", "Grace Hopper"])
+    >>> list(index.search("ace"))
+    [0, 2]
+    """
+
+    CACHE_SIZE = 32
+
+    def __init__(self, documents):
+        self.documents = [normalizeSearch(document) for document in documents]
+        self.postings = {}
+        self.cache = OrderedDict()
+        self.lastQuery = ""
+        self.lastResults = range(len(self.documents))
+
+        for position, document in enumerate(self.documents):
+            for trigram in {document[i:i + 3] for i in range(len(document) - 2)}:
+                posting = self.postings.get(trigram)
+                if posting is None:
+                    posting = self.postings[trigram] = array('i')
+                posting.append(position)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def search(self, text: str):
+        """
+        Finds the documents containing the text (ignoring case).
+
+        :return: The positions of the matching documents, in ascending order. Every document matches an empty search.
+        """
+        query = normalizeSearch(text)
+
+        if query in self.cache:
+            self.cache.move_to_end(query)
+            results = self.cache[query]
+        elif not query:
+            results = range(len(self.documents))
+        else:
+            results = [position for position in self.candidates(query) if query in self.documents[position]]
+            self.cache[query] = results
+            while len(self.cache) > self.CACHE_SIZE:
+                self.cache.popitem(last=False)
+
+        self.lastQuery = query
+        self.lastResults = results
+        return results
+
+    def candidates(self, query: str):
+        """Gets the positions of the documents that might contain the (normalized) query, in ascending order."""
+        if self.lastQuery and self.lastQuery in query:
+            return self.lastResults
+
+        if len(query) < 3:
+            return range(len(self.documents))
+
+        empty = array('i')
+        return min((self.postings.get(query[i:i + 3], empty) for i in range(len(query) - 2)), key=len)
@@ -0,0 +1,57 @@
+import numpy as np
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def haversineMiles(lat1, lon1, lat2, lon2):
+    """
+    The great circle distance in miles between points given in degrees. Any of the arguments may be NumPy arrays, in
+    which case the distances are computed element-wise.
+    """
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class SpatialIndex:
+    """
+    Answers "which locations are within this many miles of a point" for a fixed set of locations.
+
+    The locations are sorted by latitude, so a radius query first slices out the band of latitudes the circle can reach
+    with a binary search and then computes haversine distances for that band only, all in NumPy. Each location carries
+    a count (the number of connections there), so the number of connections in a radius is a single sum.
+
+    >>> index = SpatialIndex(["Denver, Colorado"], [39.74], [-104.99], [12])
+    >>> index.within(40.0, -105.0, 50)
+    (['Denver, Colorado'], 12)
+    """
+
+    def __init__(self, names, latitudes, longitudes, counts=None):
+        latitudes = np.asarray(latitudes, dtype=float)
+        order = np.argsort(latitudes, kind="stable")
+
+        self.names = np.asarray(names, dtype=object)[order]
+        self.latitudes = latitudes[order]
+        self.longitudes = np.asarray(longitudes, dtype=float)[order]
+        self.counts = (np.ones(len(order), dtype=int) if counts is None else np.asarray(counts, dtype=int))[order]
+
+    def __len__(self):
+        return len(self.names)
+
+    def query(self, latitude: float, longitude: float, miles: float) -> np.ndarray:
+        """Gets the positions (into names, latitudes, longitudes, and counts) of the locations within the radius."""
+        band = np.degrees(miles / EARTH_RADIUS_MILES)
+        start = np.searchsorted(self.latitudes, latitude - band, side="left")
+        stop = np.searchsorted(self.latitudes, latitude + band, side="right")
+
+        distances = haversineMiles(latitude, longitude, self.latitudes[start:stop], self.longitudes[start:stop])
+        return start + np.flatnonzero(distances <= miles)
+
+    def within(self, latitude: float, longitude: float, miles: float):
+        """
+        Finds the locations within the radius.
+
+        :return: The names of the locations and the total of their counts
+        """
+        found = self.query(latitude, longitude, miles)
+        return self.names[found].tolist(), int(self.counts[found].sum())
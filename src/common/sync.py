@@ -0,0 +1,110 @@
+import time
+import threading
+
+
+class Backoff:
+    """
+    Delays that start short and grow by `factor` up to `maximum`, for polling something that can't notify us.
+
+    >>> backoff = Backoff(initial=0.05, maximum=1)
+    >>> backoff.sleep()  # 0.05 s, then 0.075 s, ... never more than 1 s
+    """
+
+    def __init__(self, initial: float = 0.05, maximum: float = 1.0, factor: float = 1.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.delay = initial
+
+    def next(self) -> float:
+        """Gets the next delay (in seconds)"""
+        delay = self.delay
+        self.delay = min(self.delay * self.factor, self.maximum)
+        return delay
+
+    def reset(self):
+        self.delay = self.initial
+
+    def sleep(self, event: threading.Event = None):
+        """Sleeps for the next delay. If an event is given, it wakes up as soon as the event is set."""
+        if event is None:
+            time.sleep(self.next())
+        else:
+            event.wait(self.next())
+
+
+def waitUntil(condition, timeout: float = None, backoff: Backoff = None, event: threading.Event = None) -> bool:
+    """
+    Waits for a condition that can only be checked by polling (the state of a web page, for example) without spinning.
+
+    The condition is checked right away and then after each delay of the backoff, so a condition that's met quickly is
+    noticed quickly while a long wait only checks it every so often. If something can signal the change (a worker
+    thread, for example), pass its event: setting it wakes the wait up to check the condition immediately.
+
+    :param condition: A function returning a truthy value once the wait is over
+    :param timeout: The most seconds to wait (None to wait forever)
+    :param backoff: The delays between checks (see Backoff)
+    :param event: Set to check the condition before the current delay is over
+    :return: True if the condition was met, False if the wait timed out
+    """
+    backoff = backoff or Backoff()
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    while not condition():
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            delay = min(backoff.next(), remaining)
+        else:
+            delay = backoff.next()
+
+        if event is None:
+            time.sleep(delay)
+        else:
+            event.wait(delay)
+
+    return True
+
+
+class CriticalSections:
+    """
+    Tracks the functions that must finish before the app is allowed to quit, on any number of threads.
+
+    Use it as a context manager around each critical function. waitUntilFinished blocks on a condition variable until
+    none are running, so whoever is waiting to quit doesn't use any CPU in the meantime.
+
+    >>> critical = CriticalSections()
+    >>> with critical:
+    >>>     saveEverything()
+    >>> critical.waitUntilFinished()  # elsewhere
+    """
+
+    def __init__(self):
+        self._running = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            self._running += 1
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        with self._condition:
+            self._running -= 1
+            if not self._running:
+                self._condition.notify_all()
+
+    @property
+    def running(self) -> int:
+        """The number of critical functions currently running"""
+        return self._running
+
+    def waitUntilFinished(self, timeout: float = None) -> bool:
+        """
+        Blocks until no critical function is running.
+
+        :return: False if the timeout ran out first
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._running, timeout)
@@ -0,0 +1,186 @@
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+INVALID_PLACEHOLDER = "INVALID-PLACEHOLDER"
+
+
+def placeholderValues(connection) -> dict:
+    """
+    Gets the value of every placeholder for a connection. The connection's name is only split once no matter how many
+    name placeholders are used. Placeholders that can't be filled for the connection are INVALID_PLACEHOLDER.
+    """
+    name = connection.name.strip() if connection.name else ""
+    nameParts = name.split()
+    location = connection.location
+    city, state, country, zipCode = connection.locationParts()
+
+    return {
+        "{FIRST_NAME}": nameParts[0] if nameParts else INVALID_PLACEHOLDER,
+        "{LAST_NAME}":  nameParts[-1] if nameParts else INVALID_PLACEHOLDER,
+        "{FULL_NAME}":  name if name else INVALID_PLACEHOLDER,
+        "{LOCATION}":   location if location else INVALID_PLACEHOLDER,
+        "{CITY}":       city if city else INVALID_PLACEHOLDER,
+        "{STATE}":      state if state else INVALID_PLACEHOLDER,
+        "{COUNTRY}":    country if country else INVALID_PLACEHOLDER,
+        "{ZIP_CODE}":   zipCode if zipCode else INVALID_PLACEHOLDER,
+    }
+
+
+PLACEHOLDERS = ("{FIRST_NAME}", "{LAST_NAME}", "{FULL_NAME}", "{LOCATION}",
+                "{CITY}", "{STATE}", "{COUNTRY}", "{ZIP_CODE}")
+
+# The connection attributes the placeholder values are computed from. A connection's render version is the values of
+# these attributes, so a cached render is reused until one of them changes.
+PLACEHOLDER_FIELDS = ("name", "location", "city", "state", "country", "zip_code")
+
+PLACEHOLDER_PATTERN = re.compile("(" + "|".join(re.escape(placeholder) for placeholder in PLACEHOLDERS) + ")")
+
+
+def connectionVersion(connection) -> tuple:
+    """Identifies the version of a connection's info that its rendered messages depend on."""
+    return (connection.id,) + tuple(getattr(connection, field) for field in PLACEHOLDER_FIELDS)
+
+
+class RenderResult(namedtuple("RenderResult", ["text", "invalidPlaceholders"])):
+    """A rendered message and the placeholders that couldn't be filled in it"""
+
+    @property
+    def isValid(self) -> bool:
+        return not self.invalidPlaceholders
+
+
+def decodeTemplate(source) -> str:
+    """Decodes a message template the way it's stored in the database (with its escape sequences) into plain text."""
+    if isinstance(source, str):
+        source = source.encode('latin1')
+    return source.decode('unicode_escape')
+
+
+class CompiledTemplate:
+    """
+    A message template parsed into its literal text and placeholders.
+
+    Parsing happens once. Rendering looks up each placeholder's value and joins the pieces together in a single pass, so
+    rendering the same template for many connections costs one join per connection instead of a replace per placeholder.
+    """
+
+    def __init__(self, source):
+        self.source = source
+
+        # re.split with a capturing group alternates literal text and placeholders, starting and ending with literals.
+        segments = PLACEHOLDER_PATTERN.split(decodeTemplate(source))
+        self.literals = segments[0::2]
+        self.placeholders = segments[1::2]
+
+    def renderResult(self, connection) -> RenderResult:
+        """Fills the placeholders with the connection's info, noting any placeholders that couldn't be filled."""
+        if not self.placeholders:
+            return RenderResult(self.literals[0], ())
+
+        values = placeholderValues(connection)
+        pieces = [self.literals[0]]
+        invalid = []
+        for placeholder, literal in zip(self.placeholders, self.literals[1:]):
+            value = values[placeholder]
+            if value == INVALID_PLACEHOLDER and placeholder not in invalid:
+                invalid.append(placeholder)
+            pieces.append(value)
+            pieces.append(literal)
+        return RenderResult("".join(pieces), tuple(invalid))
+
+    def render(self, connection) -> str:
+        """Fills the placeholders with the connection's info and returns the message"""
+        return self.renderResult(connection).text
+
+    def renderMany(self, connections) -> list:
+        """Renders the template for each connection, in order"""
+        return [self.render(connection) for connection in connections]
+
+    def isValid(self, connection) -> bool:
+        """Determines if the template can be filled properly for the connection"""
+        return self.renderResult(connection).isValid
+
+
+class TemplateCache:
+    """
+    The compiled version of each message template, by template id.
+
+    A template is recompiled whenever the text it was compiled from no longer matches the template's text, so edited
+    templates are never rendered from a stale compilation. Saving a template should still call invalidate() so the old
+    compilation isn't kept around.
+    """
+
+    _compiled = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get(template_id: int, source) -> CompiledTemplate:
+        """Gets the compiled template, compiling it if it hasn't been compiled or its text has changed."""
+        with TemplateCache._lock:
+            compiled = TemplateCache._compiled.get(template_id)
+            if compiled is None or compiled.source != source:
+                compiled = CompiledTemplate(source)
+                if template_id is not None:
+                    TemplateCache._compiled[template_id] = compiled
+        return compiled
+
+    @staticmethod
+    def invalidate(template_id: int):
+        """Drops the compiled version of a template."""
+        with TemplateCache._lock:
+            TemplateCache._compiled.pop(template_id, None)
+
+
+class RenderCache:
+    """
+    The most recently rendered messages, keyed by the template's text and the connection's render version.
+
+    Previewing, validating, and sending a message to the same recipient all need the same rendered text, so the first of
+    them renders it and the others reuse the result. Editing the template or the connection's info changes the key, so
+    a stale render is never returned. The cache holds at most maxSize results and evicts the least recently used.
+    maxSize is MAX_SIZE unless a bigger selection reserved room for itself (see reserve), so a preview of more than
+    MAX_SIZE connections isn't evicted before it's sent.
+    """
+
+    MAX_SIZE = 10000
+
+    maxSize = MAX_SIZE
+
+    _results = OrderedDict()
+    _lock = threading.Lock()
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def get(template_id: int, compiled: CompiledTemplate, connection) -> RenderResult:
+        """Gets the render of a compiled template for a connection, rendering it if it isn't cached."""
+        key = (template_id, compiled.source, connectionVersion(connection))
+        with RenderCache._lock:
+            result = RenderCache._results.get(key)
+            if result is not None:
+                RenderCache._results.move_to_end(key)
+                RenderCache.hits += 1
+                return result
+
+        result = compiled.renderResult(connection)
+        with RenderCache._lock:
+            RenderCache.misses += 1
+            RenderCache._results[key] = result
+            while len(RenderCache._results) > RenderCache.maxSize:
+                RenderCache._results.popitem(last=False)
+        return result
+
+    @staticmethod
+    def reserve(count: int):
+        """Sizes the cache to hold the renders of a selection of count connections (but never below MAX_SIZE)."""
+        with RenderCache._lock:
+            RenderCache.maxSize = max(RenderCache.MAX_SIZE, count)
+            while len(RenderCache._results) > RenderCache.maxSize:
+                RenderCache._results.popitem(last=False)
+
+    @staticmethod
+    def clear():
+        """Drops every cached render."""
+        with RenderCache._lock:
+            RenderCache._results.clear()
@@ -1,9 +1,24 @@
 from PySide2.QtCore import QRunnable, Signal
+from sqlalchemy.orm import Query
+
 from common.beacon import Beacon
+from database.general import sessionScope
+
+
+def materialize(result):
+    """Runs a query so its rows are loaded on the current thread instead of wherever the result is iterated."""
+    if isinstance(result, Query):
+        return result.all()
+    return result
 
 
 class Task(QRunnable):
-    """Run a function in the QThreadPool and emit the value returned in the finished signal."""
+    """
+    Run a function in the QThreadPool and emit the value returned in the finished signal.
+
+    The function runs in its own database unit of work (see database.general.sessionScope). If it returns a query, the
+    query is executed on the worker thread and the list of results is emitted instead.
+    """
 
     Beacon.finished = Signal(object)
 
@@ -15,5 +30,72 @@ class Task(QRunnable):
         self.kwargs = kwargs
 
     def run(self):
-        result = self.func(*self.args, **self.kwargs)
+        with sessionScope():
+            result = materialize(self.func(*self.args, **self.kwargs))
         self.finished.emit(result)
+
+
+class QueryStream(QRunnable):
+    """
+    Run a query in the QThreadPool and emit its rows in chunks, so the GUI can show them as they arrive.
+
+    The query is built and executed on the worker thread, in its own database unit of work, and each row is converted
+    with the given function before it's emitted, so only plain values (tuples, dataclasses...) reach the GUI thread and
+    nothing there touches the database. Signals:
+        chunkReady(rows): a list of at most chunkSize converted rows
+        progress(done, total): the number of rows emitted so far and the number of rows the query returns
+        finished(total): emitted once every row has been emitted, the stream was cancelled, or the query failed (so
+                         whoever waits for it never waits forever)
+    """
+
+    Beacon.chunkReady = Signal(object)
+    Beacon.progress = Signal(int, int)
+
+    CHUNK_SIZE = 200
+
+    def __init__(self, queryFunc, convert=tuple, chunkSize: int = CHUNK_SIZE):
+        """
+        :param queryFunc: Builds the query to run. It's called on the worker thread. It can also return a list of
+                          queries, which are streamed one after the other (for IN lists too long for one statement).
+        :param convert: Converts each row the query returns to what's emitted
+        :param chunkSize: The most rows emitted at once
+        """
+        super().__init__()
+        self.__b = Beacon(self)
+        self.queryFunc = queryFunc
+        self.convert = convert
+        self.chunkSize = chunkSize
+        self.cancelled = False
+
+    def cancel(self):
+        """Stops emitting rows after the current chunk."""
+        self.cancelled = True
+
+    def run(self):
+        done = 0
+        try:
+            with sessionScope():
+                queries = self.queryFunc()
+                if isinstance(queries, Query):
+                    queries = [queries]
+                total = sum(query.order_by(None).count() for query in queries)
+                self.progress.emit(0, total)
+
+                chunk = []
+                for query in queries:
+                    for row in query.yield_per(self.chunkSize):
+                        if self.cancelled:
+                            break
+                        chunk.append(self.convert(row))
+                        if len(chunk) == self.chunkSize:
+                            done += len(chunk)
+                            self.chunkReady.emit(chunk)
+                            self.progress.emit(done, total)
+                            chunk = []
+
+                if chunk and not self.cancelled:
+                    done += len(chunk)
+                    self.chunkReady.emit(chunk)
+                    self.progress.emit(done, total)
+        finally:
+            self.finished.emit(done)
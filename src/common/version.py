@@ -1,15 +1,16 @@
 import os
-from ftplib import FTP
+import time
+import hashlib
+import threading
+from collections import namedtuple
 from subprocess import Popen, PIPE
 from semantic_version import Version
 from pygit2 import Repository, Signature, GIT_SORT_TIME
 
 import database.general
-from database.credentials import file_host, file_port, file_password, file_username
+from common.filehost import FileHostSession, connectToFileHost
 from gui.updateversiondialog import UpdateVersionDialog
 
-updateInProgress = False
-
 versionFile = os.path.abspath('version.txt')
 changeLogFile = os.path.abspath('changelog.txt')
 
@@ -60,12 +61,17 @@ def getActiveVersion():
     """Get the active version from the database"""
     return database.general.Session.query(database.general.Version).filter(database.general.Version.active == True).one_or_none()
 
-def updateAvailable():
-    """If an update is available, return True, else False"""
-    with open('version.txt') as vf:
-        version = vf.read().strip()
+def installerPath(v: Version):
+    """Where the release tool builds the installer for a version"""
+    return f'../dist/social_installer_v{str(v)}.exe'
 
-    return getActiveVersion().semantic_id != version
+def fileChecksum(path, chunkSize=1024 * 1024):
+    """The SHA-256 of a file (hex)"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunkSize), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
 
 def uploadInstaller(v: Version):
     """
@@ -74,45 +80,154 @@ def uploadInstaller(v: Version):
     .. note::
         ONLY RUN FROM THE RELEASE TOOL!!
     """
-    ftp = FTP()
-    ftp.connect(host=file_host, port=file_port)
-    ftp.login(user=file_username, passwd=file_password)
+    ftp = connectToFileHost()
 
-    localFile = f'../dist/social_installer_v{str(v)}.exe'
+    localFile = installerPath(v)
     remoteFile = f'installers/social_v{str(v)}.exe'
     with open(localFile, 'rb') as f:
         ftp.storbinary(f'STOR {remoteFile}', f)
     ftp.quit()
 
 
-updateLock = False
-def downloadInstaller():
-    """Download the active installation file if we need to update"""
+ActiveVersion = namedtuple("ActiveVersion", ["semantic_id", "change_log", "checksum"])
+
 
-    if not updateAvailable():
-        return False
+class UpdateChecker:
+    """
+    Checks whether a newer version of Social is active and downloads its installer.
 
-    global uploadInProgress
-    updateInProgress = True
+    The active version is looked up in the database at most once every TTL seconds. The installer is downloaded to a
+    .part file over a FileHostSession that's reused between downloads. An interrupted download picks up where it left
+    off (with REST) instead of starting over. A finished download is checked against the version's checksum (or, for
+    releases without one, against the size on the server) before it's renamed to the installer. An installer that's
+    already on disk and checks out isn't downloaded again.
 
-    activeVersion = getActiveVersion()
+    The running version is read from the version file once, when the checker is created (it can't change while Social
+    is running).
+    """
 
-    ftp = FTP()
-    ftp.connect(host=file_host, port=file_port)
-    ftp.login(user=file_username, passwd=file_password)
+    TTL = 10 * 60  # seconds
+
+    def __init__(self, session: FileHostSession = None, ttl: float = TTL, directory: str = '.',
+                 currentVersion: Version = None):
+        """
+        :param session: The session with the file host that installers are downloaded over
+        :param currentVersion: The running version (read from the version file if it isn't given)
+        """
+        self.session = session or FileHostSession()
+        self.ttl = ttl
+        self.directory = directory
+        self.currentVersion = str(currentVersion or getCurrentVersion())
+        self.downloading = False
+        self._active = None
+        self._expires = 0
+        self._versionLock = threading.Lock()
+        self._downloadLock = threading.Lock()
+
+    def activeVersion(self) -> ActiveVersion:
+        """The active version (cached for TTL seconds), or None if there isn't one"""
+        with self._versionLock:
+            if time.monotonic() >= self._expires:
+                version = getActiveVersion()
+                self._active = None
+                if version:
+                    self._active = ActiveVersion(version.semantic_id, version.change_log, version.checksum)
+                self._expires = time.monotonic() + self.ttl
+            return self._active
+
+    def updateAvailable(self) -> bool:
+        """If an update is available, return True, else False"""
+        active = self.activeVersion()
+        return active is not None and active.semantic_id != self.currentVersion
+
+    def installerFile(self, version: ActiveVersion) -> str:
+        return os.path.join(self.directory, f'social_v{version.semantic_id}.exe')
+
+    def downloadInstaller(self) -> bool:
+        """
+        Download the active installation file if we need to update. Returns False right away if another download is
+        already running.
+
+        :return: True if the installer of the active version is on disk and verified
+        """
+        if not self.updateAvailable():
+            return False
+
+        if not self._downloadLock.acquire(blocking=False):
+            return False
+
+        try:
+            self.downloading = True
+            version = self.activeVersion()
+            installerFile = self.installerFile(version)
+            remoteFile = f'installers/social_v{version.semantic_id}.exe'
+
+            if os.path.exists(installerFile) and self.verify(installerFile, version, remoteFile):
+                return True
+
+            partFile = installerFile + '.part'
+            self.session.run(lambda ftp: self.resume(ftp, remoteFile, partFile))
+
+            if not self.verify(partFile, version, remoteFile):
+                os.remove(partFile)  # Corrupt, start over next time
+                return False
+
+            os.replace(partFile, installerFile)
+            return True
+        finally:
+            self.downloading = False
+            self._downloadLock.release()
+
+    @staticmethod
+    def resume(ftp, remoteFile: str, partFile: str):
+        """Downloads the rest of the file, starting from however much of it is already in partFile."""
+        ftp.voidcmd('TYPE I')
+        size = ftp.size(remoteFile)
+        offset = os.path.getsize(partFile) if os.path.exists(partFile) else 0
+        if offset > size:
+            offset = 0  # Left over from a different file, start over
+
+        if offset == size:
+            return
+
+        with open(partFile, 'ab' if offset else 'wb') as fp:
+            ftp.retrbinary(f'RETR {remoteFile}', callback=fp.write, rest=offset or None)
+
+    def verify(self, path: str, version: ActiveVersion, remoteFile: str) -> bool:
+        """Checks an installer against the version's checksum, or against its size on the server if there isn't one."""
+        if version.checksum:
+            return fileChecksum(path) == version.checksum
+        return os.path.getsize(path) == self.session.run(lambda ftp: ftp.size(remoteFile))
+
+
+_updateChecker = None
+_updateCheckerLock = threading.Lock()
+
+def getUpdateChecker() -> UpdateChecker:
+    """
+    Get the application's UpdateChecker. It's created the first time it's needed, so importing this module (from the
+    release tool, for instance) doesn't read the version file.
+    """
+    global _updateChecker
+    with _updateCheckerLock:
+        if _updateChecker is None:
+            _updateChecker = UpdateChecker()
+        return _updateChecker
 
-    # download new installer from server
-    installerFile = f'social_v{activeVersion.semantic_id}.exe'
-    with open(installerFile, 'wb') as fp:
-        ftp.retrbinary(f'RETR installers/social_v{activeVersion.semantic_id}.exe', callback=fp.write)
+def updateAvailable():
+    """If an update is available, return True, else False"""
+    return getUpdateChecker().updateAvailable()
 
-    return True
+def downloadInstaller():
+    """Download the active installation file if we need to update"""
+    return getUpdateChecker().downloadInstaller()
 
 def triggerUpdate(trigger):
     """Display the update dialog and then start the installer and close the program."""
     if trigger:
-        activeVersion = getActiveVersion()
-        installerFile = f'social_v{activeVersion.semantic_id}.exe'
+        updateChecker = getUpdateChecker()
+        activeVersion = updateChecker.activeVersion()
+        installerFile = updateChecker.installerFile(activeVersion)
         UpdateVersionDialog(activeVersion).exec_()
 
         CREATE_NEW_PROCESS_GROUP = 0x00000200
@@ -1,4 +1,5 @@
 from random import random
+import threading
 import time
 
 import selenium
@@ -26,4 +27,25 @@ def send_keys_at_irregular_speed(element, text, min_initial_wait, max_initial_wa
             else:
                 raise
 
+class RateLimiter:
+    """
+    Spaces out calls made from any number of threads so that at most `rate` of them start each second.
+
+    >>> limiter = RateLimiter(5)
+    >>> limiter.acquire()  # blocks until the next call is allowed
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
 necessary_wait = TODO_get_rid_of_this_wait = wait
@@ -0,0 +1,205 @@
+from datetime import datetime
+
+from sqlalchemy import and_, or_, func, String
+
+from database.general import Session
+from database.linkedin import LinkedInConnection, LinkedInMessage
+
+
+class ConnectionFilter:
+    """
+    Selects an account's connections that match a set of criteria using a single SQL statement.
+
+    Criteria are added with the by* methods (each returns the filter so they can be chained) and are combined with AND.
+    Location criteria become an IN clause, and message count criteria become a LEFT JOIN on the account's messages with
+    a GROUP BY/HAVING on the count, so no criterion is evaluated in Python.
+
+    >>> connectionFilter = ConnectionFilter(account.id).byLocations(["Berlin, Germany"]).byMessageCount(fewerThan=2)
+    >>> for page in connectionFilter.pages(LinkedInConnection.name):
+    >>>     ...
+    """
+
+    DEFAULT_PAGE_SIZE = 1000
+
+    def __init__(self, account_id: int):
+        self.account_id = account_id
+
+        self._locations = None
+        self._positions = None
+        self._nameContains = None
+        self._addedAfter = None
+        self._addedBefore = None
+        self._minMessages = None
+        self._fewerThanMessages = None
+
+    def byLocations(self, locations) -> 'ConnectionFilter':
+        """Only keep connections whose location is exactly one of the given locations."""
+        self._locations = list(locations)
+        return self
+
+    def byName(self, contains: str) -> 'ConnectionFilter':
+        """Only keep connections whose name contains the given string (ignored if it's empty)."""
+        self._nameContains = contains or None
+        return self
+
+    def byPositions(self, positions) -> 'ConnectionFilter':
+        """Only keep connections whose position contains any of the given strings."""
+        self._positions = list(positions)
+        return self
+
+    def byDateAdded(self, after: datetime = None, before: datetime = None) -> 'ConnectionFilter':
+        """Only keep connections added on or after `after` and before `before` (either bound may be omitted)."""
+        self._addedAfter = after
+        self._addedBefore = before
+        return self
+
+    def byMessageCount(self, atLeast: int = None, fewerThan: int = None) -> 'ConnectionFilter':
+        """Only keep connections that received at least `atLeast` and fewer than `fewerThan` messages from the account."""
+        self._minMessages = atLeast
+        self._fewerThanMessages = fewerThan
+        return self
+
+    def query(self, *columns):
+        """
+        Builds the query selecting the given columns (the connection ids by default) of every matching connection.
+
+        :param columns: The LinkedInConnection columns to select
+        :return: An unevaluated query
+        """
+        if not columns:
+            columns = (LinkedInConnection.id,)
+
+        query = Session.query(*columns).filter(LinkedInConnection.account_id == self.account_id)
+
+        if self._locations is not None:
+            query = query.filter(LinkedInConnection.location.in_(self._locations))
+
+        if self._nameContains is not None:
+            query = query.filter(LinkedInConnection.name.contains(self._nameContains, autoescape=True))
+
+        if self._positions is not None:
+            query = query.filter(or_(*[LinkedInConnection.position.contains(position) for position in self._positions]))
+
+        if self._addedAfter is not None:
+            query = query.filter(LinkedInConnection.date_added >= self._addedAfter)
+
+        if self._addedBefore is not None:
+            query = query.filter(LinkedInConnection.date_added < self._addedBefore)
+
+        if self._minMessages is not None or self._fewerThanMessages is not None:
+            messageCount = func.count(LinkedInMessage.id)
+            query = query.outerjoin(LinkedInMessage, and_(
+                LinkedInMessage.recipient_connection_id == LinkedInConnection.id,
+                LinkedInMessage.account_id == self.account_id
+            )).group_by(LinkedInConnection.id)
+
+            if self._minMessages is not None:
+                query = query.having(messageCount >= self._minMessages)
+
+            if self._fewerThanMessages is not None:
+                query = query.having(messageCount < self._fewerThanMessages)
+
+        return query
+
+    def pages(self, *columns, pageSize: int = DEFAULT_PAGE_SIZE):
+        """
+        Yields the matching connections in pages of at most pageSize, ordered by id.
+
+        Pages are fetched with keyset pagination (id > last id seen) so that later pages are as cheap as the first.
+
+        :param columns: Additional LinkedInConnection columns to select
+        :return: Lists of ids if no columns are given, otherwise lists of (id, *columns) tuples
+        """
+        lastId = None
+        while True:
+            query = self.query(LinkedInConnection.id, *columns)
+            if lastId is not None:
+                query = query.filter(LinkedInConnection.id > lastId)
+
+            rows = query.order_by(LinkedInConnection.id).limit(pageSize).all()
+            if not rows:
+                return
+
+            lastId = rows[-1][0]
+            if columns:
+                yield [tuple(row) for row in rows]
+            else:
+                yield [row[0] for row in rows]
+
+            if len(rows) < pageSize:
+                return
+
+    def ids(self, pageSize: int = DEFAULT_PAGE_SIZE) -> list:
+        """Gets the ids of all matching connections."""
+        return [connection_id for page in self.pages(pageSize=pageSize) for connection_id in page]
+
+    def count(self) -> int:
+        """Counts the matching connections."""
+        return self.query().order_by(None).count()
+
+
+class SortedPager:
+    """
+    Fetches the connections matching a filter one page at a time, sorted by one of their columns.
+
+    Pages are fetched with keyset pagination on (sort column, id), so fetching the hundredth page costs the same as
+    fetching the first. This is what lets views show huge accounts while only loading the rows that are scrolled to.
+    """
+
+    def __init__(self, connectionFilter: ConnectionFilter, columns, orderBy=LinkedInConnection.name,
+                 descending: bool = False):
+        """
+        :param columns: The LinkedInConnection columns to fetch for each connection (after its id)
+        :param orderBy: The column to sort by. It doesn't have to be one of the fetched columns.
+        """
+        self.connectionFilter = connectionFilter
+        self.columns = list(columns)
+        self.descending = descending
+        self.exhausted = False
+        self._last = None
+
+        # NULL strings are sorted as empty strings, so they can be compared (names are never NULL and keep their index).
+        # Other columns (dates...) are compared as they are, NULLs first (see keysetFilter).
+        nullableString = isinstance(orderBy.type, String) and orderBy is not LinkedInConnection.name
+        self.sortKey = func.coalesce(orderBy, "") if nullableString else orderBy
+
+    def next(self, pageSize: int) -> list:
+        """
+        Fetches the next page.
+
+        :return: (id, *columns) tuples. Fewer than pageSize of them means this was the last page.
+        """
+        if self.exhausted:
+            return []
+
+        query = self.connectionFilter.query(self.sortKey, LinkedInConnection.id, *self.columns)
+        if self._last is not None:
+            query = query.filter(self.keysetFilter(*self._last))
+
+        if self.descending:
+            query = query.order_by(self.sortKey.desc(), LinkedInConnection.id.desc())
+        else:
+            query = query.order_by(self.sortKey, LinkedInConnection.id)
+
+        rows = query.limit(pageSize).all()
+        if len(rows) < pageSize:
+            self.exhausted = True
+        if rows:
+            self._last = (rows[-1][0], rows[-1][1])
+
+        return [tuple(row[1:]) for row in rows]
+
+    def keysetFilter(self, lastKey, lastId):
+        """
+        Selects the rows that come after (lastKey, lastId). NULLs sort before every value (as they do in MySQL and
+        SQLite), so they're the first rows in ascending order and the last ones in descending order.
+        """
+        key, connectionId = self.sortKey, LinkedInConnection.id
+        if self.descending:
+            if lastKey is None:
+                return and_(key.is_(None), connectionId < lastId)
+            return or_(key < lastKey, and_(key == lastKey, connectionId < lastId), key.is_(None))
+
+        if lastKey is None:
+            return or_(and_(key.is_(None), connectionId > lastId), key.isnot(None))
+        return or_(key > lastKey, and_(key == lastKey, connectionId > lastId))
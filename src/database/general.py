@@ -1,18 +1,295 @@
+import os
 import enum
-from datetime import datetime
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from sqlalchemy import Column, String, Boolean, Integer, ForeignKey, DateTime, Enum
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, scoped_session
-from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool, QueuedPool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy import create_engine, event
 
-from database.credentials import username, password, host, port
+########################################################################################################################
+# DATABASE CONFIGURATION:                                                                                              #
+#   By default, we connect to the production MySQL server using the credentials in database/credentials.py. Set the    #
+#   SOCIAL_DATABASE_URL environment variable (or database_url in the credentials module) to use another database.      #
+#   The URL may contain a {database} field, which is filled with the name of the database being opened. For example:   #
+#                                                                                                                      #
+#   SOCIAL_DATABASE_URL=sqlite:///C:/social/{database}.db                                                              #
+#                                                                                                                      #
+#   runs everything against local SQLite files, which is handy for profiling or for a single-operator install.         #
+#   The pool settings below can be overridden with SOCIAL_DATABASE_POOL_SIZE, SOCIAL_DATABASE_MAX_OVERFLOW,            #
+#   SOCIAL_DATABASE_POOL_TIMEOUT, and SOCIAL_DATABASE_POOL_RECYCLE.                                                    #
+########################################################################################################################
 
-engine = create_engine(f'mysql+pymysql://{username}:{password}@{host}:{port}/social',
-                       pool_recycle=3600,
-                       pool_size=0,
-                       connect_args={'connect_timeout': 10})
+# At most pool_size + max_overflow connections are open at once. A thread that needs a connection when they're all
+# checked out waits up to pool_timeout seconds for one to be returned.
+DEFAULT_POOL_SETTINGS = {
+    "pool_size": 5,
+    "max_overflow": 5,
+    "pool_timeout": 30,
+    "pool_recycle": 3600,
+}
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # readers don't block the writer, so the worker threads can share a database file
+    "synchronous": "NORMAL",  # safe with WAL and much faster than FULL
+    "foreign_keys": "ON",
+    "temp_store": "MEMORY",
+    "cache_size": -64_000,  # in KiB
+    "busy_timeout": 30_000,  # in ms; wait for the writer instead of failing with "database is locked"
+}
+
+
+def getConfigValue(name: str, default=None):
+    """Gets a database setting from the environment, then from the credentials module."""
+    value = os.environ.get(f"SOCIAL_{name.upper()}")
+    if value is not None:
+        return value
+
+    try:
+        import database.credentials as credentials
+    except ImportError:
+        return default
+
+    return getattr(credentials, name.lower(), default)
+
+
+def getDatabaseURL(database: str = "social") -> str:
+    """Gets the URL of one of our databases"""
+    url = getConfigValue("database_url")
+    if url:
+        return url.format(database=database)
+
+    from database.credentials import username, password, host, port
+    return f'mysql+pymysql://{username}:{password}@{host}:{port}/{database}'
+
+
+def getPoolSettings() -> dict:
+    """Gets the connection pool settings"""
+    return {setting: int(getConfigValue(f"database_{setting}", default))
+            for setting, default in DEFAULT_POOL_SETTINGS.items()}
+
+
+def configureSQLiteConnection(dbapiConnection, connectionRecord):
+    """Applies our pragmas to every new SQLite connection"""
+    cursor = dbapiConnection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
+def createEngine(url: str):
+    """
+    Creates an engine for one of the supported backends.
+
+    SQLite connections are opened without a shared cache and with check_same_thread disabled. Each connection is only
+    ever used by the thread that checked it out of the pool, so this is safe for the QThreadPool threads, and WAL
+    journaling lets them read while another one writes.
+    """
+    if url.startswith("sqlite"):
+        connectArgs = {"check_same_thread": False, "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000}
+
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # Every connection to an in-memory database gets its own empty database, so all threads must share one.
+            newEngine = create_engine(url, connect_args=connectArgs, poolclass=StaticPool)
+        else:
+            newEngine = create_engine(url, connect_args=connectArgs, poolclass=MeteredQueuedPool, **getPoolSettings())
+
+        event.listen(newEngine, "connect", configureSQLiteConnection)
+        return newEngine
+
+    return create_engine(url, connect_args={'connect_timeout': 10}, poolclass=MeteredQueuedPool, **getPoolSettings())
+
+
+class PoolMetrics:
+    """Counts connection pool checkouts and how long threads had to wait for them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkedOut = 0
+            self.peakCheckedOut = 0
+            self.timeouts = 0
+            self.totalWait = 0.0
+            self.maxWait = 0.0
+
+    def recordCheckout(self, wait: float):
+        with self._lock:
+            self.checkouts += 1
+            self.checkedOut += 1
+            self.peakCheckedOut = max(self.peakCheckedOut, self.checkedOut)
+            self.totalWait += wait
+            self.maxWait = max(self.maxWait, wait)
+
+    def recordCheckin(self):
+        with self._lock:
+            self.checkedOut -= 1
+
+    def recordTimeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        """Gets the current metrics. Wait times are in seconds."""
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkedOut": self.checkedOut,
+                "peakCheckedOut": self.peakCheckedOut,
+                "timeouts": self.timeouts,
+                "totalWait": self.totalWait,
+                "averageWait": self.totalWait / self.checkouts if self.checkouts else 0.0,
+                "maxWait": self.maxWait,
+            }
+
+
+class MeteredQueuedPool(QueuedPool):
+    """A QueuedPool that records its checkouts and wait times in a PoolMetrics object"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        newPool = super().recreate()
+        newPool.metrics = self.metrics
+        return newPool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.recordTimeout()
+            raise
+        self.metrics.recordCheckout(time.perf_counter() - start)
+        return connection
+
+    def _do_return_conn(self, conn):
+        self.metrics.recordCheckin()
+        super()._do_return_conn(conn)
+
+
+engine = createEngine(getDatabaseURL("social"))
 Session = scoped_session(sessionmaker(bind=engine))
 
+
+def getPoolMetrics() -> dict:
+    """Gets the checkout metrics of the application's connection pool (empty if the pool isn't metered)"""
+    metrics = getattr(engine.pool, "metrics", None)
+    return metrics.snapshot() if metrics else {}
+
+
+_scope = threading.local()
+
+
+@contextmanager
+def sessionScope():
+    """
+    A unit of work on the calling thread's Session.
+
+    Every task that runs in the QThreadPool should do its database work inside one of these. When the outermost scope
+    on a thread exits, pending changes are committed (or rolled back if an exception was raised) and the thread's
+    Session is removed, which returns its connection to the pool and empties its identity map. Commits inside the scope
+    don't expire what was loaded, so objects loaded inside the scope stay usable afterwards (on any thread) as long as
+    only their loaded attributes and relationships are accessed.
+
+    Scopes can be nested; only the outermost one commits and removes the Session.
+    """
+    depth = getattr(_scope, "depth", 0)
+    _scope.depth = depth + 1
+    if depth == 0:
+        Session().expire_on_commit = False
+    try:
+        yield Session
+        if depth == 0 and (Session.new or Session.dirty or Session.deleted):
+            Session.commit()
+    except:
+        if depth == 0:
+            Session.rollback()
+        raise
+    finally:
+        _scope.depth = depth
+        if depth == 0:
+            Session.remove()
+
+
+def releaseConnection():
+    """
+    Ends the calling thread's transaction (committing its changes) so its connection goes back to the pool until the
+    next query. Long-running tasks like the controllers call this before slow work that doesn't need the database
+    (driving the browser, waiting), so they only hold one of the pool's connections while they're using it.
+    """
+    Session.commit()
+
+
+class BulkUpdateBuffer:
+    """
+    Collects changes to rows of a single model and writes them with bulk UPDATE statements.
+
+    Only the columns whose values actually changed are buffered. The buffer writes itself once it holds maxRows rows or
+    its oldest change is older than maxAge, and should be flushed one last time when the work is done.
+    """
+
+    def __init__(self, model, maxRows: int = 100, maxAge: timedelta = timedelta(seconds=60)):
+        self.model = model
+        self.maxRows = maxRows
+        self.maxAge = maxAge
+
+        self.rowsWritten = 0
+        self.valuesWritten = 0
+        self.flushes = 0
+
+        self._changes = {}
+        self._oldestChange = None
+
+    def update(self, row_id, current: dict, values: dict) -> dict:
+        """
+        Buffers the values that differ from the row's current values.
+
+        :param row_id: The primary key of the row
+        :param current: The row's current column values
+        :param values: The new column values
+        :return: The values that changed
+        """
+        changed = {column: value for column, value in values.items() if current.get(column) != value}
+        if changed:
+            self._changes.setdefault(row_id, {}).update(changed)
+            self._oldestChange = self._oldestChange or datetime.now()
+
+            if len(self._changes) >= self.maxRows or datetime.now() - self._oldestChange >= self.maxAge:
+                self.flush()
+
+        return changed
+
+    def flush(self):
+        """Writes all buffered changes"""
+        if not self._changes:
+            return
+
+        primaryKey = self.model.__mapper__.primary_key[0].key
+        mappings = [{primaryKey: row_id, **changes} for row_id, changes in self._changes.items()]
+        Session.bulk_update_mappings(self.model, mappings)
+        Session.commit()
+
+        self.rowsWritten += len(mappings)
+        self.valuesWritten += sum(len(changes) for changes in self._changes.values())
+        self.flushes += 1
+
+        self._changes = {}
+        self._oldestChange = None
+
+    def __len__(self):
+        return len(self._changes)
+
+
 Base = declarative_base()
 
 
@@ -40,3 +317,4 @@ class Version(Base):
     change_log = Column(String)
     timestamp = Column(DateTime, default=datetime.utcnow)
     active = Column(Boolean, unique=True)
+    checksum = Column(String(64), default=None)  # SHA-256 of the installer (hex), None for older releases
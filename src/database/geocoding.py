@@ -0,0 +1,176 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import Column, String, DateTime, Integer, Float
+
+from common.waits import RateLimiter
+from database.general import Base, Session
+
+
+KEY_LENGTH = 64  # A hex SHA-256
+
+
+def normalizeLocation(location: str) -> str:
+    """Normalizes a location for comparison (case and whitespace are ignored)"""
+    return " ".join(location.split()).casefold() if location else ""
+
+
+def locationKey(location: str) -> str:
+    """
+    The key a location is cached under: the SHA-256 of the normalized location. Unlike the location itself it always
+    fits the column, so two long locations can't end up with the same key.
+    """
+    normalized = normalizeLocation(location)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest() if normalized else ""
+
+
+class GeocodedLocation(Base):
+    """The coordinates of a location, as returned by the geocoder. Locations that weren't found have no coordinates."""
+
+    __tablename__ = "geocoded_locations"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    key = Column(String(KEY_LENGTH), unique=True, nullable=False)  # locationKey(location)
+    location = Column(String(255))
+    latitude = Column(Float, default=None)
+    longitude = Column(Float, default=None)
+    date_geocoded = Column(DateTime, default=datetime.utcnow)
+
+    def coordinates(self):
+        """Gets the (latitude, longitude) of the location, or None if the geocoder couldn't find it"""
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
+
+class PhotonGeocoder:
+    """Geocodes locations with Photon (komoot's OpenStreetMap search), which is made for frequent lookups."""
+
+    def __init__(self, timeout=10):
+        from geopy.geocoders import Photon
+        self._geocode = Photon().geocode
+        self.timeout = timeout
+
+    def __call__(self, location: str):
+        found = self._geocode(location, timeout=self.timeout)
+        return (found.latitude, found.longitude) if found else None
+
+
+class StaticGeocoder:
+    """Geocodes locations from a dictionary of location -> (latitude, longitude). Use it to test without the network."""
+
+    def __init__(self, coordinates: dict):
+        self.coordinates = {normalizeLocation(location): point for location, point in coordinates.items()}
+        self.calls = 0
+
+    def __call__(self, location: str):
+        self.calls += 1
+        return self.coordinates.get(normalizeLocation(location))
+
+
+class GeocodeResolver:
+    """
+    Resolves many locations to coordinates, geocoding each distinct location at most once ever.
+
+    Locations are looked up in the geocoded_locations table first. Only the cache misses are sent to the geocoder, from
+    a pool of WORKERS threads that together make at most MAX_REQUESTS_PER_SECOND requests, and their results (including
+    locations that weren't found) are stored so the next resolve is answered entirely from the database. Resolvers
+    racing to store the same location don't conflict: only the first result is stored, and every resolver returns it.
+
+    The geocoder is any callable that takes a location string and returns (latitude, longitude) or None, so tests can
+    use a StaticGeocoder instead of the network.
+    """
+
+    WORKERS = 4
+    MAX_REQUESTS_PER_SECOND = 5
+    LOOKUP_CHUNK_SIZE = 500
+
+    def __init__(self, geocoder=None, workers: int = WORKERS, maxRequestsPerSecond: float = MAX_REQUESTS_PER_SECOND):
+        self.geocoder = geocoder
+        self.workers = workers
+        self.limiter = RateLimiter(maxRequestsPerSecond)
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, locations) -> dict:
+        """
+        Gets the coordinates of each location.
+
+        :param locations: Location strings (duplicates are only resolved once)
+        :return: Maps each location to its (latitude, longitude), or to None if it couldn't be found
+        """
+        byKey = {}
+        for location in locations:
+            key = locationKey(location)
+            if key:
+                byKey.setdefault(key, []).append(location)
+
+        found = self.lookup(byKey.keys())
+        missing = [key for key in byKey if key not in found]
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            found.update(self.geocode({key: byKey[key][0] for key in missing}))
+
+        return {location: found[key] for key, sameLocations in byKey.items() for location in sameLocations}
+
+    def lookup(self, keys) -> dict:
+        """Gets the cached coordinates of the locations (by key) that have already been geocoded."""
+        keys = list(keys)
+        cached = {}
+        for i in range(0, len(keys), self.LOOKUP_CHUNK_SIZE):
+            rows = Session.query(GeocodedLocation).filter(GeocodedLocation.key.in_(keys[i:i + self.LOOKUP_CHUNK_SIZE]))
+            cached.update((row.key, row.coordinates()) for row in rows)
+        return cached
+
+    def geocode(self, locations: dict) -> dict:
+        """
+        Geocodes locations that aren't cached yet and caches the results. Locations the geocoder failed on (as opposed
+        to ones it didn't find) aren't cached, so they're tried again next time.
+
+        :param locations: Maps each location's key to the location string to send to the geocoder
+        :return: Maps each location's key to its coordinates (or None)
+        """
+        geocoder = self.geocoder or PhotonGeocoder()
+        failed = object()
+
+        def geocodeOne(location):
+            self.limiter.acquire()
+            try:
+                return geocoder(location)
+            except Exception:
+                return failed
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = dict(zip(locations, pool.map(geocodeOne, locations.values())))
+
+        rows = []
+        for key, point in results.items():
+            if point is failed:
+                results[key] = None
+                continue
+            latitude, longitude = point if point else (None, None)
+            rows.append({'key': key, 'location': locations[key][:255], 'latitude': latitude, 'longitude': longitude,
+                         'date_geocoded': datetime.utcnow()})
+
+        if rows:
+            # Another resolver may have stored some of these locations in the meantime. Its rows are kept, and the
+            # stored coordinates are returned so every resolver agrees.
+            Session.execute(insertIgnore(GeocodedLocation.__table__), rows)
+            Session.commit()
+            results.update(self.lookup(row['key'] for row in rows))
+
+        return results
+
+
+def insertIgnore(table):
+    """An INSERT that skips the rows whose unique keys are already in the table (instead of failing)."""
+    dialect = Session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return table.insert().prefix_with("OR IGNORE")
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    return table.insert().prefix_with("IGNORE")  # MySQL
@@ -0,0 +1,194 @@
+import threading
+from urllib.parse import urlsplit
+
+from database.general import Session
+from database.linkedin import LinkedInConnection, LinkedInMessage
+
+
+def normalizeName(name: str) -> str:
+    """Normalizes a connection's name for comparison (case and whitespace are ignored)"""
+    return " ".join(name.split()).casefold() if name else ""
+
+
+def normalizeProfileURL(url: str) -> str:
+    """Normalizes a profile URL for comparison (scheme, www, query string, and trailing slashes are ignored)"""
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.casefold()
+    if host.startswith("www."):
+        host = host[len("www."):]
+    return f"{host}{parts.path.rstrip('/')}".casefold()
+
+
+class SentMessageIndex:
+    """
+    The set of (recipient_connection_id, template_id) pairs that have already been sent.
+
+    The pairs for the templates being sent are fetched in a single query, so checking whether a connection already
+    received a template is a set lookup instead of a COUNT query per recipient. Record new sends with add() to keep
+    the index current while a blast is running.
+    """
+
+    def __init__(self):
+        self._sent = set()
+        self._queries = 0
+        self._lookups = 0
+
+    @staticmethod
+    def forTemplates(*template_ids) -> 'SentMessageIndex':
+        """Builds an index of every message sent using any of the given templates."""
+        index = SentMessageIndex()
+        index.load(*template_ids)
+        return index
+
+    def load(self, *template_ids):
+        """Adds every message sent using any of the given templates to the index."""
+        pairs = Session.query(LinkedInMessage.recipient_connection_id, LinkedInMessage.template_id).filter(
+            LinkedInMessage.template_id.in_(template_ids)
+        )
+        self._sent.update(tuple(pair) for pair in pairs)
+        self._queries += 1
+
+    def wasSent(self, connection_id: int, template_id: int) -> bool:
+        """Determines if the template has already been sent to the connection."""
+        self._lookups += 1
+        return (connection_id, template_id) in self._sent
+
+    def add(self, connection_id: int, template_id: int):
+        """Records that the template has been sent to the connection."""
+        self._sent.add((connection_id, template_id))
+
+    def queriesSaved(self) -> int:
+        """The number of database queries avoided by looking pairs up in the index."""
+        return max(self._lookups - self._queries, 0)
+
+    def __len__(self):
+        return len(self._sent)
+
+
+class ConnectionIndex:
+    """
+    Hashed identities of an account's known connections.
+
+    Connections are indexed by normalized name and by normalized profile URL, so checking whether a scraped card or an
+    imported row is already known is a dictionary lookup. The index for an account is loaded from the database the
+    first time it's requested and is then kept current by calling add() whenever a connection is created or updated,
+    so it never needs to be reloaded. Use ConnectionIndex.forAccount to get the shared index for an account.
+
+    The index is shared, so it should only hold connections that are in the database. Code that adds connections
+    before committing them stages the additions (see staged()) and applies them once the commit succeeded.
+    """
+
+    _indexes = {}
+    _indexesLock = threading.Lock()
+
+    @staticmethod
+    def forAccount(account_id: int) -> 'ConnectionIndex':
+        """Gets the index for an account, loading it the first time the account is used."""
+        with ConnectionIndex._indexesLock:
+            index = ConnectionIndex._indexes.get(account_id)
+            if index is None:
+                index = ConnectionIndex(account_id)
+                index.load()
+                ConnectionIndex._indexes[account_id] = index
+        return index
+
+    def __init__(self, account_id: int):
+        self.account_id = account_id
+        self._lock = threading.Lock()
+        self._byName = {}
+        self._byURL = {}
+
+    def load(self):
+        """Adds all of the account's stored connections to the index."""
+        connections = Session.query(LinkedInConnection.id, LinkedInConnection.name, LinkedInConnection.url).filter(
+            LinkedInConnection.account_id == self.account_id
+        )
+        for connection_id, name, url in connections:
+            self.add(name, url, connection_id)
+
+    def add(self, name: str, url: str = "", connection_id: int = None):
+        """
+        Adds (or updates) a connection in the index.
+
+        :param connection_id: The connection's id if it's known. Rows written with bulk inserts don't have one yet.
+        """
+        name = normalizeName(name)
+        url = normalizeProfileURL(url)
+        with self._lock:
+            if name and (connection_id is not None or name not in self._byName):
+                self._byName[name] = connection_id
+            if url and (connection_id is not None or url not in self._byURL):
+                self._byURL[url] = connection_id
+
+    def knows(self, name: str = "", url: str = "") -> bool:
+        """Determines if a connection with the given profile URL or name is already known."""
+        url = normalizeProfileURL(url)
+        return (bool(url) and url in self._byURL) or normalizeName(name) in self._byName
+
+    def find(self, name: str = "", url: str = ""):
+        """
+        Gets the id of a known connection, matching on the profile URL first and then on the name.
+
+        :return: The connection's id, or None if it isn't known (or was bulk inserted and has no id in the index)
+        """
+        url = normalizeProfileURL(url)
+        if url and url in self._byURL:
+            return self._byURL[url]
+        return self._byName.get(normalizeName(name))
+
+    def staged(self) -> 'StagedConnections':
+        """Starts staging additions to the index (see StagedConnections)."""
+        return StagedConnections(self)
+
+    def __contains__(self, name: str):
+        return self.knows(name=name)
+
+    def __len__(self):
+        return len(self._byName)
+
+
+class StagedConnections:
+    """
+    Connections waiting to be added to a ConnectionIndex until the transaction that writes them is committed.
+
+    Lookups see both the index and the staged connections, so a connection staged earlier in a batch is known to the
+    rest of the batch. Call apply() after the commit succeeded; if it failed, discard() (or just drop the object) and
+    the shared index never hears about the connections that weren't written.
+
+    >>> staged = ConnectionIndex.forAccount(account_id).staged()
+    >>> staged.add(name, url)
+    >>> Session.commit()
+    >>> staged.apply()
+    """
+
+    def __init__(self, index: ConnectionIndex):
+        self.index = index
+        self._pending = []
+        self._names = set()
+
+    def add(self, name: str, url: str = "", connection_id: int = None):
+        """Stages a connection to be added to the index by the next apply()."""
+        self._pending.append((name, url, connection_id))
+        self._names.add(normalizeName(name))
+
+    def apply(self):
+        """Adds the staged connections to the index (once they've been committed)."""
+        for name, url, connection_id in self._pending:
+            self.index.add(name, url, connection_id)
+        self.discard()
+
+    def discard(self):
+        """Forgets the staged connections (when they couldn't be committed)."""
+        self._pending = []
+        self._names = set()
+
+    def knows(self, name: str = "", url: str = "") -> bool:
+        return normalizeName(name) in self._names or self.index.knows(name=name, url=url)
+
+    def __contains__(self, name: str):
+        return self.knows(name=name)
+
+    def __len__(self):
+        return len(self._pending)
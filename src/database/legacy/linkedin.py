@@ -3,11 +3,10 @@ from sqlalchemy import Column, String, DateTime, Integer
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-from database.credentials import username, password, host, port
 from database.linkedin import LinkedInMessage, LinkedInAccount, LinkedInConnection, LinkedInMessageTemplate
-from database.general import Client, Session as newSession
+from database.general import Client, Session as newSession, createEngine, getDatabaseURL
 
-engine = create_engine(f'mysql+pymysql://{username}:{password}@{host}:{port}/linkedin', pool_recycle=3600)
+engine = createEngine(getDatabaseURL("linkedin"))
 legacySession = sessionmaker(bind=engine)()
 
 Base = declarative_base()
@@ -1,9 +1,13 @@
 import datetime
+import threading
+from collections import namedtuple
 from datetime import date, datetime, timedelta
 from Cryptodome.Cipher import AES
-from sqlalchemy import Column, String, Boolean, Date, Time, DateTime, Integer, ForeignKey, LargeBinary
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Boolean, Date, Time, DateTime, Integer, ForeignKey, LargeBinary, Index
+from sqlalchemy.orm import relationship, validates
 from database.credentials import AES_key
+from common.locations import parseLocation, LocationParts
+from common.templating import CompiledTemplate, TemplateCache, RenderCache, RenderResult, INVALID_PLACEHOLDER
 from database.general import Base, Session
 
 
@@ -45,29 +49,32 @@ class LinkedInAccount(Base):
         ciphertext, tag = cipher.encrypt_and_digest(password.encode("utf-8"))
         self.password = nonce + ciphertext
 
+    def getActivityLedger(self) -> 'LinkedInActivityLedger':
+        """Get the in-memory ledger that tracks this account's activity for today"""
+        return LinkedInActivityLedger.forAccount(self.id)
+
     def setActivityLimitForToday(self, newLimit: int):
         """Change the daily account limit for this account for today only"""
-        activityToday = LinkedInAccountDailyActivity.getToday(self.id)
-        activityToday.activity_limit = newLimit
-        Session.commit()
+        self.getActivityLedger().setActivityLimit(newLimit)
 
     def getTodaysRemainingActions(self):
-        activityToday = LinkedInAccountDailyActivity.getToday(self.id)
-        return activityToday.activity_limit - activityToday.message_count - activityToday.connection_request_count
+        return self.getActivityLedger().remainingActions()
 
     def getDailyActivityLimit(self):
         """Get the linkedin account's daily activity limit"""
-        return LinkedInAccountDailyActivity.getToday(self.id).activity_limit
+        return self.getActivityLedger().activityLimit()
 
     def dailyActivityLimitReached(self):
         """Determine if this account has reached its daily activity limit."""
-        activityToday = LinkedInAccountDailyActivity.getToday(self.id)
-        return activityToday.message_count + activityToday.connection_request_count >= activityToday.activity_limit
+        return self.getActivityLedger().limitReached()
 
 class LinkedInAccountDailyActivity(Base):
     """Keeps track of a single LinkedIn account's daily activity."""
 
     __tablename__ = "linkedin_accounts_daily_activity"
+    __table_args__ = (
+        Index("ux_linkedin_accounts_daily_activity_account_id_date", "account_id", "date", unique=True),
+    )
 
     DEFAULT_ACTIVITY_LIMIT = 100
     MAX_ACTIVITY_LIMIT = 200
@@ -111,7 +118,7 @@ class LinkedInAccountDailyActivity(Base):
             LinkedInAccountDailyActivity.account == account,
             LinkedInAccountDailyActivity.date < date.today()
         ).order_by(
-            LinkedInAccountDailyActivity.date
+            LinkedInAccountDailyActivity.date.desc()
         ).first()
 
         if lastDaysActivity:
@@ -125,10 +132,157 @@ class LinkedInAccountDailyActivity(Base):
         return newActivity
 
 
+class LinkedInActivityLedger:
+    """
+    Keeps a single LinkedIn account's activity for today in memory.
+
+    Today's record is loaded once and the counters are kept locally, so checking the daily limit doesn't cost a
+    database round trip. Recorded actions are written back as increments every FLUSH_INTERVAL or after FLUSH_EVERY
+    actions, whichever comes first, and every flush reads the record back, so actions recorded by other instances are
+    picked up too. When the date changes, the pending actions are flushed to the old day's record and the next day's
+    record is loaded (which applies the daily limit ramp in LinkedInAccountDailyActivity.getToday).
+
+    Use LinkedInActivityLedger.forAccount to get the shared ledger for an account rather than creating one directly.
+    """
+
+    FLUSH_INTERVAL = timedelta(seconds=30)
+    FLUSH_EVERY = 10  # actions
+
+    _ledgers = {}
+    _ledgersLock = threading.Lock()
+
+    @staticmethod
+    def forAccount(account_id: int) -> 'LinkedInActivityLedger':
+        """Gets the ledger for an account, loading today's record the first time the account is used."""
+        with LinkedInActivityLedger._ledgersLock:
+            ledger = LinkedInActivityLedger._ledgers.get(account_id)
+            if ledger is None:
+                ledger = LinkedInActivityLedger(account_id)
+                LinkedInActivityLedger._ledgers[account_id] = ledger
+        return ledger
+
+    @staticmethod
+    def flushAll():
+        """Writes back the pending actions of every loaded ledger."""
+        with LinkedInActivityLedger._ledgersLock:
+            ledgers = list(LinkedInActivityLedger._ledgers.values())
+        for ledger in ledgers:
+            ledger.flush()
+
+    def __init__(self, account_id: int):
+        self.account_id = account_id
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        """Loads (or creates) today's activity record and resets the local counters from it."""
+        record = LinkedInAccountDailyActivity.getToday(self.account_id)
+        self._recordId = record.id
+        self._date = record.date
+        self._activityLimit = record.activity_limit
+        self._messageCount = record.message_count
+        self._connectionRequestCount = record.connection_request_count
+        self._pendingMessages = 0
+        self._pendingConnectionRequests = 0
+        self._lastActivity = None
+        self._lastFlush = datetime.now()
+
+    def _rollOver(self):
+        """Switches to the new day's record (read from the database) once the date has changed."""
+        if self._date != date.today():
+            self.flush()
+            self._load()
+
+    def _sync(self):
+        """Re-reads the counters and the limit from the database. Only call it when no actions are pending."""
+        record = Session.query(
+            LinkedInAccountDailyActivity.activity_limit, LinkedInAccountDailyActivity.message_count,
+            LinkedInAccountDailyActivity.connection_request_count
+        ).filter(LinkedInAccountDailyActivity.id == self._recordId).one_or_none()
+        if record is not None:
+            self._activityLimit, self._messageCount, self._connectionRequestCount = record
+
+    def _record(self, messages=0, connectionRequests=0):
+        with self._lock:
+            self._rollOver()
+            self._messageCount += messages
+            self._connectionRequestCount += connectionRequests
+            self._pendingMessages += messages
+            self._pendingConnectionRequests += connectionRequests
+            self._lastActivity = datetime.now()
+
+            pending = self._pendingMessages + self._pendingConnectionRequests
+            if pending >= self.FLUSH_EVERY or datetime.now() - self._lastFlush >= self.FLUSH_INTERVAL:
+                self.flush()
+
+    def recordMessage(self):
+        """Counts a delivered message towards today's activity."""
+        self._record(messages=1)
+
+    def recordConnectionRequest(self):
+        """Counts a sent connection request towards today's activity."""
+        self._record(connectionRequests=1)
+
+    def flush(self):
+        """
+        Writes the pending actions to today's record as increments, so concurrent writers aren't overwritten, then
+        re-reads the record.
+        """
+        with self._lock:
+            if self._pendingMessages or self._pendingConnectionRequests:
+                Session.query(LinkedInAccountDailyActivity).filter(
+                    LinkedInAccountDailyActivity.id == self._recordId
+                ).update({
+                    LinkedInAccountDailyActivity.message_count:
+                        LinkedInAccountDailyActivity.message_count + self._pendingMessages,
+                    LinkedInAccountDailyActivity.connection_request_count:
+                        LinkedInAccountDailyActivity.connection_request_count + self._pendingConnectionRequests,
+                    LinkedInAccountDailyActivity.last_activity: self._lastActivity,
+                }, synchronize_session=False)
+                Session.commit()
+
+                self._pendingMessages = 0
+                self._pendingConnectionRequests = 0
+
+            self._sync()
+            self._lastFlush = datetime.now()
+
+    def setActivityLimit(self, newLimit: int):
+        """Changes today's activity limit. Limit changes are written immediately."""
+        with self._lock:
+            self._rollOver()
+            Session.query(LinkedInAccountDailyActivity).filter(
+                LinkedInAccountDailyActivity.id == self._recordId
+            ).update({LinkedInAccountDailyActivity.activity_limit: newLimit}, synchronize_session=False)
+            Session.commit()
+            self._activityLimit = newLimit
+
+    def activityLimit(self) -> int:
+        with self._lock:
+            self._rollOver()
+            return self._activityLimit
+
+    def usedActions(self) -> int:
+        with self._lock:
+            self._rollOver()
+            return self._messageCount + self._connectionRequestCount
+
+    def remainingActions(self) -> int:
+        with self._lock:
+            self._rollOver()
+            return self._activityLimit - self._messageCount - self._connectionRequestCount
+
+    def limitReached(self) -> bool:
+        return self.remainingActions() <= 0
+
+
 class LinkedInConnection(Base):
     """LinkedIn Connections belonging to our clients (connections mutual to multiple clients will be duplicated)"""
 
     __tablename__ = "linkedin_connections"
+    __table_args__ = (
+        Index("ix_linkedin_connections_account_id_name", "account_id", "name", mysql_length={"name": 191}),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     account_id = Column(Integer, ForeignKey('linkedin_accounts.id'))
@@ -140,17 +294,55 @@ class LinkedInConnection(Base):
     position = Column(String, default="")
     date_added = Column(DateTime, default=None)
 
+    # Parsed from location whenever it's set. NULL means the location hasn't been parsed yet.
+    city = Column(String(255), default=None)
+    state = Column(String(255), default=None)
+    country = Column(String(255), default=None)
+    zip_code = Column(String(255), default=None)
+
     # -- ORM --------------------------
     account = relationship("LinkedInAccount", uselist=False, back_populates="connections")
     messages = relationship("LinkedInMessage", uselist=True, back_populates="recipient")
 
+    @validates('location')
+    def splitLocation(self, key, location):
+        """Splits the location into its components whenever it changes"""
+        self.city, self.state, self.country, self.zip_code = parseLocation(location)
+        return location
+
+    def locationParts(self) -> LocationParts:
+        """Gets the parsed components of the connection's location"""
+        if self.city is None:
+            return parseLocation(self.location)
+        return LocationParts(self.city, self.state or "", self.country or "", self.zip_code or "")
+
+
+class ConnectionSnapshot(namedtuple("ConnectionSnapshot",
+                                    ["id", "name", "location", "city", "state", "country", "zip_code"])):
+    """
+    The info of a LinkedInConnection that its messages are rendered from, as a plain value. Unlike the connection, which
+    belongs to the session of the thread that loaded it, a snapshot can be handed to another thread. Rendering a
+    template for a snapshot gives the same (cached) result as rendering it for the connection.
+    """
+
+    @staticmethod
+    def columns() -> tuple:
+        """The columns to query for a snapshot, in order (ConnectionSnapshot(*row) builds it from the row)"""
+        return tuple(getattr(LinkedInConnection, field) for field in ConnectionSnapshot._fields)
+
+    def locationParts(self) -> LocationParts:
+        """Gets the parsed components of the connection's location"""
+        if self.city is None:
+            return parseLocation(self.location)
+        return LocationParts(self.city, self.state or "", self.country or "", self.zip_code or "")
+
 
 class LinkedInMessageTemplate(Base):
     """Message templates for LinkedIn that will be blasted out to our connections"""
 
     __tablename__ = "linkedin_message_templates"
 
-    invalidPlaceholder = "INVALID-PLACEHOLDER"
+    invalidPlaceholder = INVALID_PLACEHOLDER
     defaultCRC = -1
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -169,48 +361,36 @@ class LinkedInMessageTemplate(Base):
         """Creates and returns a LinkedInMessage object"""
         return LinkedInMessage(account=self.account, template=self, recipient=connection)
 
+    def compiled(self) -> CompiledTemplate:
+        """Gets the compiled version of the template (compiled once and cached until the template is edited)"""
+        return TemplateCache.get(self.id, self.message_template)
+
+    def renderFor(self, connection) -> RenderResult:
+        """Renders the template for a connection, reusing the render if the message was already previewed or checked"""
+        return RenderCache.get(self.id, self.compiled(), connection)
+
     def fill(self, connection):
         """Replaces the placeholders in the template with connection info and returns a string"""
+        return self.renderFor(connection).text
 
-        templateText = self.message_template.encode('latin1').decode('unicode_escape')
-
-        # all of the placeholders in the array (value), depend on the key attribute not being blank or null.
-        connection_conditions = {
-            "name": ["{FIRST_NAME}", "{LAST_NAME}", "{FULL_NAME}"],
-            "location": ["{LOCATION}", "{CITY}", "{STATE}", "{COUNTRY}", "{ZIP_CODE}"]
-        }
-
-        # to replace the placeholders, call the following lambda functions.
-        placeholders_functions = {
-            "{FIRST_NAME}": lambda c: c.name.strip().split()[0],
-            "{LAST_NAME}":  lambda c: c.name.strip().split()[-1],
-            "{FULL_NAME}":  lambda c: c.name.strip(),
-            "{LOCATION}":   lambda c: c.location,
-            "{CITY}":       lambda c: self.invalidPlaceholder, # TODO: Extract city from location
-            "{STATE}":      lambda c: self.invalidPlaceholder, # TODO: Extract state from location
-            "{COUNTRY}":    lambda c: self.invalidPlaceholder, # TODO: Extract country from location
-            "{ZIP_CODE}":   lambda c: self.invalidPlaceholder, # TODO: Extract zip code from location
-        }
-
-        for attr in connection_conditions:
-            for placeholder in connection_conditions[attr]:
-                if connection.__getattribute__(attr):
-                    templateText = templateText.replace(placeholder, placeholders_functions[placeholder](connection))
-                else:
-                    templateText = templateText.replace(placeholder, self.invalidPlaceholder)
-
-        return templateText
+    def fillMany(self, connections) -> list:
+        """Fills the template for each connection, in order"""
+        return [self.fill(connection) for connection in connections]
 
     def isValid(self, connection):
         """Determines if a template was filled properly"""
-        text = self.fill(connection)
-        return not self.invalidPlaceholder in text
+        return self.renderFor(connection).isValid
 
 
 class LinkedInMessage(Base):
     """Instances of the Message templates that we actually sent to connections."""
 
     __tablename__ = "linkedin_messages"
+    __table_args__ = (
+        Index("ix_linkedin_messages_recipient_connection_id_template_id", "recipient_connection_id", "template_id"),
+        Index("ix_linkedin_messages_template_id", "template_id"),
+        Index("ix_linkedin_messages_account_id", "account_id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     account_id = Column(Integer, ForeignKey('linkedin_accounts.id'))
@@ -234,10 +414,7 @@ class LinkedInMessage(Base):
 
     def recordAsDelivered(self):
         """Increments the message count for the corresponding account"""
-        todaysActivity = LinkedInAccountDailyActivity.getToday(self.account.id)
-        todaysActivity.message_count += 1
-        todaysActivity.last_activity = datetime.now()
-        Session.flush()
+        LinkedInActivityLedger.forAccount(self.account.id).recordMessage()
 
 
 class ResponseMeanings(Base):
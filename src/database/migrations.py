@@ -0,0 +1,346 @@
+"""
+Versioned schema migrations for the database described by database.general.Base.
+
+Each migration is a function decorated with @migration(version, description). Migrations are applied in version order
+and every applied version is recorded in the schema_migrations table, so running the migrations again only applies the
+ones a deployment is missing. To upgrade an existing deployment, run this module directly:
+
+    python -m database.migrations
+
+which applies the pending migrations and then reports any of the project's known queries that still scan a whole table.
+Social checks the schema when it starts (see prepareDatabase): a local SQLite database is migrated right away, and
+Social won't start against a shared server that's missing migrations.
+"""
+
+import logging
+from collections import namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import Column, String, DateTime, Integer, and_, bindparam, func, inspect, select
+
+import database.general
+from common.locations import parseLocation
+from database.general import Base, Session, Version
+from database.geocoding import GeocodedLocation, KEY_LENGTH
+from database.linkedin import LinkedInAccountDailyActivity, LinkedInConnection, LinkedInMessage
+
+
+class SchemaMigration(Base):
+    """A migration that has been applied to the database"""
+
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String(255))
+    applied = Column(DateTime, default=datetime.utcnow)
+
+
+Migration = namedtuple("Migration", ["version", "description", "upgrade"])
+MIGRATIONS = []
+
+LOCATION_BACKFILL_PAGE_SIZE = 5000
+
+logger = logging.getLogger("root")
+
+
+def migration(version: int, description: str):
+    """Registers the decorated function as the upgrade step for a schema version."""
+    def register(upgrade):
+        MIGRATIONS.append(Migration(version, description, upgrade))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return upgrade
+    return register
+
+
+def createIndexIfMissing(connection, index):
+    """Creates an index declared on one of the models unless the table already has an index with that name."""
+    existing = {ix["name"] for ix in inspect(connection).get_indexes(index.table.name)}
+    if index.name not in existing:
+        index.create(bind=connection)
+
+
+def addColumnIfMissing(connection, column):
+    """Adds a column declared on one of the models unless the table already has a column with that name."""
+    existing = {c["name"] for c in inspect(connection).get_columns(column.table.name)}
+    if column.name not in existing:
+        columnType = column.type.compile(dialect=connection.dialect)
+        connection.execute(f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} {columnType}")
+
+
+def getIndex(model, name):
+    """Gets an index declared in a model's __table_args__ by name."""
+    for index in model.__table__.indexes:
+        if index.name == name:
+            return index
+    raise KeyError(f"{model.__tablename__} does not declare an index named {name}")
+
+
+def parseStoredLocations(connection):
+    """Parses the locations of the connections that are already stored into their parts, a page at a time."""
+    connections = LinkedInConnection.__table__
+    update = connections.update().where(connections.c.id == bindparam("_id")).values(
+        city=bindparam("city"), state=bindparam("state"), country=bindparam("country"), zip_code=bindparam("zip_code")
+    )
+    lastId = 0
+    while True:
+        rows = connection.execute(
+            select([connections.c.id, connections.c.location])
+            .where(connections.c.id > lastId)
+            .order_by(connections.c.id)
+            .limit(LOCATION_BACKFILL_PAGE_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        connection.execute(update, [dict(parseLocation(location)._asdict(), _id=row_id) for row_id, location in rows])
+        lastId = rows[-1].id
+
+
+def appliedVersions(engine) -> set:
+    """Gets the versions of all migrations that have already been applied."""
+    with engine.connect() as connection:
+        return {row[0] for row in connection.execute(select([SchemaMigration.version]))}
+
+
+def migrate(engine=None):
+    """
+    Applies every pending migration in version order.
+
+    :param engine: The engine to migrate. Defaults to the application's engine.
+    :return: The migrations that were applied
+    """
+    engine = engine or database.general.engine
+    SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+
+    applied = appliedVersions(engine)
+    newlyApplied = []
+    for m in MIGRATIONS:
+        if m.version in applied:
+            continue
+
+        with engine.begin() as connection:
+            m.upgrade(connection)
+            connection.execute(SchemaMigration.__table__.insert(), version=m.version, description=m.description)
+
+        newlyApplied.append(m)
+
+    return newlyApplied
+
+
+def pendingMigrations(engine=None) -> list:
+    """
+    Gets the migrations that haven't been applied to the database yet, in version order.
+
+    :param engine: The engine to check. Defaults to the application's engine.
+    """
+    engine = engine or database.general.engine
+    if SchemaMigration.__tablename__ not in inspect(engine).get_table_names():
+        return list(MIGRATIONS)
+
+    applied = appliedVersions(engine)
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+class SchemaOutOfDate(Exception):
+    """The database is missing migrations that the models depend on"""
+
+    def __init__(self, pending: list):
+        self.pending = pending
+        versions = ", ".join(str(m.version) for m in pending)
+        super().__init__(f"The database is missing schema migrations ({versions}). Run `python -m database.migrations` "
+                         f"against it before starting Social.")
+
+
+def prepareDatabase(engine=None):
+    """
+    Makes sure the database has the schema the models describe before anything queries it. A local SQLite database is
+    created and brought up to date. Shared servers are migrated deliberately by running this module, so they're only
+    checked.
+
+    :raises SchemaOutOfDate: If a shared server is missing migrations
+    """
+    engine = engine or database.general.engine
+    if engine.dialect.name == "sqlite":
+        Base.metadata.create_all(bind=engine)
+        migrate(engine)
+        return
+
+    pending = pendingMigrations(engine)
+    if pending:
+        raise SchemaOutOfDate(pending)
+
+
+########################################################################################################################
+# MIGRATIONS:                                                                                                          #
+#   Never edit a migration that has been released. Add a new one with the next version number instead.                #
+########################################################################################################################
+
+@migration(1, "Add indexes for connection, message, and daily activity lookups")
+def addHotPathIndexes(connection):
+    activity = LinkedInAccountDailyActivity.__table__
+
+    # The unique index can't be created while an account has more than one record for the same day, so merge them.
+    duplicates = connection.execute(
+        select([activity.c.account_id, activity.c.date])
+        .group_by(activity.c.account_id, activity.c.date)
+        .having(func.count(activity.c.id) > 1)
+    ).fetchall()
+
+    for account_id, day in duplicates:
+        records = connection.execute(
+            select([activity])
+            .where(and_(activity.c.account_id == account_id, activity.c.date == day))
+            .order_by(activity.c.id)
+        ).fetchall()
+        keep, extras = records[0], records[1:]
+        lastActivities = [record.last_activity for record in records if record.last_activity]
+
+        connection.execute(activity.update().where(activity.c.id == keep.id).values(
+            message_count=sum(record.message_count or 0 for record in records),
+            connection_request_count=sum(record.connection_request_count or 0 for record in records),
+            activity_limit=max(record.activity_limit or 0 for record in records),
+            last_activity=max(lastActivities) if lastActivities else None
+        ))
+        connection.execute(activity.delete().where(activity.c.id.in_([record.id for record in extras])))
+
+    createIndexIfMissing(connection, getIndex(LinkedInConnection, "ix_linkedin_connections_account_id_name"))
+    createIndexIfMissing(connection, getIndex(LinkedInMessage, "ix_linkedin_messages_recipient_connection_id_template_id"))
+    createIndexIfMissing(connection, getIndex(LinkedInMessage, "ix_linkedin_messages_template_id"))
+    createIndexIfMissing(connection, getIndex(LinkedInMessage, "ix_linkedin_messages_account_id"))
+    createIndexIfMissing(connection, getIndex(LinkedInAccountDailyActivity,
+                                              "ux_linkedin_accounts_daily_activity_account_id_date"))
+
+
+@migration(2, "Add parsed location columns to connections")
+def addConnectionLocationParts(connection):
+    connections = LinkedInConnection.__table__
+
+    for column in (connections.c.city, connections.c.state, connections.c.country, connections.c.zip_code):
+        addColumnIfMissing(connection, column)
+
+    parseStoredLocations(connection)
+
+
+@migration(3, "Add the geocoded location cache")
+def addGeocodedLocations(connection):
+    GeocodedLocation.__table__.create(bind=connection, checkfirst=True)
+
+
+@migration(4, "Add installer checksums to versions")
+def addVersionChecksums(connection):
+    addColumnIfMissing(connection, Version.__table__.c.checksum)
+
+
+@migration(5, "Key geocoded locations by hash")
+def hashGeocodedLocationKeys(connection):
+    # Locations used to be cached under their normalized text, which no lookup uses anymore. It's only a cache, so those
+    # rows are dropped and the locations are geocoded again the next time they're resolved.
+    locations = GeocodedLocation.__table__
+    connection.execute(locations.delete().where(func.length(locations.c.key) != KEY_LENGTH))
+
+
+@migration(6, "Parse connection locations again")
+def reparseConnectionLocations(connection):
+    # Region abbreviations that are also a country's ("San Diego, CA") were parsed as the country, and cities were
+    # renamed to the gazetteer's spelling of them
+    parseStoredLocations(connection)
+
+
+########################################################################################################################
+# QUERY PLAN CHECKS:                                                                                                   #
+#   The queries the application runs in its hot loops. checkQueryPlans() asks the database how it would execute each  #
+#   one and reports the ones that would scan a whole table. Add new hot queries here as they're written.               #
+########################################################################################################################
+
+KNOWN_QUERIES = {}
+
+
+def knownQuery(description: str):
+    """Registers a function that builds one of the application's hot queries."""
+    def register(build):
+        KNOWN_QUERIES[description] = build
+        return build
+    return register
+
+
+@knownQuery("connection by account and name")
+def connectionByName():
+    return Session.query(LinkedInConnection).filter(LinkedInConnection.account_id == 1,
+                                                     LinkedInConnection.name == "")
+
+
+@knownQuery("messages sent to a connection using a template")
+def messagesToConnectionWithTemplate():
+    return Session.query(LinkedInMessage).filter(LinkedInMessage.recipient_connection_id == 1,
+                                                 LinkedInMessage.template_id == 1)
+
+
+@knownQuery("recipients of a template")
+def recipientsOfTemplate():
+    return Session.query(LinkedInMessage.recipient_connection_id, LinkedInMessage.template_id)\
+        .filter(LinkedInMessage.template_id.in_([1]))
+
+
+@knownQuery("messages sent by an account")
+def messagesSentByAccount():
+    return Session.query(LinkedInMessage).filter(LinkedInMessage.account_id == 1)
+
+
+@knownQuery("daily activity for today")
+def dailyActivityForToday():
+    return Session.query(LinkedInAccountDailyActivity).filter(LinkedInAccountDailyActivity.account_id == 1,
+                                                              LinkedInAccountDailyActivity.date == date.today())
+
+
+def explain(connection, query) -> list:
+    """
+    Asks the database how it would execute a query.
+
+    :return: A description of each step of the plan that scans a whole table, or None if query plans can't be checked
+             on the database (only SQLite and MySQL plans are understood)
+    """
+    dialect = connection.dialect
+    statement = str(query.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+    if dialect.name == "sqlite":
+        rows = connection.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+        return [row.detail for row in rows if row.detail.startswith("SCAN") and "INDEX" not in row.detail]
+
+    elif dialect.name == "mysql":
+        rows = connection.execute(f"EXPLAIN {statement}").fetchall()
+        return [f"SCAN {row.table}" for row in rows if row.type == "ALL"]
+
+    return None
+
+
+def checkQueryPlans(engine=None) -> dict:
+    """
+    Explains each of the known queries.
+
+    :param engine: The engine to check. Defaults to the application's engine.
+    :return: Maps the description of each known query that scans a table to the scanning steps of its plan. Nothing is
+             reported (and a warning is logged) if query plans can't be checked on the database.
+    """
+    engine = engine or database.general.engine
+    report = {}
+    with engine.connect() as connection:
+        for description, build in KNOWN_QUERIES.items():
+            scans = explain(connection, build())
+            if scans is None:
+                logger.warning(f"Query plans can't be checked on {engine.dialect.name}, skipping the check")
+                return {}
+            if scans:
+                report[description] = scans
+    return report
+
+
+if __name__ == '__main__':
+    for applied in migrate():
+        print(f"Applied migration {applied.version}: {applied.description}")
+
+    tableScans = checkQueryPlans()
+    for description, scans in tableScans.items():
+        print(f"Table scan in '{description}': {'; '.join(scans)}")
+
+    if not tableScans:
+        print("None of the known queries scan a whole table.")
@@ -2,6 +2,8 @@ import imaplib
 from datetime import datetime, timedelta
 import emails
 
+from common.sync import Backoff
+
 imaplib._MAXLINE = 1000000
 
 
@@ -40,6 +42,7 @@ class PinValidator:
 
         pin = ""
         start = datetime.now()
+        backoff = Backoff(initial=1, maximum=10)
         while not pin:
 
             now = datetime.now()
@@ -117,4 +120,8 @@ class PinValidator:
 
                         if needed_msg in mail_content:
                             return mail_content.split(needed_msg)[1][:6]
+
+            # The email hasn't arrived yet, so give it some time before searching again
+            backoff.sleep()
+
         raise PinValidationException("No PIN Found.")
\ No newline at end of file
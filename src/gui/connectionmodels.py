@@ -0,0 +1,316 @@
+from array import array
+
+from PySide2.QtCore import (QAbstractTableModel, QAbstractListModel, QAbstractProxyModel, QModelIndex, Qt, QThreadPool,
+                            Signal)
+
+from common.search import TrigramIndex
+from common.threading import Task, QueryStream
+from database.filters import ConnectionFilter, SortedPager
+from database.linkedin import LinkedInConnection
+
+
+class ConnectionTableModel(QAbstractTableModel):
+    """
+    An account's connections, fetched from the database a page at a time as the view scrolls.
+
+    Rows are kept as one compact array per column instead of as ORM objects or item widgets, and only the rows that
+    have been scrolled to are ever loaded (see canFetchMore/fetchMore). Sorting re-fetches from the database in the new
+    order. The connection's id is available from any cell with the Qt.UserRole role.
+
+    Pages and the total are fetched on worker threads, so scrolling and searching never wait on the database: a page
+    is inserted when it arrives, and totalChanged(total) is emitted once the total is known. Anything fetched for a
+    search or an order that has since been replaced (see reload) is dropped when it arrives.
+
+    A QListView shows the model's first column, so the same model backs both the lists and the connections table.
+    """
+
+    totalChanged = Signal(int)
+
+    PAGE_SIZE = 500
+
+    def __init__(self, account_id: int, columns=(LinkedInConnection.name,), headers=("Name",), parent=None):
+        QAbstractTableModel.__init__(self, parent)
+        self.account_id = account_id
+        self.columns = list(columns)
+        self.headers = list(headers)
+        self.search = ""
+        self.orderBy = self.columns[0]
+        self.descending = False
+        self._total = None
+
+        self.ids = array('q')
+        self.values = [[] for _ in self.columns]
+        self.pager = self.createPager()
+        self.generation = 0  # Increased by every reload, so results fetched for an older one can be told apart
+        self.fetching = False
+
+    def createPager(self) -> SortedPager:
+        connectionFilter = ConnectionFilter(self.account_id).byName(self.search)
+        return SortedPager(connectionFilter, self.columns, orderBy=self.orderBy, descending=self.descending)
+
+    def reload(self, search: str = None):
+        """Drops the loaded rows and starts fetching again from the first page (optionally with a new search)."""
+        self.beginResetModel()
+        if search is not None:
+            self.search = search
+        self._total = None
+        self.ids = array('q')
+        self.values = [[] for _ in self.columns]
+        self.pager = self.createPager()
+        self.generation += 1
+        self.fetching = False
+        self.endResetModel()
+
+        generation = self.generation
+        task = Task(self.pager.connectionFilter.count)
+        task.finished.connect(lambda total: self.onCounted(generation, total))
+        QThreadPool.globalInstance().start(task)
+
+    def total(self) -> int:
+        """
+        The number of matching connections, including the ones that haven't been fetched yet (0 until it's been
+        counted, see totalChanged).
+        """
+        return self._total or 0
+
+    def onCounted(self, generation: int, total: int):
+        if generation == self.generation:
+            self._total = total
+            self.totalChanged.emit(total)
+
+    def onFetched(self, generation: int, rows: list):
+        if generation != self.generation:
+            return
+        self.fetching = False
+        if not rows:
+            return
+
+        first = len(self.ids)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.ids.extend(row[0] for row in rows)
+        for column, values in enumerate(self.values, start=1):
+            values.extend(row[column] or "" for row in rows)
+        self.endInsertRows()
+
+    # --- Model Interface ----------------------------------------------------------------------------------------------
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.values[index.column()][index.row()]
+        if role == Qt.UserRole:
+            return self.ids[index.row()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section < len(self.headers):
+            return self.headers[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.pager.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        # One page at a time: the pager picks up where the previous page ended
+        if parent.isValid() or self.fetching:
+            return
+        self.fetching = True
+
+        generation = self.generation
+        task = Task(self.pager.next, self.PAGE_SIZE)
+        task.finished.connect(lambda rows: self.onFetched(generation, rows))
+        QThreadPool.globalInstance().start(task)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.orderBy = self.columns[column]
+        self.descending = order == Qt.DescendingOrder
+        self.reload()
+
+
+class SelectedConnectionsModel(QAbstractListModel):
+    """
+    The connections chosen to be messaged, as parallel arrays of ids and names. Adding and checking for a connection
+    doesn't depend on how many are selected.
+    """
+
+    def __init__(self, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self.ids = array('q')
+        self.names = []
+        self._rows = {}
+
+    def add(self, connection_id: int, name: str):
+        """Adds a connection to the end of the list unless it's already selected."""
+        if connection_id in self._rows:
+            return
+        row = len(self.ids)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.ids.append(connection_id)
+        self.names.append(name)
+        self._rows[connection_id] = row
+        self.endInsertRows()
+
+    def setConnections(self, connections):
+        """Replaces the selection with (id, name) pairs."""
+        self.beginResetModel()
+        self.ids = array('q')
+        self.names = []
+        self._rows = {}
+        for connection_id, name in connections:
+            if connection_id not in self._rows:
+                self._rows[connection_id] = len(self.ids)
+                self.ids.append(connection_id)
+                self.names.append(name)
+        self.endResetModel()
+
+    def clear(self):
+        self.setConnections([])
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        if parent.isValid() or row < 0 or row + count > len(self.ids):
+            return False
+        self.beginRemoveRows(QModelIndex(), row, row + count - 1)
+        del self.ids[row:row + count]
+        del self.names[row:row + count]
+        self._rows = {connection_id: i for i, connection_id in enumerate(self.ids)}
+        self.endRemoveRows()
+        return True
+
+    def __contains__(self, connection_id):
+        return connection_id in self._rows
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- Model Interface ----------------------------------------------------------------------------------------------
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ids)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.names[index.row()]
+        if role == Qt.UserRole:
+            return self.ids[index.row()]
+        return None
+
+
+def streamConnectionNames(account_id: int) -> QueryStream:
+    """
+    Streams the ids, names, positions and locations of an account's connections, sorted by name, to be indexed for
+    searching (see ConnectionSearchModel and connectionDocument). Only those columns are loaded, so this stays cheap for
+    big accounts.
+
+    :return: The stream (not started yet). Its chunks are lists of (id, name, position, location) tuples.
+    """
+    return QueryStream(lambda: ConnectionFilter(account_id).query(LinkedInConnection.id, LinkedInConnection.name,
+                                                                  LinkedInConnection.position,
+                                                                  LinkedInConnection.location)
+                       .order_by(LinkedInConnection.name, LinkedInConnection.id),
+                       chunkSize=2000)
+
+
+class ConnectionNamesModel(QAbstractListModel):
+    """Every one of an account's connections, already loaded, as parallel arrays of ids and names."""
+
+    def __init__(self, ids, names, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self.ids = ids
+        self.names = names
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ids)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.names[index.row()]
+        if role == Qt.UserRole:
+            return self.ids[index.row()]
+        return None
+
+
+class ConnectionSearchModel(QAbstractProxyModel):
+    """
+    Shows the connections of a ConnectionNamesModel whose name, position or location matches the search box.
+
+    Matching rows come straight from a TrigramIndex of those fields instead of from testing every row (as
+    QSortFilterProxyModel would), so searching is about as fast as the index no matter how many connections there are.
+    The proxy only keeps the list of matching source rows, and gives them to the view PAGE_SIZE at a time as it's
+    scrolled, like ConnectionTableModel.
+    """
+
+    PAGE_SIZE = 500
+
+    def __init__(self, ids, names, index: TrigramIndex, parent=None):
+        QAbstractProxyModel.__init__(self, parent)
+        self.setSourceModel(ConnectionNamesModel(ids, names, self))
+        self.searchIndex = index
+        self.search = ""
+        self.rows = range(len(ids))
+        self.loaded = min(self.PAGE_SIZE, len(self.rows))
+        self._proxyRows = None
+
+    def setSearch(self, text: str):
+        """Shows only the connections whose name, position or location contains the text."""
+        self.beginResetModel()
+        self.search = text
+        self.rows = self.searchIndex.search(text)
+        self.loaded = min(self.PAGE_SIZE, len(self.rows))
+        self._proxyRows = None
+        self.endResetModel()
+
+    def total(self) -> int:
+        """The number of matching connections, including the ones that haven't been given to the view yet."""
+        return len(self.rows)
+
+    # --- Model Interface ----------------------------------------------------------------------------------------------
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not 0 <= row < self.loaded or column != 0:
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < len(self.rows)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        last = min(self.loaded + self.PAGE_SIZE, len(self.rows))
+        if last > self.loaded:
+            self.beginInsertRows(QModelIndex(), self.loaded, last - 1)
+            self.loaded = last
+            self.endInsertRows()
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 1
+
+    def mapToSource(self, proxyIndex):
+        if not proxyIndex.isValid():
+            return QModelIndex()
+        return self.sourceModel().index(self.rows[proxyIndex.row()], 0)
+
+    def mapFromSource(self, sourceIndex):
+        if not sourceIndex.isValid():
+            return QModelIndex()
+        if self._proxyRows is None:
+            self._proxyRows = {sourceRow: proxyRow for proxyRow, sourceRow in enumerate(self.rows)}
+        row = self._proxyRows.get(sourceIndex.row())
+        return QModelIndex() if row is None or row >= self.loaded else self.createIndex(row, 0)
@@ -2,7 +2,7 @@ from PySide2.QtWidgets import QWidget, QApplication
 from PySide2.QtGui import QPixmap, QColor
 from PySide2.QtCore import Signal, QObject, QTimer, QThreadPool
 from gui.ui.ui_instancetabwidget import Ui_Form
-from database.linkedin import LinkedInAccountDailyActivity
+from database.linkedin import LinkedInActivityLedger
 
 from common.threading import Task
 
@@ -38,9 +38,8 @@ class InstanceTabWidget(QWidget):
             color.setHsl(hue, 255, 127)
             return f"rgb({color.red()}, {color.green()}, {color.blue()});"
 
-        def update(todayRecord):
-            usedActions = todayRecord.message_count + todayRecord.connection_request_count
-            actionLimit = todayRecord.activity_limit
+        def update(activity):
+            usedActions, actionLimit = activity
 
             if usedActions < actionLimit:
                 styleSheet = f"QLabel {{color: {getColor(usedActions/actionLimit)}}}"
@@ -51,7 +50,12 @@ class InstanceTabWidget(QWidget):
             self.ui.usedActions.setStyleSheet(styleSheet)
             self.ui.activityLimit.setText(str(actionLimit))
 
-        task = Task(lambda: LinkedInAccountDailyActivity.getToday(self.client.linkedin_account.id))
+        def getActivity():
+            # Reading the ledger can roll it over to a new day, which loads the new record, so it's read here
+            ledger = LinkedInActivityLedger.forAccount(self.client.linkedin_account.id)
+            return ledger.usedActions(), ledger.activityLimit()
+
+        task = Task(getActivity)
         task.finished.connect(update)
         QThreadPool.globalInstance().start(task)
 
@@ -1,12 +1,14 @@
-import csv
 import logging
+from array import array
+from collections import namedtuple
 
-from PySide2.QtWidgets import (QWidget, QListWidgetItem, QTreeWidgetItem, QProgressDialog,
-                               QMessageBox, QDialog, QInputDialog, QFileDialog)
-from PySide2.QtCore import QThreadPool, Signal, Qt
+from PySide2.QtWidgets import QWidget, QProgressDialog, QMessageBox, QDialog, QInputDialog, QFileDialog
+from PySide2.QtCore import QThreadPool, Signal, Qt, QModelIndex
 
 from gui.logwidget import LogWidget
 from gui.filterdialog import FilterDialog
+from gui.connectionmodels import (ConnectionTableModel, SelectedConnectionsModel, ConnectionSearchModel,
+                                  streamConnectionNames)
 from gui.ui.ui_instancewidget import Ui_mainWidget
 from gui.templateeditwidget import TemplateEditWidget
 from gui.messagepreviewdialog import MessagePreviewDialog
@@ -18,10 +20,16 @@ from site_controllers.linkedin import (LinkedInMessenger, LinkedInBulkConnection
 from fake_useragent import UserAgent
 
 from common.strings import fromHTML
-from common.threading import Task
+from common.threading import Task, QueryStream
+from common.templating import TemplateCache
+from common.search import TrigramIndex, connectionDocument
 
 from database.linkedin import *
-from database.general import Session, Client
+from database.filters import ConnectionFilter
+from database.general import Session, Client, sessionScope
+
+# What the template box keeps for each template. The template itself is loaded when it's needed to send messages.
+TemplateRow = namedtuple("TemplateRow", ["id", "name", "message_template"])
 
 
 class InstanceWidget(QWidget):
@@ -63,8 +71,6 @@ class InstanceWidget(QWidget):
         self.controllerConstructor = cConstructor
         self.messagingController = None
         self.messenger = None
-        self.selectedConnections = []
-        self.allConnections = {}
         self.syncController = None
         self.synchronizer = None
         self.messagingDelayLowerBound = 5
@@ -84,6 +90,7 @@ class InstanceWidget(QWidget):
         self.ui.dailyActionLimitSpinBox.setValue(self.client.linkedin_account.getDailyActivityLimit())
         self.numTemplates = 0
         self.currentTempIndex = -1
+        self.createConnectionModels()
         self.fetchValues()
 
         # If critical login info is not available, disable headless mode.
@@ -101,52 +108,105 @@ class InstanceWidget(QWidget):
         self.gui_logger.info(f'{self.platformName} instance created for {self.client.name}')
         self.updateStatusOfMessengerButton()
 
+    def createConnectionModels(self):
+        """
+        Backs the connection lists and table with models that only load the rows that are scrolled to
+        """
+        self.allConnectionsModel = ConnectionTableModel(self.account.id, parent=self)
+        self.ui.allConnectionsList.setModel(self.allConnectionsModel)
+
+        # Replaces allConnectionsModel in the list once the connections are indexed for searching (see indexSearch)
+        self.connectionSearchModel = None
+        self.searchIndexGeneration = 0
+        self.searchIndexStream = None
+
+        # Shown in place of the selected connections while "select all" is checked, so nothing has to be copied
+        self.everyConnectionModel = ConnectionTableModel(self.account.id, parent=self)
+        self.everyConnectionModel.totalChanged.connect(self.onConnectionsCounted)
+
+        self.selectedConnectionsModel = SelectedConnectionsModel(parent=self)
+        self.ui.selectedConnectionsList.setModel(self.selectedConnectionsModel)
+
+        self.connectionsTableModel = ConnectionTableModel(
+            self.account.id,
+            columns=(LinkedInConnection.name, LinkedInConnection.location, LinkedInConnection.position),
+            headers=("Name", "Location", "Position"),
+            parent=self
+        )
+        self.ui.connectionsTable.setModel(self.connectionsTableModel)
+        self.ui.connectionsTable.sortByColumn(0, Qt.AscendingOrder)
+
     def fetchValues(self, skipTemplates=False):
         """
         Initializes connections and then initializes templates
         """
-        msg = "Fetching connections from database..."
-        prog = QProgressDialog(msg, 'Hide', 0, 0, parent=self.window())
-        prog.setModal(True)
-        prog.setWindowTitle(msg)
-        prog.show()
-
-        def populate(connections):
-            self.gui_logger.info("Populating connections...")
-            self.ui.allConnectionsList.clear()
-            self.ui.connectionsTable.clear()
-            self.ui.selectedConnectionsList.clear()
-            self.selectedConnections = []
-
-            for con in connections:
-                self.gui_logger.debug(con.name)
+        self.db_logger.info("Fetching connections from database...")
 
-                # Add to connections list for messaging
-                self.ui.allConnectionsList.addItem(con.name)
+        # Only the first page of each view is fetched here, the rest are fetched as the views are scrolled
+        self.allConnectionsModel.reload(search=self.ui.searchBox.text())
+        self.everyConnectionModel.reload()
+        self.connectionsTableModel.reload()
+        self.selectedConnectionsModel.clear()
 
-                # Add to main connections table
-                connectionItem = QTreeWidgetItem(self.ui.connectionsTable)
-                connectionItem.setText(0, con.name)
-                connectionItem.setText(1, con.location)
-                connectionItem.setText(2, con.position)
+        self.indexSearch()
 
-                self.allConnections[con.name] = con
+        if not skipTemplates:
+            self.fetchTemplates()
 
-            self.ui.allConnectionsGroupBox.setTitle(f"All Connections ({len(self.allConnections)})")
+    def onConnectionsCounted(self, total: int):
+        """Shows the number of connections once it's been counted (see ConnectionTableModel.totalChanged)"""
+        self.ui.allConnectionsGroupBox.setTitle(f"All Connections ({total})")
+        self.updateStatusOfMessengerButton()
 
-            prog.close()
+    def indexSearch(self):
+        """
+        Indexes the connections for the search box in the background: their names, positions and locations are streamed
+        in (see streamConnectionNames), then indexed on a worker thread. Until the index is ready the list is searched
+        by name in the database.
+        """
+        self.searchIndexGeneration += 1
+        generation = self.searchIndexGeneration
+
+        # The old index may have connections that are gone
+        if self.searchIndexStream is not None:
+            self.searchIndexStream.cancel()
+        if self.connectionSearchModel is not None:
+            self.ui.allConnectionsList.setModel(self.allConnectionsModel)
+            self.connectionSearchModel = None
+
+        ids = array('q')
+        names = []
+        documents = []
+
+        def addConnections(rows):
+            if generation == self.searchIndexGeneration:
+                for connection_id, name, position, location in rows:
+                    ids.append(connection_id)
+                    names.append(name or "")
+                    documents.append(connectionDocument(name, position, location))
+
+        def indexNames(done):
+            # Skip it if the connections were fetched again in the meantime, or if the query failed
+            if generation != self.searchIndexGeneration or done != len(ids):
+                return
+            self.searchIndexStream = None
+            task = Task(TrigramIndex, documents)
+            task.finished.connect(useIndex)
+            QThreadPool.globalInstance().start(task)
 
-            if not skipTemplates:
-                self.fetchTemplates()
+        def useIndex(index):
+            if generation != self.searchIndexGeneration:
+                return
 
-        self.db_logger.info(msg)
-        task = Task(lambda: Session.query(LinkedInConnection)
-                    .filter(LinkedInConnection.account_id == self.account.id)
-                    .order_by(LinkedInConnection.name))
-        task.finished.connect(populate)
-        QThreadPool.globalInstance().start(task)
+            self.connectionSearchModel = ConnectionSearchModel(ids, names, index, parent=self)
+            self.connectionSearchModel.setSearch(self.ui.searchBox.text())
+            self.ui.allConnectionsList.setModel(self.connectionSearchModel)
+            self.db_logger.info(f"Indexed {len(index)} connections for searching")
 
-        prog.exec_()
+        self.searchIndexStream = streamConnectionNames(self.account.id)
+        self.searchIndexStream.chunkReady.connect(addConnections)
+        self.searchIndexStream.finished.connect(indexNames)
+        QThreadPool.globalInstance().start(self.searchIndexStream)
 
     def fetchTemplates(self, refreshing=False):
         """
@@ -164,19 +224,25 @@ class InstanceWidget(QWidget):
         prog = QProgressDialog(msg, 'Hide', 0, 0, parent=self.window())
         prog.setModal(True)
         prog.setWindowTitle(msg)
+        prog.setAutoClose(False)
+        prog.setAutoReset(False)
         prog.show()
 
-        def populate(templates):
-            self.numTemplates = 0
-            self.ui.templatesBox.clear()
+        self.numTemplates = 0
+        self.gui_logger.info("Populating templates...")
 
-            self.gui_logger.info("Populating templates...")
+        def addTemplates(templates):
             for template in templates:
                 # TODO: Replace with actual template name when implemented in database
                 self.gui_logger.debug(str(template.id) + ': ' + template.message_template)
                 self.numTemplates += 1
                 self.addTemplate(template.name.encode('latin1').decode('unicode_escape'), template)
 
+        def showProgress(done, total):
+            prog.setMaximum(total)
+            prog.setValue(done)
+
+        def finish():
             if self.numTemplates != 0:
                 # Loads the last template
                 self.currentTempIndex = self.numTemplates-1
@@ -189,11 +255,16 @@ class InstanceWidget(QWidget):
             prog.close()
 
         self.db_logger.info(msg)
-        task = Task(lambda: Session.query(LinkedInMessageTemplate)
-                    .filter(LinkedInMessageTemplate.account_id == self.account.id,
-                            LinkedInMessageTemplate.deleted == False))
-        task.finished.connect(populate)
-        QThreadPool.globalInstance().start(task)
+        stream = QueryStream(lambda: Session.query(LinkedInMessageTemplate.id, LinkedInMessageTemplate.name,
+                                                   LinkedInMessageTemplate.message_template)
+                             .filter(LinkedInMessageTemplate.account_id == self.account.id,
+                                     LinkedInMessageTemplate.deleted == False)
+                             .order_by(LinkedInMessageTemplate.id),
+                             convert=lambda row: TemplateRow(*row))
+        stream.chunkReady.connect(addTemplates)
+        stream.progress.connect(showProgress)
+        stream.finished.connect(finish)
+        QThreadPool.globalInstance().start(stream)
 
         prog.exec_()
 
@@ -212,8 +283,8 @@ class InstanceWidget(QWidget):
 
         # self.ui.acceptConnectionRequestsBtn.clicked.connect(self.acceptConnectionRequests)
         self.ui.autoMessageButton.toggled.connect(self.autoMessage)
-        self.ui.allConnectionsList.itemClicked.connect(self.addConnectionToSelected)
-        self.ui.selectedConnectionsList.itemClicked.connect(self.removeConnectionFromSelected)
+        self.ui.allConnectionsList.clicked.connect(self.addConnectionToSelected)
+        self.ui.selectedConnectionsList.clicked.connect(self.removeConnectionFromSelected)
         # self.ui.scrapeBulkConnectionsBtn.toggled.connect(self.scrapeConnectionsInBulk)
         self.ui.selectAllBox.toggled.connect(self.selectAllConnections)
         self.ui.saveTemplateButton.clicked.connect(self.saveCurrentTemplate)
@@ -221,8 +292,8 @@ class InstanceWidget(QWidget):
         self.ui.templatesBox.currentIndexChanged.connect(self.loadTemplateAtIndex)
         self.ui.deleteTemplateButton.clicked.connect(lambda: self.deleteCurrentTemplate())  # lambda needed to fix bug
         self.ui.messageTemplateEdit.textChanged.connect(self.updateStatusOfMessengerButton)
-        self.ui.allConnectionsList.itemClicked.connect(self.updateStatusOfMessengerButton)
-        self.ui.selectedConnectionsList.itemClicked.connect(self.updateStatusOfMessengerButton)
+        self.ui.allConnectionsList.clicked.connect(self.updateStatusOfMessengerButton)
+        self.ui.selectedConnectionsList.clicked.connect(self.updateStatusOfMessengerButton)
         self.ui.selectAllBox.toggled.connect(self.updateStatusOfMessengerButton)
         # self.ui.filterConnectionsButton.clicked.connect(self.openFilterDialog)
         self.ui.uploadConnectionsCSVBtn.clicked.connect(self.parseConnectionsCSV)
@@ -237,16 +308,11 @@ class InstanceWidget(QWidget):
 
         self.ui.dailyActionLimitSpinBox.focusOutEvent = onDailyLimitUpdated
 
-        def searchConnections(partialName):
-            if self.allConnections:
-                results = [entry.text() for entry in self.ui.allConnectionsList.findItems(partialName, Qt.MatchContains)]
-                all = self.ui.allConnectionsList.findItems('', Qt.MatchContains)
-
-                for entry in all:
-                    if entry.text() in results:
-                        entry.setHidden(False)
-                    else:
-                        entry.setHidden(True)
+        def searchConnections(text):
+            if self.connectionSearchModel is not None:
+                self.connectionSearchModel.setSearch(text)
+            else:
+                self.allConnectionsModel.reload(search=text)
 
         self.ui.searchBox.textEdited.connect(searchConnections)
 
@@ -282,7 +348,7 @@ class InstanceWidget(QWidget):
             enable = False
 
         # There must be connections in the selected connections list
-        elif not self.ui.selectedConnectionsList.count():
+        elif not self.selectedConnectionCount():
             enable = False
 
         # TODO: Add condition that the template must be saved before sending it?
@@ -318,10 +384,10 @@ class InstanceWidget(QWidget):
         if start:
             self.saveCurrentTemplate()
 
-            # NOTE: Since another thread saves different objects to the database, committing forces
-            #       us to go back to the database and get the freshest version of an object
-            Session.commit()
-            template = self.ui.templatesBox.currentData()
+            # NOTE: The template was just saved by another thread, so it's loaded in a fresh unit of work (which also
+            #       gives the GUI thread's connection back to the pool)
+            with sessionScope():
+                template = Session.query(LinkedInMessageTemplate).get(self.ui.templatesBox.currentData().id)
 
             if fromHTML(template.message_template) != template.message_template:
                 self.ui.errorLabel.setText("Error: Template cannot use HTML reserved expressions.")
@@ -329,7 +395,10 @@ class InstanceWidget(QWidget):
                 startStopButton.setChecked(False)
                 return
 
-            connections = [self.allConnections[name] for name in self.selectedConnections]
+            connections = self.getSelectedConnections()
+            if connections is None:
+                startStopButton.setChecked(False)
+                return
 
             # Show a preview of the message and ask if the operator would like to proceed
             preview = MessagePreviewDialog(self, connections, template)
@@ -374,9 +443,7 @@ class InstanceWidget(QWidget):
 
         def filt(locations, numMessages):
             def populate(filteredConnections):
-                self.ui.selectedConnectionsList.clear()
-                self.selectedConnections = filteredConnections
-                self.ui.selectedConnectionsList.addItems(self.selectedConnections)
+                self.selectedConnectionsModel.setConnections(filteredConnections)
 
                 prog.close()
 
@@ -401,36 +468,21 @@ class InstanceWidget(QWidget):
 
     def filterConnectionsBy(self, locations=(False, None), maxMessages=(False, None)):
         """
-        All args are (useCriteria, value) tuples
+        All args are (useCriteria, value) tuples. Returns (id, name) pairs sorted by name.
         """
 
+        connectionFilter = ConnectionFilter(self.account.id)
+
         if locations[0]:
             self.db_logger.info("Filtering by location")
-            result = {}  # We add each connection with location in the location list
-            for location in locations[1]:
-                result.update(dict(filter(lambda tup: tup[1].location == location, self.allConnections.items())))
-        else:
-            result = self.allConnections
+            connectionFilter.byLocations(locations[1])
 
         if maxMessages[0]:
             self.db_logger.info("Filtering by max messages")
-            # This one is complicated:
-            #  Query database for messages sent to connection from the instance's account,
-            #  get the length of the returned list, and compare it to maxMessages
-            result = dict(
-                filter(lambda tup:
-                       len(
-                           list(
-                               Session.query(LinkedInMessage).filter(
-                                   LinkedInMessage.account_id == self.account.id,
-                                   LinkedInMessage.recipient_connection_id == tup[1].id
-                               )
-                           )
-                       ) < maxMessages[1], result.items()
-                )
-            )
-
-        return list(result.keys())
+            connectionFilter.byMessageCount(fewerThan=maxMessages[1])
+
+        connections = [row for page in connectionFilter.pages(LinkedInConnection.name) for row in page]
+        return sorted(connections, key=lambda row: row[1])
 
     def deleteCurrentTemplate(self, prompt=True):
         """
@@ -514,6 +566,7 @@ class InstanceWidget(QWidget):
                     templateObj = Session.query(LinkedInMessageTemplate).get(template.id)
                     templateObj.message_template = newMsg
                     Session.commit()
+                    TemplateCache.invalidate(template.id)
 
                 prog = QProgressDialog('Saving Template...', 'Hide', 0, 0, parent=self.window())
                 prog.setModal(True)
@@ -524,6 +577,9 @@ class InstanceWidget(QWidget):
                 task.finished.connect(prog.close)
                 QThreadPool.globalInstance().start(task)
 
+                savedTemplate = template._replace(message_template=newMsg.decode('latin1'))
+                self.ui.templatesBox.setItemData(self.currentTempIndex, savedTemplate)
+
                 self.db_logger.info(f"Saving {self.ui.templatesBox.itemText(self.currentTempIndex)}")
                 prog.exec_()
 
@@ -582,36 +638,77 @@ class InstanceWidget(QWidget):
     def selectAllConnections(self, checked):
         """Selects all connections to send them a message"""
         sel = self.ui.selectedConnectionsList
-        alc = self.ui.allConnectionsList
 
         if checked:
-            sel.clear()
+            sel.setModel(self.everyConnectionModel)
+            sel.setEnabled(False)
+        else:
+            sel.setModel(self.selectedConnectionsModel)
+            self.selectedConnectionsModel.clear()
+            sel.setEnabled(True)
 
-            items = []
-            for x in range(alc.count()):
-                items.append(alc.item(x))
-            self.selectedConnections = [item.text() for item in items]
+    def selectedConnectionCount(self):
+        """The number of connections that will be messaged"""
+        if self.ui.selectAllBox.isChecked():
+            return self.everyConnectionModel.total()
+        return len(self.selectedConnectionsModel)
 
-            sel.addItems(self.selectedConnections)
+    def getSelectedConnections(self):
+        """
+        Loads the connections that will be messaged. They're streamed in on a worker thread (see QueryStream) while a
+        progress dialog is shown, so selecting every connection of a big account doesn't freeze the window.
 
-            sel.setEnabled(False)
+        :return: A ConnectionSnapshot of each connection, or None if loading them was cancelled or failed
+        """
+        account_id = self.account.id
+        if self.ui.selectAllBox.isChecked():
+            def query():
+                return Session.query(*ConnectionSnapshot.columns())\
+                    .filter(LinkedInConnection.account_id == account_id)\
+                    .order_by(LinkedInConnection.name)
         else:
-            sel.clear()
-            self.selectedConnections = []
-            sel.setEnabled(True)
+            ids = list(self.selectedConnectionsModel.ids)
+
+            def query():
+                return [Session.query(*ConnectionSnapshot.columns()).filter(LinkedInConnection.id.in_(ids[i:i + 1000]))
+                        for i in range(0, len(ids), 1000)]
 
-    def addConnectionToSelected(self, connection: QListWidgetItem):
-        """Adds item to selected column, and updates local list"""
-        if connection.text() not in self.selectedConnections:
-            self.ui.selectedConnectionsList.addItem(QListWidgetItem(connection.text()))
-            self.selectedConnections.append(connection.text())
+        connections = []
+        loaded = {'total': None, 'complete': False}
 
-    def removeConnectionFromSelected(self, connection: QListWidgetItem):
-        """Removes connection from selected connections"""
-        if connection.text() in self.selectedConnections:
-            ind = self.ui.selectedConnectionsList.row(connection)
-            self.ui.selectedConnectionsList.takeItem(ind)
-            self.selectedConnections.remove(connection.text())
+        def showProgress(done, total):
+            loaded['total'] = total
+            prog.setMaximum(total)
+            prog.setValue(done)
+
+        def finish(done):
+            # Short if the stream was cancelled or the query failed
+            loaded['complete'] = not stream.cancelled and done == loaded['total']
+            prog.close()
+
+        prog = QProgressDialog('Loading the selected connections...', 'Cancel', 0, 0, parent=self.window())
+        prog.setModal(True)
+        prog.setWindowTitle('Loading...')
+
+        # Only plain snapshots of the connections reach this thread. The messenger loads them again in its own session.
+        stream = QueryStream(query, convert=lambda row: ConnectionSnapshot(*row), chunkSize=1000)
+        stream.chunkReady.connect(connections.extend)
+        stream.progress.connect(showProgress)
+        stream.finished.connect(finish)
+        prog.canceled.connect(stream.cancel)
+        QThreadPool.globalInstance().start(stream)
+
+        prog.exec_()
+        return connections if loaded['complete'] else None
+
+    def addConnectionToSelected(self, index: QModelIndex):
+        """Adds the clicked connection to the selected connections"""
+        self.selectedConnectionsModel.add(index.data(Qt.UserRole), index.data())
+
+    def removeConnectionFromSelected(self, index: QModelIndex):
+        """Removes the clicked connection from the selected connections"""
+        if not self.ui.selectAllBox.isChecked():
+            self.selectedConnectionsModel.removeRow(index.row())
 
     # --- Connections Methods ------------------------------------------------------------------------------------------
 
@@ -628,25 +725,24 @@ class InstanceWidget(QWidget):
         url = QFileDialog.getOpenFileUrl(filter='Comma Separated Values (*.csv)')[0].toString()
 
         if url:
-            with open(url[len('file:///'):], 'r', newline='', encoding='utf-8') as csvfile:
-                connections = list(csv.reader(csvfile))
+            path = url[len('file:///'):]
 
-            if connections[0][0] != 'First Name':
+            if not UploadConnectionCSV.isConnectionsExport(path):
                 QMessageBox.warning(self.window(), 'Invalid File', 'Not a valid CSV file.')
                 self.ui.scrapeIndividualConnectionsBtn.setEnabled(True)
                 self.ui.scrapeBulkConnectionsBtn.setEnabled(True)
                 return
 
-            connections.pop(0)
-
-            prog = QProgressDialog('Parsing CSV and uploading to database...', 'Hide',
-                                   0, round(len(connections)/10), self.window())
+            prog = QProgressDialog('Parsing CSV and uploading to database...', 'Hide', 0, 0, self.window())
             prog.setWindowTitle('Uploading CSV...')
-            prog.setValue(0)
             prog.setModal(True)
 
-            uc = UploadConnectionCSV(self.account.id, connections)
-            uc.packageCommitted.connect(lambda: prog.setValue(prog.value()+1))
+            def reportProgress(rowsRead, rowsPerSecond):
+                prog.setLabelText(f'Parsing CSV and uploading to database...\n'
+                                  f'{rowsRead} rows processed ({rowsPerSecond:,.0f} rows/sec)')
+
+            uc = UploadConnectionCSV(self.account.id, path)
+            uc.packageCommitted.connect(reportProgress)
 
             def cleanup(num):
                 prog.close()
@@ -704,11 +800,7 @@ class InstanceWidget(QWidget):
             self.ui.acceptConnectionRequestsBtn.setEnabled(False)
             self.ui.sendConnectionRequestsBtn.setEnabled(False)
 
-            known = [name[0] for name in
-                     Session.query(LinkedInConnection.name).filter(LinkedInConnection.account_id == self.account.id)]
-
             options = {
-                'known': known,
                 'accid': self.account.id
             }
 
@@ -769,8 +861,10 @@ class InstanceWidget(QWidget):
             self.ui.acceptConnectionRequestsBtn.setEnabled(False)
             self.ui.sendConnectionRequestsBtn.setEnabled(False)
 
-            known = [(conn.name, conn.id) for conn in
-                     Session.query(LinkedInConnection).filter(LinkedInConnection.account_id == self.account.id)]
+            with sessionScope():
+                known = [(name, conn_id) for name, conn_id in
+                         Session.query(LinkedInConnection.name, LinkedInConnection.id)
+                         .filter(LinkedInConnection.account_id == self.account.id)]
 
             syncBrowserOpts = self.opts[:]
             if self.ui.headlessBoxGeneral.isChecked():
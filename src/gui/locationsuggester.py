@@ -0,0 +1,230 @@
+import os
+import json
+import bisect
+from collections import OrderedDict
+
+import requests
+from PySide2.QtCore import QObject, QRunnable, QThreadPool, QTimer, Signal
+
+from common.beacon import Beacon
+
+# In the cache directory next to the logs, which git ignores
+CACHE_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "cache", "location_suggestions.json"))
+
+
+def normalizeQuery(text: str) -> str:
+    """Normalizes typed text for matching and caching (case and whitespace are ignored)"""
+    return " ".join(text.split()).casefold()
+
+
+class PhotonSuggestions:
+    """Gets suggestions from Photon's search API. Returns a list of (label, (latitude, longitude))."""
+
+    URL = 'http://photon.komoot.de/api'
+    TIMEOUT = 5
+
+    def __init__(self):
+        self.http = requests.Session()
+        self.http.headers['user-agent'] = 'social'
+
+    def __call__(self, text: str, limit: int) -> list:
+        response = self.http.get(self.URL, params={'q': text, 'limit': limit}, timeout=self.TIMEOUT).json()
+
+        suggestions = []
+        for feature in response['features']:
+            props = feature['properties']
+            label = ', '.join(props[part] for part in ('name', 'city', 'state', 'country')
+                              if props.get(part) and (part == 'name' or props[part] != props.get('name')))
+            lon, lat = feature['geometry']['coordinates']
+            suggestions.append((label, (lat, lon)))
+        return suggestions
+
+
+class StaticSuggestions:
+    """Suggests from a fixed dictionary of label -> (latitude, longitude). Use it to test without the network."""
+
+    def __init__(self, places: dict):
+        self.places = places
+        self.calls = 0
+
+    def __call__(self, text: str, limit: int) -> list:
+        self.calls += 1
+        query = normalizeQuery(text)
+        return [(label, point) for label, point in self.places.items() if query in normalizeQuery(label)][:limit]
+
+
+class SuggestionLookup(QRunnable):
+    """Asks the backend for suggestions on a worker thread. Emits found(generation, query, suggestions)."""
+
+    Beacon.found = Signal(int, str, object)
+
+    def __init__(self, backend, generation: int, query: str, text: str, limit: int):
+        super().__init__()
+        self.__b = Beacon(self)
+        self.backend = backend
+        self.generation = generation
+        self.query = query
+        self.text = text
+        self.limit = limit
+
+    def run(self):
+        try:
+            suggestions = self.backend(self.text, self.limit)
+        except Exception:
+            suggestions = None
+        self.found.emit(self.generation, self.query, suggestions)
+
+
+class LocationSuggester(QObject):
+    """
+    Suggests places for the text typed in a location box without ever blocking the GUI thread.
+
+    A request only starts once typing has paused for DEBOUNCE_MS. Each request is answered from the first of:
+        1. the local index of the account's own connection locations (see setLocalLocations),
+        2. the cache of earlier answers, keyed by the typed text and saved between sessions. When the text itself
+           isn't cached, the answer for a shorter prefix of it is reused if it was complete (it had fewer than LIMIT
+           suggestions, so typing more can only narrow it) and some of its suggestions still match,
+        3. the backend, called on a worker thread.
+    Starting a new request cancels the one in flight: its answer is still cached when it arrives, but it isn't emitted.
+
+    The backend is any callable taking (text, limit) and returning a list of (label, (latitude, longitude)).
+    """
+
+    suggestionsReady = Signal(str, list)  # the typed text, [(label, (latitude, longitude)), ...]
+
+    DEBOUNCE_MS = 300
+    MIN_LENGTH = 3
+    LIMIT = 5
+    CACHE_SIZE = 1000
+
+    def __init__(self, backend=None, cacheFile=CACHE_FILE, parent=None):
+        QObject.__init__(self, parent)
+        self.backend = backend or PhotonSuggestions()
+        self.cacheFile = cacheFile
+        self.cache = OrderedDict()
+        self.localIndex = []  # sorted (normalized text starting at a word of the label, label, point)
+        self.generation = 0
+        self.pendingText = ''
+
+        self.debounce = QTimer(self)
+        self.debounce.setSingleShot(True)
+        self.debounce.setInterval(self.DEBOUNCE_MS)
+        self.debounce.timeout.connect(self.lookup)
+
+        self.load()
+
+    def setLocalLocations(self, coordinates: dict):
+        """
+        Indexes the account's connection locations so they're suggested first. Every word of a location can start a
+        match, so "denver" finds "Greater Denver Area".
+
+        :param coordinates: Maps each location to its (latitude, longitude), or to None if it couldn't be found
+        """
+        index = []
+        for label, point in coordinates.items():
+            if point is None:
+                continue
+            words = normalizeQuery(label).split(' ')
+            for i in range(len(words)):
+                index.append((' '.join(words[i:]), label, point))
+        index.sort(key=lambda entry: entry[0])
+        self.localIndex = index
+
+    def request(self, text: str):
+        """Asks for suggestions for the text once typing pauses. Any request still in flight is cancelled."""
+        self.generation += 1
+        self.pendingText = text
+        self.debounce.start()
+
+    def cancel(self):
+        """Cancels the pending request, if any."""
+        self.generation += 1
+        self.debounce.stop()
+
+    def lookup(self):
+        text = self.pendingText
+        query = normalizeQuery(text)
+        if len(query) < self.MIN_LENGTH:
+            return
+
+        local = self.findLocal(query)
+        if local:
+            self.suggestionsReady.emit(text, local)
+            return
+
+        cached = self.findCached(query)
+        if cached is not None:
+            self.suggestionsReady.emit(text, cached)
+            return
+
+        lookup = SuggestionLookup(self.backend, self.generation, query, text, self.LIMIT)
+        lookup.found.connect(self.onFound)
+        QThreadPool.globalInstance().start(lookup)
+
+    def findLocal(self, query: str) -> list:
+        """Gets the indexed connection locations that have a word starting with the query."""
+        start = bisect.bisect_left(self.localIndex, (query,))
+        suggestions = []
+        for key, label, point in self.localIndex[start:]:
+            if not key.startswith(query) or len(suggestions) >= self.LIMIT:
+                break
+            if (label, point) not in suggestions:
+                suggestions.append((label, point))
+        return suggestions
+
+    def findCached(self, query: str):
+        """
+        Gets the cached suggestions for the query, or narrows down the complete suggestions cached for the longest of
+        its prefixes.
+
+        :return: The suggestions, or None if they have to be asked for
+        """
+        if query in self.cache:
+            self.cache.move_to_end(query)
+            return self.cache[query]
+
+        for end in range(len(query) - 1, self.MIN_LENGTH - 1, -1):
+            suggestions = self.cache.get(query[:end])
+            if suggestions is None:
+                continue
+            if len(suggestions) >= self.LIMIT:
+                return None  # There may have been more than the LIMIT that were returned
+            narrowed = [(label, point) for label, point in suggestions if query in normalizeQuery(label)]
+            return narrowed or None
+
+        return None
+
+    def onFound(self, generation: int, query: str, suggestions):
+        if suggestions is None:  # the backend failed, so there's nothing to cache
+            if generation == self.generation:
+                self.suggestionsReady.emit(self.pendingText, [])
+            return
+
+        suggestions = [(label, tuple(point)) for label, point in suggestions]
+        self.cache[query] = suggestions
+        self.cache.move_to_end(query)
+        while len(self.cache) > self.CACHE_SIZE:
+            self.cache.popitem(last=False)
+
+        if generation == self.generation:
+            self.suggestionsReady.emit(self.pendingText, suggestions)
+
+    def load(self):
+        """Loads the suggestions cached in earlier sessions."""
+        try:
+            with open(self.cacheFile, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        for query, suggestions in entries[-self.CACHE_SIZE:]:
+            self.cache[query] = [(label, tuple(point)) for label, point in suggestions]
+
+    def save(self):
+        """Saves the cached suggestions for the next session."""
+        try:
+            os.makedirs(os.path.dirname(self.cacheFile), exist_ok=True)
+            with open(self.cacheFile, 'w', encoding='utf-8') as f:
+                json.dump([[query, suggestions] for query, suggestions in self.cache.items()], f)
+        except OSError:
+            pass
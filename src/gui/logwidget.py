@@ -1,10 +1,30 @@
+import time
 import logging
-from PySide2.QtCore import QObject, Signal
+from collections import deque
+
+from PySide2.QtCore import QObject, QTimer, Qt, Signal
+from PySide2.QtGui import QTextCursor
+
+
+class FlushScheduler(QObject):
+    """Starts a LogWidget's timer on the GUI thread, whichever thread asks for it."""
+
+    flushRequested = Signal()
+
 
 class LogWidget(logging.Handler):
+    """
+    Shows log records in a text edit.
 
-    class Signals(QObject):
-        appendText = Signal(str)
+    Logging a record formats it (on the logging thread, so its arguments are shown as they were when it was logged, like
+    QueueHandler.prepare does) and puts the text in a ring buffer. The first record buffered starts a single shot timer
+    on the GUI thread, which appends everything buffered in one edit FLUSH_MS later, so the document is laid out once
+    per batch instead of once per record, and the timer doesn't run at all while nothing is logged. When records come in
+    faster than they're written:
+        - debug records are skipped once DEBUG_BACKLOG records are waiting,
+        - the oldest records are dropped once BUFFER_SIZE records are waiting,
+    and a single line says how many were skipped or dropped. The widget keeps the last MAX_LINES records.
+    """
 
     colorMap = {
         # -- Levels -- #
@@ -17,19 +37,101 @@ class LogWidget(logging.Handler):
         # -- Loggers are also mapped to colors in the addLogger method -- #
     }
 
+    FLUSH_MS = 100
+    BUFFER_SIZE = 2000
+    DEBUG_BACKLOG = 500
+    MAX_LINES = 5000
+
     def __init__(self, textEditWidget):
         super().__init__()
         self.widget = textEditWidget
         self.widget.setReadOnly(True)
-        self.signals = LogWidget.Signals()
-        self.signals.appendText.connect(self.widget.append)
+        self.widget.document().setMaximumBlockCount(self.MAX_LINES)
+
+        self.records = deque(maxlen=self.BUFFER_SIZE)  # (message, level name, logger name)
+        self.skipped = 0
+        self.dropped = 0
+        self.scheduled = False
+
+        # Time spent in emit, on the logging threads
+        self.emitCount = 0
+        self.emitSeconds = 0.0
+
+        self.timer = QTimer(self.widget)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.FLUSH_MS)
+        self.timer.timeout.connect(self.writeRecords)
+
+        self.scheduler = FlushScheduler(self.widget)
+        self.scheduler.flushRequested.connect(self.timer.start, Qt.QueuedConnection)
 
     def emit(self, record):
-        bgColor = LogWidget.colorMap.get(record.name, "transparent")
-        textColor = LogWidget.colorMap.get(record.levelname, "black")
-        msg = self.format(record)
-        msg = self.processMsg(msg, textColor, bgColor)
-        self.signals.appendText.emit(msg)
+        # Called with the handler's lock held (see logging.Handler.handle)
+        start = time.perf_counter()
+
+        if record.levelno <= logging.DEBUG and len(self.records) >= self.DEBUG_BACKLOG:
+            self.skipped += 1
+        else:
+            if len(self.records) == self.BUFFER_SIZE:
+                self.dropped += 1
+            try:
+                message = self.format(record)
+            except Exception:
+                self.handleError(record)
+                return
+            self.records.append((message, record.levelname, record.name))
+
+        if not self.scheduled:
+            self.scheduled = True
+            self.scheduler.flushRequested.emit()
+
+        self.emitCount += 1
+        self.emitSeconds += time.perf_counter() - start
+
+    def emitCost(self) -> float:
+        """The mean time a record spent in emit, in microseconds"""
+        return self.emitSeconds / self.emitCount * 1e6 if self.emitCount else 0.0
+
+    def writeRecords(self):
+        """Appends the buffered records to the widget in a single edit. The next record logged schedules another."""
+        self.acquire()
+        try:
+            records = list(self.records)
+            self.records.clear()
+            skipped, dropped = self.skipped, self.dropped
+            self.skipped = self.dropped = 0
+            self.scheduled = False
+        finally:
+            self.release()
+
+        if not records and not skipped and not dropped:
+            return
+
+        lines = []
+        if dropped:
+            lines.append(self.processMsg(f"... {dropped} older log messages dropped to keep up ...", "orange"))
+        for message, levelName, loggerName in records:
+            bgColor = LogWidget.colorMap.get(loggerName, "transparent")
+            textColor = LogWidget.colorMap.get(levelName, "black")
+            lines.append(self.processMsg(message, textColor, bgColor))
+        if skipped:
+            lines.append(self.processMsg(f"... {skipped} debug log messages skipped to keep up ...", "gray"))
+
+        scrollBar = self.widget.verticalScrollBar()
+        atBottom = scrollBar.value() == scrollBar.maximum()
+
+        document = self.widget.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        for line in lines:
+            if not document.isEmpty():
+                cursor.insertBlock()
+            cursor.insertHtml(line)
+        cursor.endEditBlock()
+
+        if atBottom:
+            scrollBar.setValue(scrollBar.maximum())
 
     def addLogger(self, loggerName, backgroundColor):
         if loggerName in LogWidget.colorMap:
@@ -41,4 +143,4 @@ class LogWidget(logging.Handler):
     def processMsg(self, msg, textColor, backgroundColor="transparent"):
         text = f'<span style="font-size:8pt; font-weight:400; color:{textColor}; background-color:{backgroundColor};" >{msg}</span>'
         text = text.replace("\n", "<br>")
-        return text
\ No newline at end of file
+        return text
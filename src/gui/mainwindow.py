@@ -8,7 +8,9 @@ from gui.newinstancedialog import NewInstanceDialog
 from gui.instancewidget import InstanceWidget
 from gui.logwidget import LogWidget
 
-from database.general import Session, Client
+from sqlalchemy.orm import joinedload
+
+from database.general import Session, Client, sessionScope
 
 
 class SocialView(QMainWindow):
@@ -114,4 +116,5 @@ class SocialView(QMainWindow):
     # Database stuff
     #############################
     def getClients(self) -> list:
-        return Session.query(Client).all()
+        with sessionScope():
+            return Session.query(Client).options(joinedload(Client.linkedin_account)).all()
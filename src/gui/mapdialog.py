@@ -1,25 +1,84 @@
-from PySide2.QtWidgets import QDialog, QDialogButtonBox, QApplication, QCompleter, QMessageBox
-from PySide2.QtCore import Signal
+import os
+import time
+from collections import Counter
 
+from PySide2.QtWidgets import QDialog, QDialogButtonBox, QCompleter, QMessageBox
+from PySide2.QtCore import Signal, QThreadPool, QStringListModel, Qt
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.backends.backend_qt5agg import FigureCanvas
 from matplotlib.figure import Figure
+from matplotlib.image import imread
 from matplotlib.pyplot import Circle
 
-import requests
+import numpy as np
 import cartopy.crs as crs
-from geopy.distance import distance
-from geopy.geocoders import Photon, Nominatim
+from geopy.geocoders import Nominatim
 
+from common.spatial import SpatialIndex, haversineMiles
+from common.threading import Task
+from database.geocoding import GeocodeResolver
+from gui.locationsuggester import LocationSuggester
 from gui.ui.ui_mapdialog import Ui_Dialog
 
-http = requests.Session()
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "cache"))  # next to logs, git ignored
+BASEMAP_FILE = os.path.join(CACHE_DIR, "basemap.png")
+BASEMAP_FALLBACK_FILE = os.path.join(CACHE_DIR, "basemap-without-details.png")  # when the details can't be fetched
+BASEMAP_WIDTH = 4000  # pixels; the map is twice as wide as it is tall
+DETAILS_RETRY_INTERVAL = 24 * 60 * 60  # seconds before the details are fetched again after they couldn't be
+MARKER_SIZE = 12  # area of the dot for a location with a single connection, in points^2
+
+
+def renderBasemap(path=BASEMAP_FILE, fallbackPath=BASEMAP_FALLBACK_FILE, width=BASEMAP_WIDTH):
+    """
+    Renders the world map the connections are drawn on and saves it as an image, so the tiles are only fetched once.
+    If the details can't be fetched, the map is saved without them to fallbackPath instead.
+
+    :return: The path the map was saved to
+    """
+    fig = Figure(figsize=(width / 100, width / 200), dpi=100, frameon=False)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1, projection=crs.PlateCarree(), frame_on=False)
+    ax.set_position([0, 0, 1, 1])
+    ax.set_global()
+    ax.stock_img()  # adds coloring to map
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        ax.add_wms('http://vmap0.tiles.osgeo.org/wms/vmap0', ['basic'])  # Adds details
+        fig.savefig(path, dpi=100)
+    except Exception:
+        # Without the tile server we can still save the coloring. It's saved separately so the details are tried
+        # again later (see loadBasemap).
+        path = fallbackPath
+        ax.images[-1].remove()
+        fig.savefig(path, dpi=100)
+    return path
+
+
+def loadBasemap():
+    """
+    Gets the world map image, rendering it the first time. Rendering fetches tiles from the network, so call this on a
+    worker thread.
+
+    When the details couldn't be fetched, the map without them is used for DETAILS_RETRY_INTERVAL before they're
+    fetched again, so opening the map while offline doesn't wait on the tile server every time.
+    """
+    if os.path.exists(BASEMAP_FILE):
+        return imread(BASEMAP_FILE)
+
+    if os.path.exists(BASEMAP_FALLBACK_FILE) and \
+            time.time() - os.path.getmtime(BASEMAP_FALLBACK_FILE) < DETAILS_RETRY_INTERVAL:
+        return imread(BASEMAP_FALLBACK_FILE)
+
+    return imread(renderBasemap())
 
 
 class MapDialog(QDialog):
 
     foundLocations = Signal(list)
 
-    def __init__(self, parent, locations: list):
+    def __init__(self, parent, locations: list, resolver: GeocodeResolver = None):
         QDialog.__init__(self, parent)
 
         self.ui = Ui_Dialog()
@@ -30,18 +89,27 @@ class MapDialog(QDialog):
         self.circle = None
         self.maxRadius = 110
         self.mapwidget = None
-        self.nameToPoint = {}
+        self.connectionLayer = None
+        self.spatialIndex = SpatialIndex([], [], [])
         self.background = None
         self.ax = None
         self.oldMiles = None
         self.movingSlider = False
-        self.oldText = ''
         self.locDict = {}
 
-        # Photon is made to handle realtime search, Nominatim bans you for it (speaking from experience)
-        # Nominatim has much better reversing though
-        self.locate = Photon().geocode
+        # Photon is made to handle realtime search, Nominatim bans you for it (speaking from experience), so the resolver
+        # geocodes with Photon. Nominatim has much better reversing though
         self.reverse = Nominatim(user_agent='Social').reverse
+        self.resolver = resolver or GeocodeResolver()
+
+        # Suggestions for the location box, with the account's own locations suggested first
+        self.suggester = LocationSuggester(parent=self)
+        self.suggestions = {}
+        self.completerModel = QStringListModel(self)
+        self.completer = QCompleter(self.completerModel, self)
+        self.completer.setCaseSensitivity(Qt.CaseInsensitive)
+        self.completer.setFilterMode(Qt.MatchContains)
+        self.ui.locationEdit.setCompleter(self.completer)
 
         # Interaction variables
         self.dragging = False
@@ -69,47 +137,117 @@ class MapDialog(QDialog):
 
         ax = fig.add_subplot(1, 1, 1, projection=crs.PlateCarree(), frame_on=False)  # adds the map
         self.ax = ax
-        ax.stock_img()  # adds coloring to map
-        ax.add_wms('http://vmap0.tiles.osgeo.org/wms/vmap0', ['basic'])  # Adds details
+        ax.set_global()
         for spine in ax.spines.values():  # Removes black axes borders
             spine.set_visible(False)
         ax.set_position([0, 0, 1, 1])  # Removes frame
 
-        locs = self.allLocations
-
         # Counting how many people are in each area
-        for loc in locs:
-            name = loc  # loc is a (name, ) tuple, so we just get the name out of it from the 0th position
-            if name in self.locDict.keys():
-                self.locDict[name] += 1
-            else:
-                self.locDict[name] = 1
+        self.locDict = dict(Counter(self.allLocations))
 
-        # Add locations to map
-        for loc, num in self.locDict.items():
-            location = self.locate(loc, timeout=1000)
-            lon, lat = location.longitude, location.latitude
+        self.ui.locationLayout.addWidget(self.mapwidget, 0, 1)
 
-            # Dot size grows with number of connections at that location.
-            # Also, dots are translucent in order to see multiple close points better
-            point = Circle((lon, lat), radius=1 + .2 * num, color='red', alpha=.75)
+        # The world map is drawn under the connections once it's loaded (rendering it the first time takes a while)
+        task = Task(loadBasemap)
+        task.finished.connect(self.showBasemap)
+        QThreadPool.globalInstance().start(task)
 
-            self.nameToPoint[loc] = point
-            self.ax.add_artist(point)
+        # Geocode the locations off of the GUI thread. Only locations that have never been seen before are sent to the
+        # geocoder, everything else comes straight from the geocode cache in the database.
+        task = Task(self.resolver.resolve, list(self.locDict))
+        task.finished.connect(self.plotLocations)
+        QThreadPool.globalInstance().start(task)
 
-        self.ui.locationLayout.addWidget(self.mapwidget, 0, 1)
+    def showBasemap(self, image):
+        """Draws the world map image (see loadBasemap) under everything else on the map."""
+        self.ax.imshow(image, origin='upper', extent=[-180, 180, -90, 90], transform=crs.PlateCarree(), zorder=0)
+        self.ax.set_global()
+        self.refreshBackground()
+
+    def plotLocations(self, coordinates: dict):
+        """
+        Draws a dot on the map for each location that was found. All of the dots are a single scatter collection.
+
+        :param coordinates: Maps each location to its (latitude, longitude), or to None if it couldn't be found
+        """
+        found = [loc for loc, point in coordinates.items() if point is not None]
+        self.spatialIndex = SpatialIndex(found,
+                                         [coordinates[loc][0] for loc in found],
+                                         [coordinates[loc][1] for loc in found],
+                                         [self.locDict[loc] for loc in found])
+
+        offsets = np.column_stack([self.spatialIndex.longitudes, self.spatialIndex.latitudes])
+        if self.connectionLayer is None:
+            # Dots are translucent in order to see multiple close points better
+            self.connectionLayer = self.ax.scatter(offsets[:, 0], offsets[:, 1], color='red', alpha=.75, linewidths=0,
+                                                   transform=crs.PlateCarree(), zorder=2)
+        else:
+            self.connectionLayer.set_offsets(offsets)
+
+        self.suggester.setLocalLocations(coordinates)
+        self.updateCounts()
+
+    def updateCounts(self, counts: dict = None):
+        """
+        Resizes the dots to match the number of connections at each location, without recreating the dots.
+
+        :param counts: Maps locations to their new number of connections. Defaults to the counts already known.
+        """
+        if counts:
+            self.locDict.update(counts)
+            self.spatialIndex.counts = np.array([self.locDict[loc] for loc in self.spatialIndex.names], dtype=int)
+
+        if self.connectionLayer is not None:
+            # Dot area grows with number of connections at that location
+            self.connectionLayer.set_sizes(MARKER_SIZE * (1 + .2 * self.spatialIndex.counts))
+        self.refreshBackground()
+
+    def refreshBackground(self):
+        """Redraws the map and captures it (without the selection) as the background for blitting."""
+        if not self.point:
+            self.mapwidget.draw_idle()
+            return
+
+        self.point.set_visible(False)
+        self.circle.set_visible(False)
+        self.mapwidget.draw()
+        self.background = self.mapwidget.copy_from_bbox(self.ax.bbox)
+        self.point.set_visible(True)
+        self.circle.set_visible(True)
+        self.redrawSelection()
+
+    def redrawSelection(self):
+        """Draws the selection circle over the cached background. This is the only drawing done while dragging."""
+        self.mapwidget.restore_region(self.background)
+        self.ax.draw_artist(self.point)
+        self.ax.draw_artist(self.circle)
+        self.mapwidget.blit(self.ax.bbox)
+
+    def moveSelection(self, x, y):
+        """Moves the selection circle to (x, y), creating it the first time a location is selected."""
+        if not self.point:
+            self.background = self.mapwidget.copy_from_bbox(self.ax.bbox)
+            self.ui.radiusSlider.setEnabled(True)
+            self.ui.buttonBox.button(QDialogButtonBox.Ok).setEnabled(True)
+            self.ui.radiusBox.setEnabled(True)
+            self.point = Circle((x, y), .5, color='#0381ab')
+            self.circle = Circle((x, y), self.radius, color='#05abe3', alpha=0.5)
+            self.ax.add_artist(self.circle)
+            self.ax.add_artist(self.point)
+        else:
+            self.circle.center = self.point.center = x, y
+
+        self.redrawSelection()
+        self.updateMiles()
 
     def connectSignals(self):
 
         # Connecting slider to circle radius and radius box
         def sliderMoved(newVal):
             self.movingSlider = True
-            self.mapwidget.restore_region(self.background)
             self.updateRadius(newVal)
             self.circle.radius = self.radius
-            self.ax.draw_artist(self.point)
-            self.ax.draw_artist(self.circle)
-            self.mapwidget.blit(self.ax.bbox)
+            self.redrawSelection()
 
             self.updateMiles()
             self.movingSlider = False
@@ -121,56 +259,37 @@ class MapDialog(QDialog):
             if self.oldMiles and not self.dragging and not self.movingSlider:
                 self.radius = min(newVal/self.oldMiles * self.radius, self.maxRadius)
                 self.oldMiles = newVal
-                self.mapwidget.restore_region(self.background)
                 self.circle.radius = self.radius
-                self.ax.draw_artist(self.point)
-                self.ax.draw_artist(self.circle)
-                self.mapwidget.blit(self.ax.bbox)
+                self.redrawSelection()
 
         self.ui.radiusBox.valueChanged.connect(spinboxChanged)
 
-        # Connecting edited text to a new location on map
+        # Connecting edited text to suggested locations. The suggester answers asynchronously, so typing never waits on
+        # the network.
         def locationEdited(newText):
-            if len(newText) > 5 and newText != self.oldText[:-1]:
-                r = http.get('http://photon.komoot.de/api',
-                             params={'q': newText,
-                                     'limit': 5},
-                             headers={'user-agent': 'social'}
-                             ).json()
-
-                # ------ This part is for suggestion, but it doesn't work yet -------
-                # s = []  # list of suggestions
-                # for feature in r['features']:  # Only getting the first 5 suggestions, maximum
-                #     props = feature['properties']
-                #     city = props.get('city')
-                #     state = props.get('state')
-                #     country = props.get('country')
-                #     stg = ''
-                #     if city:
-                #         stg += city + ', '
-                #     if state:
-                #         stg += state + ', '
-                #     stg += country
-                #     s.append(stg)
-
-                # comp = QCompleter(s)
-                # self.ui.locationEdit.setCompleter(comp)
-
-                center = tuple(r['features'][0]['geometry']['coordinates'])
-
-                if center:
-                    self.ui.errorLabel.hide()
-                    self.point.center = center
-                    self.circle.center = center
-                    self.mapwidget.restore_region(self.background)
-                    self.ax.draw_artist(self.point)
-                    self.ax.draw_artist(self.circle)
-                    self.mapwidget.blit(self.ax.bbox)
-                else:
-                    self.ui.errorLabel.show()
-
-            self.oldText = newText
+            self.suggester.request(newText)
+
+        def suggestionsReady(text, suggestions):
+            if text != self.ui.locationEdit.text():
+                return
 
+            self.suggestions = dict(suggestions)
+            self.completerModel.setStringList(list(self.suggestions))
+
+            if suggestions:
+                self.ui.errorLabel.hide()
+                lat, lon = suggestions[0][1]
+                self.moveSelection(lon, lat)
+            else:
+                self.ui.errorLabel.show()
+
+        def suggestionChosen(label):
+            if label in self.suggestions:
+                lat, lon = self.suggestions[label]
+                self.moveSelection(lon, lat)
+
+        self.suggester.suggestionsReady.connect(suggestionsReady)
+        self.completer.activated[str].connect(suggestionChosen)
         self.ui.locationEdit.textEdited.connect(locationEdited)
 
         # Connect signals in the map area
@@ -181,25 +300,8 @@ class MapDialog(QDialog):
         # Button pressed
         def onpress(event):
             if event.button == 1:  # a left click
-                if not self.point:
-                    self.background = self.mapwidget.copy_from_bbox(self.ax.bbox)
-                    self.ui.radiusSlider.setEnabled(True)
-                    self.ui.buttonBox.button(QDialogButtonBox.Ok).setEnabled(True)
-                    self.ui.radiusBox.setEnabled(True)
-                    self.point = Circle((event.xdata, event.ydata), .5, color='#0381ab')
-                    self.circle = Circle((event.xdata, event.ydata), self.radius, color='#05abe3', alpha=0.5)
-                    self.ax.add_artist(self.circle)
-                    self.ax.add_artist(self.point)
-
-                    self.updateMiles()
-                else:
-                    self.mapwidget.restore_region(self.background)
-                    self.circle.center = self.point.center = event.xdata, event.ydata
-
+                self.moveSelection(event.xdata, event.ydata)
                 self.dragging = True
-                self.ax.draw_artist(self.point)
-                self.ax.draw_artist(self.circle)
-                self.mapwidget.blit(self.ax.bbox)
 
         # Mouse moved
         def onmove(event):
@@ -207,11 +309,8 @@ class MapDialog(QDialog):
                 x = event.xdata if event.xdata else self.point.center[0]
                 y = event.ydata if event.ydata else self.point.center[1]
 
-                self.mapwidget.restore_region(self.background)
                 self.circle.center = self.point.center = x, y
-                self.ax.draw_artist(self.point)
-                self.ax.draw_artist(self.circle)
-                self.mapwidget.blit(self.ax.bbox)
+                self.redrawSelection()
 
                 # We also want to recalculate the radius
                 self.updateMiles()
@@ -223,11 +322,8 @@ class MapDialog(QDialog):
                 y = event.ydata if event.ydata else self.point.center[1]
 
                 self.dragging = False
-                self.mapwidget.restore_region(self.background)
                 self.circle.center = self.point.center = x, y
-                self.ax.draw_artist(self.point)
-                self.ax.draw_artist(self.circle)
-                self.mapwidget.blit(self.ax.bbox)
+                self.redrawSelection()
 
                 self.updateMiles()
 
@@ -250,35 +346,24 @@ class MapDialog(QDialog):
         topedge = (self.point.center[1] + self.radius, self.point.center[0])
         botedge = (self.point.center[1] - self.radius, self.point.center[0])
         if topedge[0] < 90:
-            dist = round(distance(center, topedge).miles)
+            dist = round(haversineMiles(*center, *topedge))
         elif botedge[0] > -90:
-            dist = round(distance(center, botedge).miles)
+            dist = round(haversineMiles(*center, *botedge))
         else:
             dist = 7590
         self.ui.radiusBox.setValue(dist)
         self.oldMiles = dist
 
     def accept(self):
-        # Get all points below the circle
-        locations = []
-        cc = self.circle.center
-
-        for name, point in self.nameToPoint.items():
-            pc = point.center
-
-            # If point is within circle
-            if (pc[0] - cc[0]) ** 2 + (pc[1] - cc[1]) ** 2 <= self.radius ** 2:
-                locations.append(name)
+        # Get all locations within the selected number of miles of the center of the circle
+        lon, lat = self.circle.center
+        locations, totConns = self.spatialIndex.within(lat, lon, self.ui.radiusBox.value())
 
         if not locations:
             QMessageBox.warning(self, 'No connections in area',
                                 'No connections were found in the selected area.\nPlease select a valid area.')
             return
 
-        totConns = 0
-        for lc in locations:
-            totConns += self.locDict[lc]
-
         try:
             locStr = self.reverse(self.point.center[::-1], zoom=10, timeout=1000).raw['display_name']
         except TypeError:
@@ -290,6 +375,11 @@ class MapDialog(QDialog):
         self.foundLocations.emit(info)
         QDialog.accept(self)
 
+    def done(self, result):
+        self.suggester.cancel()
+        self.suggester.save()
+        QDialog.done(self, result)
+
 
 # if __name__ == '__main__':
 #     app = QApplication()
@@ -1,8 +1,14 @@
-from PySide2.QtWidgets import QDialog, QListWidgetItem, QDialogButtonBox, QMessageBox
+from collections import Counter
+
+from PySide2.QtWidgets import QDialog, QDialogButtonBox, QMessageBox
+from PySide2.QtCore import QAbstractListModel, QModelIndex, QThreadPool
 from PySide2.QtGui import Qt, QIcon
 
+from common.templating import RenderCache
+from common.threading import Task
 from database.general import Session
-from database.linkedin import LinkedInConnection, LinkedInMessageTemplate
+from database.indexes import SentMessageIndex
+from database.linkedin import LinkedInMessageTemplate
 
 from gui.ui.ui_messagepreviewdialog import Ui_Dialog
 from gui.templateeditwidget import TemplateEditWidget
@@ -13,8 +19,123 @@ UNAPPROVED = 2
 INVALID = 3
 ALREADY_SENT = 4
 
+STATUS_ICONS = {
+    APPROVED: ":/icon/resources/icons/checkmark.png",
+    UNAPPROVED: ":/icon/resources/icons/warning.png",
+    INVALID: ":/icon/resources/icons/error.png",
+    ALREADY_SENT: ":/icon/resources/icons/disclaimer.png",
+}
+
+
+def classifyMessages(connections, template_id: int):
+    """
+    Classifies the template's message to every connection, in bulk: the messages already sent with the template come
+    from one query (see SentMessageIndex), and the template is compiled once and rendered for each connection through
+    the RenderCache, which the messenger then reuses when it sends them. This takes a while for big selections, so run
+    it on a worker thread.
+
+    :return: (template, connections sorted by name, their statuses)
+    """
+    template = Session.query(LinkedInMessageTemplate).get(template_id)
+    connections = sorted(connections, key=lambda connection: connection.name or "")
+    statuses = bytearray(len(connections))
+
+    RenderCache.reserve(len(connections))  # Keep every render until the messages are sent
+    sentMessages = SentMessageIndex.forTemplates(template.id)
+    for row, connection in enumerate(connections):
+        if sentMessages.wasSent(connection.id, template.id):
+            statuses[row] = ALREADY_SENT
+        elif not template.renderFor(connection).isValid:
+            statuses[row] = INVALID
+        else:
+            statuses[row] = UNAPPROVED
+
+    return template, connections, statuses
+
+
+class MessagePreviewModel(QAbstractListModel):
+    """
+    The status of a template's message for every targeted connection, as classified by classifyMessages.
+
+    The number of connections with each status is kept as statuses change, so questions like "are they all invalid?"
+    don't rescan anything. The view is only given PAGE_SIZE rows at a time as it's scrolled, so previewing thousands of
+    connections opens as fast as previewing a few.
+    """
+
+    PAGE_SIZE = 200
+
+    def __init__(self, connections, template, statuses: bytearray, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self.template = template
+        self.connections = connections
+        self.statuses = statuses
+        self.counts = Counter(statuses)
+        self.loaded = 0
+        self.icons = {status: QIcon(path) for status, path in STATUS_ICONS.items()}
+
+    def __len__(self):
+        return len(self.connections)
+
+    def status(self, row: int) -> int:
+        return self.statuses[row]
+
+    def approve(self, row: int):
+        """Marks the message to the connection as seen by the operator (only unapproved messages can be approved)."""
+        if self.statuses[row] == UNAPPROVED:
+            self.statuses[row] = APPROVED
+            self.counts[UNAPPROVED] -= 1
+            self.counts[APPROVED] += 1
+            if row < self.loaded:
+                index = self.index(row)
+                self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def message(self, row: int) -> str:
+        """The message the connection would receive (rendered when the template was classified, so it's cached)."""
+        return self.template.renderFor(self.connections[row]).text
+
+    def firstRowWith(self, status: int):
+        """Gets the first row with the status, or None if there isn't one."""
+        row = self.statuses.find(bytes([status]))
+        return None if row == -1 else row
+
+    def loadUpTo(self, row: int):
+        """Makes sure the row has been given to the view."""
+        while self.loaded <= row and self.canFetchMore():
+            self.fetchMore()
+
+    # --- Model Interface ----------------------------------------------------------------------------------------------
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.connections[index.row()].name
+        if role == Qt.DecorationRole:
+            return self.icons[self.statuses[index.row()]]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < len(self.connections)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        last = min(self.loaded + self.PAGE_SIZE, len(self.connections))
+        self.beginInsertRows(QModelIndex(), self.loaded, last - 1)
+        self.loaded = last
+        self.endInsertRows()
+
 
 class MessagePreviewDialog(QDialog):
+    """
+    Shows the message each targeted connection would receive, and what's wrong with the ones that can't be sent.
+
+    The messages are classified on a worker thread (see classifyMessages). The dialog opens right away and the list is
+    filled in once they have been.
+    """
 
     def __init__(self, parent, targetedConnections, template):
         QDialog.__init__(self, parent=parent)
@@ -22,14 +143,9 @@ class MessagePreviewDialog(QDialog):
         self.ui = Ui_Dialog()
         self.ui.setupUi(self)
 
-        connections = [conn.id for conn in targetedConnections]
-        self.targetedConnections = Session.query(LinkedInConnection)\
-            .filter(LinkedInConnection.id.in_(connections))\
-            .limit(100)\
-            .from_self()\
-            .order_by(LinkedInConnection.name)
-        self.messageStatuses = {connection: None for connection in self.targetedConnections}
-        self.template = Session.query(LinkedInMessageTemplate).get(template.id)
+        self.template = None
+        self.messages = None
+        self.targetedConnectionsExist = False
 
         newTemplateEdit = TemplateEditWidget(spellCheckEnabled=False, placeholderEnabled=False)
         newTemplateEdit.setReadOnly(True)
@@ -37,54 +153,40 @@ class MessagePreviewDialog(QDialog):
         self.ui.verticalLayout.replaceWidget(self.ui.messagePreviewEdit, newTemplateEdit)
         self.ui.messagePreviewEdit = newTemplateEdit
 
-        self.ui.targetedConnectionsList.currentItemChanged.connect(self.onChange)
-
-        firstInvalidMessage = None
-        firstMessage = None
-        self.targetedConnectionsExist = False
-        for connection in self.targetedConnections:
-            self.targetedConnectionsExist = True
-            item = QListWidgetItem()
-            item.setText(connection.name)
-            item.setData(Qt.UserRole, connection)
-
-            if not firstMessage:
-                firstMessage = item
+        self.ui.buttonBox.button(QDialogButtonBox.Yes).setEnabled(False)
+        self.ui.messagePreviewEdit.setText(f"Checking the messages to {len(targetedConnections)} connections...")
 
-            if self.template.id in [message.template_id for message in connection.messages]:
-                self.messageStatuses[connection] = ALREADY_SENT
-                item.setIcon(QIcon(":/icon/resources/icons/disclaimer.png"))
+        task = Task(classifyMessages, targetedConnections, template.id)
+        task.finished.connect(self.onClassified)
+        QThreadPool.globalInstance().start(task)
 
-            elif not self.template.isValid(connection):
-                self.messageStatuses[connection] = INVALID
-                item.setIcon(QIcon(":/icon/resources/icons/error.png"))
-
-                if firstInvalidMessage is None:
-                    firstInvalidMessage = item
+        self.show()
 
-            else:
-                self.messageStatuses[connection] = UNAPPROVED
-                item.setIcon(QIcon(":/icon/resources/icons/warning.png"))
+    def onClassified(self, classified):
+        template, connections, statuses = classified
+        self.template = template
+        self.messages = MessagePreviewModel(connections, template, statuses, parent=self)
+        self.targetedConnectionsExist = len(self.messages) > 0
 
-            self.ui.targetedConnectionsList.addItem(item)
+        self.ui.targetedConnectionsList.setModel(self.messages)
+        self.ui.targetedConnectionsList.selectionModel().currentChanged.connect(self.onChange)
 
         # select the first message that is invalid to show the operator what might be wrong.
-        if firstInvalidMessage:
-            selectedItem = firstInvalidMessage
-        else:
-            selectedItem = firstMessage
-
-        self.ui.targetedConnectionsList.setCurrentItem(selectedItem)
+        if self.targetedConnectionsExist:
+            selectedRow = self.messages.firstRowWith(INVALID)
+            if selectedRow is None:
+                selectedRow = 0
+            self.messages.loadUpTo(selectedRow)
+            self.ui.targetedConnectionsList.setCurrentIndex(self.messages.index(selectedRow))
         self.populateMessagePreview()
 
-        self.show()
-
         if self.allMessagesAreInvalid():
-            self.ui.buttonBox.button(QDialogButtonBox.Yes).setEnabled(False)
             QMessageBox.critical(self.window(), "Invalid Messages", "This message is undeliverable to all selected connections.")
+            return
 
+        self.ui.buttonBox.button(QDialogButtonBox.Yes).setEnabled(True)
 
-        elif self.allMessagesHaveBeenSent():
+        if self.allMessagesHaveBeenSent():
             QMessageBox.critical(self.window(), "Already Sent", "This message has already been sent to each targeted connection.")
 
         elif self.containsInvalidMessages():
@@ -100,64 +202,39 @@ class MessagePreviewDialog(QDialog):
         prefix = ""
         suffix = ""
 
-        if not self.targetedConnectionsExist:
-            pass
-        else:
-            connection = self.ui.targetedConnectionsList.currentItem().data(Qt.UserRole)
-            message = self.template.fill(connection)
+        current = self.ui.targetedConnectionsList.currentIndex()
+        if self.targetedConnectionsExist and current.isValid():
+            message = self.messages.message(current.row())
 
-            if self.messageStatuses[connection] == ALREADY_SENT:
+            if self.messages.status(current.row()) == ALREADY_SENT:
                 prefix = "ALREADY SENT:"
-            elif self.messageStatuses[connection] == INVALID:
+            elif self.messages.status(current.row()) == INVALID:
                 prefix = "INVALID:"
 
         if prefix:
             prefix = f'<span style="color: cyan"><strong>{prefix}</strong></span><br><br>'
         self.ui.messagePreviewEdit.setText(f"{prefix}{message}{suffix}")
 
-    def onChange(self, currentItem, previousItem):
-
-        def approve(item):
-            connection = item.data(Qt.UserRole)
-            status = self.messageStatuses[connection]
-            if status == UNAPPROVED:
-                self.messageStatuses[connection] = APPROVED
-                item.setIcon(QIcon(":/icon/resources/icons/checkmark.png"))
+    def onChange(self, current, previous):
 
-        if currentItem:
-            approve(currentItem)
-        if previousItem:
-            approve(previousItem)
+        if current.isValid():
+            self.messages.approve(current.row())
+        if previous.isValid():
+            self.messages.approve(previous.row())
 
         self.populateMessagePreview()
 
     def invalidCount(self):
-        count = 0
-        for status in self.messageStatuses.values():
-            if status == INVALID:
-                count += 1
-        return count
+        return self.messages.counts[INVALID]
 
     def containsInvalidMessages(self):
-        for status in self.messageStatuses.values():
-            if status == INVALID:
-                return True
-        return False
+        return self.messages.counts[INVALID] > 0
 
     def allMessagesAreInvalid(self):
-        for status in self.messageStatuses.values():
-            if status != INVALID:
-                return False
-        return True
+        return self.messages.counts[INVALID] == len(self.messages)
 
     def allMessagesHaveBeenSent(self):
-        for status in self.messageStatuses.values():
-            if status != ALREADY_SENT:
-                return False
-        return True
+        return self.messages.counts[ALREADY_SENT] == len(self.messages)
 
     def containsValidConnectionMessage(self):
-        for status in self.messageStatuses.values():
-            if status == APPROVED or status == UNAPPROVED:
-                return True
-        return False
\ No newline at end of file
+        return self.messages.counts[APPROVED] + self.messages.counts[UNAPPROVED] > 0
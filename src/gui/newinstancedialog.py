@@ -5,6 +5,8 @@ from gui.ui.ui_newinstancedialog import Ui_Dialog
 from gui.instancewidget import InstanceWidget
 from gui.newclientdialog import NewClientDialog
 
+from sqlalchemy.orm import joinedload
+
 from common.threading import Task
 from database.general import Session, Client
 from site_controllers.linkedin import LinkedInController
@@ -94,7 +96,8 @@ class NewInstanceDialog(QDialog):
 
             prog.close()
 
-        task = Task(lambda: Session.query(Client).all())
+        # The accounts are loaded with the clients so they can be used once the task's session is gone
+        task = Task(lambda: Session.query(Client).options(joinedload(Client.linkedin_account)).all())
         task.finished.connect(populate)
         QThreadPool.globalInstance().start(task)
         prog.show()
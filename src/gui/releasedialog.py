@@ -11,6 +11,7 @@ from database.linkedin import LinkedInAccount
 
 from common.threading import Task
 from common.version import uploadInstaller, getCurrentVersion, getCommitMessagesSince, setVersion, addVersionTagToLastCommit
+from common.version import installerPath, fileChecksum
 
 versionFile = os.path.abspath('version.txt')
 changeLogFile = os.path.abspath('changelog.txt')
@@ -107,6 +108,7 @@ class ReleaseDialog(QDialog):
                 version.active = None
             # Create new active version.
             v = database.general.Version(semantic_id=str(self.target_version), change_log=self.ui.changeLogEdit.toPlainText(), active=True)
+            v.checksum = fileChecksum(installerPath(self.target_version))  # Lets clients verify their download
             database.general.Session.add(v)
             database.general.Session.commit()
 
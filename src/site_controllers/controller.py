@@ -13,6 +13,7 @@ from selenium.webdriver.chrome.options import Options
 
 from site_controllers.exceptions import *
 from common.beacon import Beacon
+from common.sync import waitUntil, Backoff
 
 
 class Controller(AbstractBaseClass):
@@ -27,6 +28,7 @@ class Controller(AbstractBaseClass):
 
     IMPLICIT_WAIT = 1
     HIGHLIGHT_ENABLED = True
+    STOP_TIMEOUT = 30  # The most seconds to wait for the browser to close
 
     def __init__(self, profile_name: str, email: str, password: str, browser: str = "Chrome", options: Iterable[str] = ()):
         """
@@ -108,8 +110,9 @@ class Controller(AbstractBaseClass):
             self.isStopping = True
             self.browser.quit()
 
-            while self.isRunning:
-                pass
+            # Every check is a request to the web driver, so they're spaced out
+            if not waitUntil(lambda: not self.isRunning, timeout=Controller.STOP_TIMEOUT, backoff=Backoff(0.1, 1)):
+                self.warning("The browser didn't close in time")
             self.browser = None
 
             self.info("Stopped browser")
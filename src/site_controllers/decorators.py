@@ -4,6 +4,7 @@ import time
 from subprocess import check_output
 import common.authenticate as inst
 from ping3 import ping
+from database.general import sessionScope
 
 
 def ensure_browser_is_running(func):
@@ -68,10 +69,21 @@ def finish_executing(func):
 
     @wraps(func)
     def wrapper(*args, **kwargs):
-        inst.Lock = True
-        x = func(*args, **kwargs)
-        inst.Lock = False
-        return x
+        with inst.Critical:
+            return func(*args, **kwargs)
+
+    return wrapper
+
+def unit_of_work(func):
+    """
+    Runs the function inside a database unit of work. When called from a task that already opened one, the function
+    simply joins it.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with sessionScope():
+            return func(*args, **kwargs)
 
     return wrapper
 
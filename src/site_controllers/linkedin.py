@@ -1,7 +1,12 @@
 import os
+import csv
 import sys
 import html
+import time
+import threading
 import logging
+import logging.handlers
+from itertools import islice
 from datetime import timedelta, datetime
 from dateutil.parser import parse
 
@@ -19,16 +24,20 @@ from site_controllers.exceptions import *
 from site_controllers.decorators import *
 from emails import PinValidator
 
-from common.logging import initial_timestamp, LOG_FILES_DIR
+from common.logging import (initial_timestamp, LOG_FILES_DIR, MAX_LOG_BYTES, LOG_BACKUPS, QueuedHandler,
+                            compressRotations)
 from common.strings import onlyAplhaNumeric, equalTo, fromHTML, xpathConcat
 from common.datetime import convertToDate, convertToTime, combineDateAndTime
 from common.waits import random_uniform_wait, send_keys_at_irregular_speed, necessary_wait
 from common.beacon import Beacon
+from common.locations import parseLocation
 from common.threading import Task as ncTask
+from common.sync import waitUntil, Backoff
 
-from database.general import Session
+from database.general import Session, sessionScope, releaseConnection, BulkUpdateBuffer
+from database.indexes import SentMessageIndex, ConnectionIndex, normalizeName
 from database.linkedin import (LinkedInMessage, LinkedInConnection, LinkedInMessageTemplate,
-                               LinkedInAccountDailyActivity, LinkedInAccount)
+                               LinkedInAccountDailyActivity, LinkedInAccount, LinkedInActivityLedger)
 
 
 #########################################################
@@ -107,6 +116,9 @@ class LinkedInController(Controller):
 
     CRITICAL_LOGIN_INFO = ("email", "password")
 
+    REFRESH_BATCH_SIZE = 50  # connections
+    REFRESH_BATCH_AGE = timedelta(minutes=2)
+
     @log_exceptions
     def __init__(self, *args, **kwargs):
         """Initializes LinkedIn Controller"""
@@ -129,7 +141,9 @@ class LinkedInController(Controller):
         format_str = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         noname_format_str = '%(asctime)s - %(levelname)s - %(message)s'
 
-        filehandler = logging.FileHandler(filename, encoding='UTF-8', delay=True)
+        # Written and rotated on the logging thread, so debug logging in the scraping loops never waits on the disk
+        filehandler = compressRotations(logging.handlers.RotatingFileHandler(
+            filename, maxBytes=MAX_LOG_BYTES, backupCount=LOG_BACKUPS, encoding='UTF-8', delay=True))
         filehandler.setFormatter(logging.Formatter(noname_format_str))
 
         stdout = logging.StreamHandler(sys.stdout)
@@ -137,7 +151,7 @@ class LinkedInController(Controller):
 
         self._loggerName = f"controller.linkedin.{alphaNumericName}"
         self._logger = logging.getLogger(self._loggerName)
-        self._logger.addHandler(filehandler)
+        self._logger.addHandler(QueuedHandler(filehandler))
         self._logger.addHandler(stdout)
         self._logger.setLevel(logging.DEBUG)
 
@@ -211,8 +225,7 @@ class LinkedInController(Controller):
                 self.warning(f"Waiting for credentials to be entered manually for {self._profile_name}")
                 header = self.browser.find_element_by_class_name(EIS.login_header)
                 self.setInnerText(header, f"Please login for {self._profile_name}")
-                while not self.auth_check():
-                    necessary_wait(1)
+                waitUntil(self.auth_check, backoff=Backoff(1, 1))
                 self.warning(f"Not waiting anymore")
             else:
                 self.info("Submitting login request")
@@ -235,13 +248,12 @@ class LinkedInController(Controller):
             # Determine if it's asking for a pin
             pin_inputs = self.browser.find_elements_by_id(EIS.pin_verification_input)
             if pin_inputs:
-                entered = False
+                entered = threading.Event()
 
                 def enterPIN(pin):
-                    nonlocal entered
                     self.debug(f"Retrieved PIN: {pin}")
                     pin_inputs[0].send_keys(pin + Keys.RETURN)
-                    entered = True
+                    entered.set()
 
                 timeout = timedelta(minutes=15)
                 self.info("Detected pin validation method. Attempting to retrieve PIN from email.")
@@ -250,38 +262,30 @@ class LinkedInController(Controller):
                 task.finished.connect(enterPIN)
                 QThreadPool.globalInstance().start(task)
 
-                start = datetime.now()
-                while True:
-                    pin_inputs = self.browser.find_elements_by_id(EIS.pin_verification_input)
-                    if not pin_inputs and not entered:
-                        self.warning('detected that PIN was entered manually.')
-                        break
-                    elif entered:  # Entered automatically
-                        break
-                    elif datetime.now() - start > timeout:
-                        raise PINTimeoutException("PIN entering timed out.")
+                # Entering the PIN automatically wakes the wait up, entering it manually is noticed by polling the page
+                def pinEntered():
+                    return entered.is_set() or not self.browser.find_elements_by_id(EIS.pin_verification_input)
+
+                if not waitUntil(pinEntered, timeout=timeout.total_seconds(), backoff=Backoff(0.5, 2), event=entered):
+                    raise PINTimeoutException("PIN entering timed out.")
+                if not entered.is_set():
+                    self.warning('detected that PIN was entered manually.')
                 return
 
             # Determine if it's asking for a recaptcha
             timeout = timedelta(minutes=5)
-            found = False
-            while True:
-                captcha = self.browser.find_elements_by_id(EIS.captcha_challenge)
-                if captcha:
-                    if not found:
-                        self.warning(f"Detected Captcha. You have {timeout.total_seconds()/60} minutes to solve it.")
-                        method = "captcha"
-                        start = datetime.now()
-                        found = True
-
-                if not found:
-                    self.debug("Captcha was not detected.")
-                    break
-                elif found and not captcha:
-                    self.info("Captcha solved.")
-                    break
-                elif datetime.now() - start > timeout:
+            if self.browser.find_elements_by_id(EIS.captcha_challenge):
+                self.warning(f"Detected Captcha. You have {timeout.total_seconds()/60} minutes to solve it.")
+                method = "captcha"
+
+                def captchaSolved():
+                    return not self.browser.find_elements_by_id(EIS.captcha_challenge)
+
+                if not waitUntil(captchaSolved, timeout=timeout.total_seconds(), backoff=Backoff(0.5, 2)):
                     raise CaptchaTimeoutException("Captcha timed out.")
+                self.info("Captcha solved.")
+            else:
+                self.debug("Captcha was not detected.")
 
             if not method:
                 raise SecurityVerificationException("An unknown security verification technique was detected.")
@@ -435,6 +439,7 @@ class LinkedInController(Controller):
     @finish_executing
     @log_exceptions
     @authentication_required
+    @unit_of_work
     def sendMessageTo(self, connection: LinkedInConnection, message: str, template):
         """Sends a message to the person."""
         person = connection.name
@@ -452,6 +457,7 @@ class LinkedInController(Controller):
             self.critical(f"Daily activity limit reached! The above message was not sent.")
             return
 
+        releaseConnection()  # Not needed again until the message is recorded
         self.closeAllChatWindows()
         foundInList = self.openConversationWith(person)
         if not foundInList:
@@ -490,52 +496,61 @@ class LinkedInController(Controller):
     @connection_required
     @log_exceptions
     @authentication_required
+    @unit_of_work
     def messageAll(self, connections: list, usingTemplate, checkPastMessages=True):
         """Messages all connections with the template usingTemplate (a query object)"""
 
-        for connection in connections:  # each connection is a query object
+        # Fetch everyone who already received this template up front instead of asking the database per recipient.
+        sentMessages = SentMessageIndex.forTemplates(usingTemplate.id) if checkPastMessages else SentMessageIndex()
 
-            if not self.isRunning:
-                return
+        try:
+            for connection in connections:  # each connection is a query object
 
-            if connection.account.dailyActivityLimitReached():
-                self.critical("Daily limit reached. No more messages will be sent on this account")
-                return
+                if not self.isRunning:
+                    return
 
-            # Checking database to see if template was already sent to user
-            if checkPastMessages:
-                previouslySentMessages = Session.query(LinkedInMessage).filter(
-                    LinkedInMessage.recipient_connection_id == connection.id,
-                    LinkedInMessage.template_id == usingTemplate.id
-                )
-                alreadySent = previouslySentMessages.count()
-
-                # For templates pulled from the Legacy database, we need to scrape previous messages
-                if not alreadySent and usingTemplate.crc != LinkedInMessageTemplate.defaultCRC:
-                    for date, name, msg in self.getConversationHistory(connection.name):
-                        if str(usingTemplate.crc) in msg:
-                            alreadySent = 1
-
-                            # While we're at it, we create a message and put it in the database so we don't have to scrape
-                            # for this combination of template and connection again.
-                            msg = LinkedInMessage(template_id=usingTemplate.id, recipient_connection_id=connection.id)
-                            Session.add(msg)
-                            Session.commit()
-                            break
+                if connection.account.dailyActivityLimitReached():
+                    self.critical("Daily limit reached. No more messages will be sent on this account")
+                    return
 
-            else:
-                alreadySent = 0
+                # Checking the already sent messages to see if template was already sent to user
+                if checkPastMessages:
+                    alreadySent = sentMessages.wasSent(connection.id, usingTemplate.id)
+
+                    # For templates pulled from the Legacy database, we need to scrape previous messages
+                    if not alreadySent and usingTemplate.crc != LinkedInMessageTemplate.defaultCRC:
+                        releaseConnection()
+                        for date, name, msg in self.getConversationHistory(connection.name):
+                            if str(usingTemplate.crc) in msg:
+                                alreadySent = True
+
+                                # While we're at it, we create a message and put it in the database so we don't have to
+                                # scrape for this combination of template and connection again.
+                                msg = LinkedInMessage(template_id=usingTemplate.id, recipient_connection_id=connection.id)
+                                Session.add(msg)
+                                Session.commit()
+                                sentMessages.add(connection.id, usingTemplate.id)
+                                break
 
-            if alreadySent:
-                self.warning(f"Skipping {connection.name} because the message has already been sent to them.")
-            elif not usingTemplate.isValid(connection):
-                self.warning(f"Skipping {connection.name} because the message template was invalid for this connection.")
-            else:
-                msg = usingTemplate.fill(connection)
-                success = self.sendMessageTo(connection, msg, usingTemplate)
-                if success:
-                    self.debug(f"WAITING BOUNDS: {self.minMessagingDelay} {self.maxMessagingDelay}")
-                    random_uniform_wait(self.minMessagingDelay, self.maxMessagingDelay, self)
+                else:
+                    alreadySent = False
+
+                if alreadySent:
+                    self.warning(f"Skipping {connection.name} because the message has already been sent to them.")
+                    continue
+
+                # Validate and send the same render (it's shared with the preview if the message was previewed).
+                rendered = usingTemplate.renderFor(connection)
+                if not rendered.isValid:
+                    self.warning(f"Skipping {connection.name} because the message template was invalid for this connection.")
+                else:
+                    success = self.sendMessageTo(connection, rendered.text, usingTemplate)
+                    if success:
+                        sentMessages.add(connection.id, usingTemplate.id)
+                        self.debug(f"WAITING BOUNDS: {self.minMessagingDelay} {self.maxMessagingDelay}")
+                        random_uniform_wait(self.minMessagingDelay, self.maxMessagingDelay, self)
+        finally:
+            self.info(f"Checked past messages without querying the database {sentMessages.queriesSaved()} time(s).")
 
     @only_if_browser_is_running
     @connection_required
@@ -687,12 +702,13 @@ class LinkedInController(Controller):
     @connection_required
     @log_exceptions
     @authentication_required
-    def getNewConnections(self, account_id, known: list = None, getMutualInfoFor: list = None,
+    def getNewConnections(self, account_id, getMutualInfoFor: list = None,
                           withLocation=True, withPosition=True, updateConnections=None) -> dict:
         """
-        Gets all contacts and returns them in a dictionary
+        Gets all contacts and returns them in a dictionary. Connections already stored for the account (according to
+        its ConnectionIndex) are skipped unless they're in updateConnections or getMutualInfoFor.
+
         :param account_id: The account id
-        :param known: A list of the currently stored connections' names
         :param getMutualInfoFor: A list of connections you want the mutual connections info for
         :param withLocation: whether to store location information about the connections
         :param withPosition: whether to store job/position info about the connections
@@ -721,7 +737,7 @@ class LinkedInController(Controller):
         self.browser.switch_to.window(self.mainWindow)
 
         # Iterate through connections on page, then click next
-        connections = self.scrapeConnections(baseURL, account_id, known=known, getMutualInfoFor=getMutualInfoFor,
+        connections = self.scrapeConnections(baseURL, account_id, getMutualInfoFor=getMutualInfoFor,
                                              findLocation=withLocation, findPosition=withPosition,
                                              updateConnections=updateConnections)
 
@@ -732,17 +748,17 @@ class LinkedInController(Controller):
     @finish_executing
     @log_exceptions
     @authentication_required
-    def scrapeConnections(self, baseURL, account_id, known: list = None, getMutualInfoFor: list = None,
+    @unit_of_work
+    def scrapeConnections(self, baseURL, account_id, getMutualInfoFor: list = None,
                           findLocation=True, findPosition=True, updateConnections=None):
         """
         The while loop that iterates through all connections, getting their info
         """
-        if known is None:
-            known = []
-        if getMutualInfoFor is None:
-            getMutualInfoFor = []
-        if updateConnections is None:
-            updateConnections = []
+        known = ConnectionIndex.forAccount(account_id)
+        staged = known.staged()  # New connections only go in the shared index once they're committed
+        releaseConnection()
+        getMutualInfoFor = {normalizeName(name) for name in getMutualInfoFor or ()}
+        updateConnections = {normalizeName(name) for name in updateConnections or ()}
 
         page = 1
         num = 0
@@ -762,7 +778,8 @@ class LinkedInController(Controller):
                 # Get the name for this connection
                 name = fromHTML(connection.find_element_by_class_name("name").get_attribute('innerHTML'))
 
-                if name not in known or name in updateConnections + getMutualInfoFor:
+                normalizedName = normalizeName(name)
+                if name not in staged or normalizedName in updateConnections or normalizedName in getMutualInfoFor:
 
                     # Get this person's info
                     link, pos, loc = self.getConnectionInfo(connection, pos=findPosition, loc=findLocation)
@@ -773,13 +790,17 @@ class LinkedInController(Controller):
                     # else:
                     #     names = []
 
-                    if name in updateConnections:
+                    if normalizedName in updateConnections and name in known:
 
                         # Get the matching connection from the database
-                        prevCon = Session.query(LinkedInConnection).filter(
-                            LinkedInConnection.account_id == account_id,
-                            LinkedInConnection.name == name
-                        )
+                        prevCon_id = known.find(name=name, url=link)
+                        if prevCon_id is not None:
+                            prevCon = Session.query(LinkedInConnection).get(prevCon_id)
+                        else:
+                            prevCon = Session.query(LinkedInConnection).filter(
+                                LinkedInConnection.account_id == account_id,
+                                LinkedInConnection.name == name
+                            ).first()
 
                         # Update its values
                         if link != prevCon.url:
@@ -795,6 +816,7 @@ class LinkedInController(Controller):
 
                         # Commit changes, log, and continue
                         Session.commit()
+                        known.add(name, link, prevCon.id)
                         self.warning(f"Updated {name}'s information.")
 
                     else:
@@ -808,6 +830,7 @@ class LinkedInController(Controller):
                                 status=pos
                             )
                         )
+                        staged.add(name, link)
 
                         # Add 1 to total number of new connections, log, and continue
                         num += 1
@@ -823,15 +846,21 @@ class LinkedInController(Controller):
                     # Commit changes
                     self.info('Adding new connections to database.\n')
                     Session.commit()
+                    staged.apply()
                     oldNum = num
                 else:
                     self.info(f'No new connections found on page {page}.\n')
+                    releaseConnection()
 
                 # Go to next page, and log it
                 page += 1
                 self.debug(f'// Switching to page {page} of connections \\\\\n')
                 self.browser.get(baseURL + f'&page={page}')
 
+        # The last page's connections
+        Session.commit()
+        staged.apply()
+
         self.connectionsScraped.emit()
         self.info(f'** Scraped {num} connections and their information. **\n')
 
@@ -925,12 +954,31 @@ class LinkedInController(Controller):
     @connection_required
     @log_exceptions
     @authentication_required
+    @unit_of_work
     def refreshAll(self, known):
         """
         Updates information about all connections stored in the known list
         Known is a list of name, id tuples
+
+        The stored rows are loaded in one query before the search starts, and only the columns that changed are written,
+        in bulk, every REFRESH_BATCH_SIZE rows or REFRESH_BATCH_AGE (whichever comes first).
+
+        :return: A summary of how many connections were searched, updated, unchanged, not found, or skipped
         """
 
+        # Load everything we're about to refresh up front instead of querying for each connection
+        stored = {
+            row.id: row._asdict() for row in Session.query(
+                LinkedInConnection.id, LinkedInConnection.account_id, LinkedInConnection.name,
+                LinkedInConnection.url, LinkedInConnection.status, LinkedInConnection.location,
+                LinkedInConnection.city, LinkedInConnection.state, LinkedInConnection.country, LinkedInConnection.zip_code
+            ).filter(LinkedInConnection.id.in_([conn_id for name, conn_id in known]))
+        }
+        updates = BulkUpdateBuffer(LinkedInConnection, maxRows=self.REFRESH_BATCH_SIZE, maxAge=self.REFRESH_BATCH_AGE)
+        summary = {'searched': 0, 'updated': 0, 'unchanged': 0, 'notFound': 0, 'skipped': 0}
+        staged = {}  # account_id: the updated connections, added to that account's index once they're written
+        releaseConnection()  # Only needed again to write the updates
+
         self.browser.get('https://www.linkedin.com/in/me/')
 
         # Find connection page link, click on it
@@ -952,67 +1000,92 @@ class LinkedInController(Controller):
         # Get the searchbar
         searchbar = self.browser.find_element_by_xpath(EIS.general_search_bar)
 
-        package = 0
         progress = 0
         total = len(known)
 
-        for name, conn_id in known:
-            progress += 1
-            self.debug(f"({progress} of {total}) Searching for {name}")
-
-            random_uniform_wait(.6, 1)
-
-            searchbar.clear()
-            random_uniform_wait(.1, .5)
-            send_keys_at_irregular_speed(searchbar, name, 1, 3, 0, .25)
-            searchbar.send_keys(Keys.RETURN)
-
-            necessary_wait(.5)
-
-            try:
-                firstResult = self.browser.find_elements_by_class_name(EIS.connection_card_info_class)[0]
-
-                if not firstResult:
-                    raise NoSuchElementException
-
-            except (IndexError, NoSuchElementException):
-                self.warning(f'It seems {name} is no longer a connection.\n')
-                # TODO: Figure out if we want to flag this connection as no longer connected to account or something
-                continue
-
-            link, status, location = self.getConnectionInfo(firstResult)
-
-            dbObj = Session.query(LinkedInConnection).filter(LinkedInConnection.id == conn_id)[0]
+        # The changes already buffered are written even if the search fails part way (the browser crashes, the
+        # controller is stopped...), so the connections searched before that don't have to be searched again
+        try:
+            for name, conn_id in known:
+                progress += 1
+                self.debug(f"({progress} of {total}) Searching for {name}")
 
-            # print(dbObj.name, name, dbObj.id, conn_id)
-            # continue
+                dbObj = stored.get(conn_id)
+                if dbObj is None:
+                    self.warning(f"{name} is no longer stored in the database. Skipping.\n")
+                    summary['skipped'] += 1
+                    continue
 
-            dbObj.url = link
-            dbObj.status = status
-            dbObj.location = location
+                random_uniform_wait(.6, 1)
 
-            self.info(f"Updated {dbObj.name}'s information\n")
+                searchbar.clear()
+                random_uniform_wait(.1, .5)
+                send_keys_at_irregular_speed(searchbar, name, 1, 3, 0, .25)
+                searchbar.send_keys(Keys.RETURN)
 
-            package += 1
-            if package == 20:
-                # Sending 20 connection updates at a time
-                Session.commit()
+                necessary_wait(.5)
 
-        Session.commit()
-        self.info('Done.')
+                try:
+                    firstResult = self.browser.find_elements_by_class_name(EIS.connection_card_info_class)[0]
+
+                    if not firstResult:
+                        raise NoSuchElementException
+
+                except (IndexError, NoSuchElementException):
+                    self.warning(f'It seems {name} is no longer a connection.\n')
+                    # TODO: Figure out if we want to flag this connection as no longer connected to account or something
+                    summary['notFound'] += 1
+                    continue
+
+                summary['searched'] += 1
+                link, status, location = self.getConnectionInfo(firstResult)
+
+                # The first search result might be someone else we already know who has a similar name
+                index = ConnectionIndex.forAccount(dbObj['account_id'])
+                matched_id = index.find(url=link)
+                if matched_id is not None and matched_id != conn_id:
+                    self.warning(f"The first result for {name} is a different connection. Skipping.\n")
+                    summary['skipped'] += 1
+                    continue
+
+                # Bulk updates bypass the model, so the location's components are parsed here
+                values = {'url': link, 'status': status, 'location': location, **parseLocation(location)._asdict()}
+                changed = updates.update(conn_id, dbObj, values)
+                if changed:
+                    dbObj.update(changed)
+                    staged.setdefault(index.account_id, index.staged()).add(dbObj['name'], link, conn_id)
+                    if not len(updates):
+                        # The update filled the buffer, which was written
+                        for written in staged.values():
+                            written.apply()
+                    summary['updated'] += 1
+                    self.info(f"Updated {dbObj['name']}'s {', '.join(changed)}\n")
+                else:
+                    summary['unchanged'] += 1
+                    self.debug(f"{dbObj['name']}'s information hasn't changed\n")
+        finally:
+            updates.flush()
+            for written in staged.values():
+                written.apply()
+
+        self.info(f"Done. Searched {summary['searched']} connections: {summary['updated']} updated, "
+                  f"{summary['unchanged']} unchanged, {summary['notFound']} not found, and {summary['skipped']} skipped. "
+                  f"Wrote {updates.valuesWritten} values to {updates.rowsWritten} rows in {updates.flushes} batch(es).")
+        return summary
 
     @only_if_browser_is_running
     @connection_required
     @log_exceptions
     @authentication_required
+    @unit_of_work
     def requestNewConnections(self, account_id, criteria):
         """
         Requests new connections using the specified criteria
         """
 
-        # Get the account and daily activity
-        acct = Session.query(LinkedInAccount).filter(LinkedInAccount.id == account_id)[0]
-        dact = LinkedInAccountDailyActivity.getToday(account_id)
+        # Get the account's activity ledger
+        ledger = LinkedInActivityLedger.forAccount(account_id)
+        releaseConnection()
 
         self.debug('Going to search page')
         self.browser.get('https://www.linkedin.com/in/me/')
@@ -1046,7 +1119,7 @@ class LinkedInController(Controller):
             # Iterate through them
             for connection in conns:
                 # First check the limits (against the entered amount and against the daily limit)
-                if num == lim or acct.getTodaysRemainingActions() <= 0:  # lte just in case it somehow dips below
+                if num == lim or ledger.remainingActions() <= 0:  # lte just in case it somehow dips below
                     self.critical('Reached the local connection request limit')
                     return
 
@@ -1080,8 +1153,7 @@ class LinkedInController(Controller):
                             pass
 
                         num += 1
-                        dact.connection_request_count += 1
-                        Session.commit()
+                        ledger.recordConnectionRequest()
                         self.requestSent.emit()
 
             try:
@@ -1201,12 +1273,17 @@ class LinkedInMessenger(Task):
     def run(self):
         self.setup()
 
-        msgTemplate = Session.query(LinkedInMessageTemplate).get(self.msgTemplate_id)
-        connections = Session.query(LinkedInConnection)\
-            .filter(LinkedInConnection.id.in_(self.connections_ids))\
-            .order_by(LinkedInConnection.name)
-        self.controller.start()
-        self.controller.messageAll(connections, usingTemplate=msgTemplate)
+        with sessionScope():
+            msgTemplate = Session.query(LinkedInMessageTemplate).get(self.msgTemplate_id)
+            connections = Session.query(LinkedInConnection)\
+                .filter(LinkedInConnection.id.in_(self.connections_ids))\
+                .order_by(LinkedInConnection.name)
+            self.controller.start()
+            try:
+                self.controller.messageAll(connections, usingTemplate=msgTemplate)
+            finally:
+                # Record the messages that were sent even if the rest couldn't be
+                LinkedInActivityLedger.forAccount(msgTemplate.account_id).flush()
 
         try:
             self.teardown()
@@ -1218,49 +1295,81 @@ class LinkedInMessenger(Task):
 
 
 class UploadConnectionCSV(QRunnable):
-    """Run a function in the QThreadPool and emit the value returned in the finished signal."""
+    """
+    Streams a LinkedIn connections export (Connections.csv) into the database.
 
-    Beacon.packageCommitted = Signal()
+    The file is read BATCH_SIZE rows at a time. Each row is checked against the account's ConnectionIndex, and the new
+    connections in a batch are written with a single bulk INSERT. After every batch, the number of rows read so far and
+    the rows per second are emitted in the packageCommitted signal.
+    """
+
+    Beacon.packageCommitted = Signal(int, float)  # rows read, rows per second
 
-    def __init__(self, account_id, connections):
+    BATCH_SIZE = 5000
+    HEADER_START = 'First Name'
+    DATE_FORMAT = '%d %b %Y'  # e.g. 18 Oct 2020
+
+    def __init__(self, account_id, path):
         super().__init__()
         self.__b = Beacon(self)
-        self.connections = sorted(connections, key=lambda conn: conn[0])
+        self.path = path
         self.account_id = account_id
 
-    def run(self):
-        names = [name[0] for name in
-                 Session.query(LinkedInConnection.name).filter(LinkedInConnection.account_id == self.account_id)]
-
-        empty = 0
-        package = 0
-
-        for connection in self.connections:
-            fullName = ' '.join(connection[:2])
-            if fullName == ' ':
-                # Sometimes there are entries with no name. We skip these but keep track of them
-                empty += 1
-
-            elif fullName not in names:
+    @staticmethod
+    def isConnectionsExport(path):
+        """Determines if a file looks like a LinkedIn connections export by reading its header."""
+        with open(path, 'r', newline='', encoding='utf-8') as csvfile:
+            header = next(csv.reader(csvfile), None)
+        return bool(header) and header[0] == UploadConnectionCSV.HEADER_START
 
-                Session.add(
-                    LinkedInConnection(
-                        account_id=self.account_id,
-                        name=fullName,
-                        email=connection[2],
-                        position=connection[4] + ' at ' + connection[3],
-                        date_added=parse(connection[5])
-                    )
-                )
+    @staticmethod
+    def parseDate(dateString):
+        """Parses the "Connected On" column, trying the export's own format before falling back to dateutil."""
+        try:
+            return datetime.strptime(dateString, UploadConnectionCSV.DATE_FORMAT)
+        except ValueError:
+            return parse(dateString) if dateString else None
 
-                package += 1
+    def run(self):
+        empty = 0
+        rowsRead = 0
+        start = time.perf_counter()
+
+        with sessionScope():
+            known = ConnectionIndex.forAccount(self.account_id)
+
+            with open(self.path, 'r', newline='', encoding='utf-8') as csvfile:
+                reader = csv.reader(csvfile)
+                next(reader, None)  # skip the header
+
+                while batch := list(islice(reader, self.BATCH_SIZE)):
+                    newConnections = []
+
+                    staged = known.staged()
+                    for connection in batch:
+                        fullName = ' '.join(connection[:2])
+                        if fullName == ' ':
+                            # Sometimes there are entries with no name. We skip these but keep track of them
+                            empty += 1
+
+                        elif fullName not in staged:
+                            staged.add(fullName)  # also skips duplicates within the batch
+                            newConnections.append({
+                                'account_id': self.account_id,
+                                'name': fullName,
+                                'email': connection[2],
+                                'position': connection[4] + ' at ' + connection[3],
+                                'date_added': self.parseDate(connection[5]),
+                            })
+
+                    if newConnections:
+                        Session.execute(LinkedInConnection.__table__.insert(), newConnections)
+                        Session.commit()
+                        staged.apply()
 
-                if package == 10:
-                    Session.commit()
-                    package = 0
-                    self.packageCommitted.emit()
+                    rowsRead += len(batch)
+                    self.packageCommitted.emit(rowsRead, rowsRead / max(time.perf_counter() - start, 1e-6))
 
-        Session.commit()
         self.finished.emit(empty)
 
 
@@ -1275,7 +1384,8 @@ class LinkedInIndividualConnectionScraper(Task):
         self.setup()
         self.controller.start()
 
-        self.controller.refreshAll(self.known)
+        with sessionScope():
+            self.controller.refreshAll(self.known)
 
         self.teardown()
 
@@ -1291,9 +1401,9 @@ class LinkedInBulkConnectionScraper(Task):
         opts = self.options
         self.controller.start()
 
-        known = opts.get('known')
         account_id = opts.get('accid')
-        connections = self.controller.getNewConnections(account_id, known=known)
+        with sessionScope():
+            connections = self.controller.getNewConnections(account_id)
 
         self.teardown()
 
@@ -1322,6 +1432,10 @@ class LinkedInConnectionRequestSender(Task):
 
         self.controller.start()
 
-        self.controller.requestNewConnections(self.id, self.criteria)
+        with sessionScope():
+            try:
+                self.controller.requestNewConnections(self.id, self.criteria)
+            finally:
+                LinkedInActivityLedger.forAccount(self.id).flush()
 
         self.teardown()
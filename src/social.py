@@ -5,15 +5,18 @@ Scrape the LinkedIn conversations
 import os
 import sys
 import logging
-from PySide2.QtWidgets import QApplication
+from PySide2.QtWidgets import QApplication, QMessageBox
 from PySide2.QtCore import QTimer, QThreadPool, Signal, Qt
 
 from gui.mainwindow import SocialView
 import common.authenticate as inst
 import qtmodern.styles as styles
 from common.threading import Task
-from common.version import downloadInstaller, triggerUpdate, updateInProgress, getCurrentVersion
+from common.logging import archive_logs
+from common.version import downloadInstaller, triggerUpdate, getUpdateChecker, getCurrentVersion
 from common.beacon import Beacon
+from database.linkedin import LinkedInActivityLedger
+from database.migrations import prepareDatabase, SchemaOutOfDate
 
 logger = logging.getLogger("root")
 
@@ -28,6 +31,17 @@ if __name__ == "__main__":
     os.environ["PATH"] += os.pathsep + os.path.abspath(os.path.join("drivers", "windows"))
 
     app = QApplication([])
+
+    # Make sure the database has the schema this version expects (a local database is migrated right away)
+    try:
+        prepareDatabase()
+    except SchemaOutOfDate as e:
+        logger.critical(str(e))
+        QMessageBox.critical(None, "Database Out of Date", str(e))
+        exit(1)
+
+    # Tidy up the logs of earlier runs without holding up startup
+    QThreadPool.globalInstance().start(Task(archive_logs))
     styles.darkClassic(app)
     size = app.desktop().size()
 
@@ -36,12 +50,16 @@ if __name__ == "__main__":
 
     inst.View = view
 
-    securityTimer = QTimer(view)
-    securityTimer.timeout.connect(inst.checkRun)
-    securityTimer.start(10_000)  # Every 10 seconds
+    # Make sure the activity counted since the last flush makes it to the database
+    app.aboutToQuit.connect(LinkedInActivityLedger.flushAll)
+
+    # Every 10 seconds, in the background
+    killSwitchPoller = inst.KillSwitchPoller(inst.killSwitch, parent=view)
+    killSwitchPoller.stateChanged.connect(inst.checkRun)
+    killSwitchPoller.start()
 
     def updateSocial():
-        if not updateInProgress:
+        if not getUpdateChecker().downloading:
             t = Task(downloadInstaller)
             t.finished.connect(triggerUpdate, type=Qt.BlockingQueuedConnection)
             QThreadPool.globalInstance().start(t)
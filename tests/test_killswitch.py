@@ -0,0 +1,108 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from common.authenticate import KillSwitch
+from common.filehost import FileHostSession
+
+
+class FakeFileHost:
+    """The state of a file host holding one file, shared by every FakeFTP session connected to it"""
+
+    def __init__(self, text="True", modified="20201018120000"):
+        self.text = text
+        self.modified = modified
+        self.up = True
+        self.connections = 0
+        self.downloads = 0
+
+    def change(self, text, modified):
+        self.text = text
+        self.modified = modified
+
+    def connect(self):
+        if not self.up:
+            raise ConnectionRefusedError("The file host is down")
+        self.connections += 1
+        return FakeFTP(self)
+
+
+class FakeFTP:
+    """Answers the few FTP commands the kill switch uses. A dropped session fails every command, like a closed socket."""
+
+    def __init__(self, host: FakeFileHost):
+        self.host = host
+        self.dropped = False
+
+    def _command(self):
+        if self.dropped or not self.host.up:
+            raise EOFError()
+
+    def voidcmd(self, cmd):
+        self._command()
+        return "200 OK"
+
+    def sendcmd(self, cmd):
+        self._command()
+        return f"213 {self.host.modified}"
+
+    def size(self, path):
+        self._command()
+        return len(self.host.text)
+
+    def retrlines(self, cmd, callback):
+        self._command()
+        self.host.downloads += 1
+        for line in self.host.text.splitlines():
+            callback(line)
+
+    def quit(self):
+        self._command()
+
+    def close(self):
+        pass
+
+
+class KillSwitchCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.host = FakeFileHost()
+        self.session = FileHostSession(connect=self.host.connect)
+        self.killSwitch = KillSwitch(self.session)
+
+    def test_downloadsOnlyWhenChanged(self):
+        self.assertTrue(self.killSwitch.check())
+        self.assertTrue(self.killSwitch.check())
+        self.assertEqual(self.host.downloads, 1)
+        self.assertEqual(self.host.connections, 1)
+
+        self.host.change("False", "20201018130000")
+        self.assertFalse(self.killSwitch.check())
+        self.assertEqual(self.host.downloads, 2)
+
+    def test_reconnectsAfterDrop(self):
+        self.assertTrue(self.killSwitch.check())
+        self.session.ftp.dropped = True
+
+        self.host.change("False", "20201018130000")
+        self.assertFalse(self.killSwitch.check())
+        self.assertEqual(self.host.connections, 2)
+
+    def test_keepsLastAnswerWhileHostIsDown(self):
+        self.assertTrue(self.killSwitch.check())
+
+        self.host.up = False
+        self.assertTrue(self.killSwitch.check())
+
+        self.host.up = True
+        self.host.change("False", "20201018130000")
+        self.assertFalse(self.killSwitch.check())
+
+    def test_unknownUntilHostIsReached(self):
+        self.host.up = False
+        self.assertIsNone(self.killSwitch.check())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from common.locations import parseLocation, LocationParts
+
+
+class ParseLocation(unittest.TestCase):
+
+    def assertParses(self, location, city="", state="", country="", zipCode=""):
+        self.assertEqual(parseLocation(location), LocationParts(city, state, country, zipCode))
+
+    def test_stateAbbreviationAfterCity(self):
+        self.assertParses("San Diego, CA", "San Diego", "California", "United States")
+        self.assertParses("Los Angeles, CA", "Los Angeles", "California", "United States")
+
+    def test_provinceAbbreviationAndCountry(self):
+        self.assertParses("Toronto, ON, Canada", "Toronto", "Ontario", "Canada")
+
+    def test_countryAbbreviationAlone(self):
+        self.assertParses("CA", country="Canada")
+
+    def test_regionNamedLikeCountry(self):
+        self.assertParses("Atlanta, Georgia", "Atlanta", "Georgia", "United States")
+        self.assertParses("Tbilisi, Georgia", "Tbilisi", country="Georgia")
+
+    def test_keepsCityNameAsWritten(self):
+        self.assertParses("New York, New York", "New York", "New York", "United States")
+        self.assertParses("Greater New York City Area", "New York City", "New York", "United States")
+
+    def test_metroArea(self):
+        self.assertParses("Greater Denver Area", "Denver", "Colorado", "United States")
+
+    def test_zipCode(self):
+        self.assertParses("Austin, TX 78701", "Austin", "Texas", "United States", "78701")
+
+
+if __name__ == '__main__':
+    unittest.main()
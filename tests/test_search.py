@@ -0,0 +1,42 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from common.search import TrigramIndex, connectionDocument
+
+CONNECTIONS = [
+    ("Ada Lovelace", "Software Engineer at Analytical Engines", "London, England, United Kingdom"),
+    ("Alan Turing", "Research Scientist", "Manchester, England, United Kingdom"),
+    ("Grace Hopper", "Rear Admiral", "Arlington, Virginia, United States"),
+    ("Katherine Johnson", None, None),
+]
+
+
+class ConnectionSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TrigramIndex([connectionDocument(*connection) for connection in CONNECTIONS])
+
+    def test_searchesByName(self):
+        self.assertEqual(list(self.index.search("hopper")), [2])
+
+    def test_searchesByPosition(self):
+        self.assertEqual(list(self.index.search("Engineer")), [0])
+        self.assertEqual(list(self.index.search("research sci")), [1])
+
+    def test_searchesByLocation(self):
+        self.assertEqual(list(self.index.search("Manchester")), [1])
+        self.assertEqual(list(self.index.search("England")), [0, 1])
+
+    def test_doesNotMatchAcrossFields(self):
+        self.assertEqual(list(self.index.search("Turing Research")), [])
+
+    def test_narrowsWhileTyping(self):
+        self.assertEqual(list(self.index.search("Vir")), [2])
+        self.assertEqual(list(self.index.search("Virginia")), [2])
+        self.assertEqual(list(self.index.search("Virginie")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import hashlib
+import tempfile
+import sys
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+import common.version
+from common.version import UpdateChecker, getUpdateChecker
+from common.filehost import FileHostSession
+
+INSTALLER = bytes(range(256)) * 64
+
+
+class FakeInstallerHost:
+    """An FTP session with the file host holding the installer of version 2.0.0"""
+
+    def __init__(self, data: bytes = INSTALLER):
+        self.data = data
+        self.downloads = []  # The offset each download started at
+
+    def voidcmd(self, cmd):
+        return "200 OK"
+
+    def size(self, path):
+        return len(self.data)
+
+    def retrbinary(self, cmd, callback, blocksize=8192, rest=None):
+        self.downloads.append(rest or 0)
+        data = self.data[rest or 0:]
+        for i in range(0, len(data), blocksize):
+            callback(data[i:i + blocksize])
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class DownloadInstaller(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.host = FakeInstallerHost()
+        self.checker = UpdateChecker(FileHostSession(connect=lambda: self.host), directory=self.directory.name,
+                                     currentVersion="1.0.0")
+        self.installerFile = os.path.join(self.directory.name, "social_v2.0.0.exe")
+        self.activeVersion(hashlib.sha256(INSTALLER).hexdigest())
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def activeVersion(self, checksum):
+        version = SimpleNamespace(semantic_id="2.0.0", change_log="", checksum=checksum)
+        patcher = mock.patch("common.version.getActiveVersion", return_value=version)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_resumesPartialDownload(self):
+        with open(self.installerFile + ".part", "wb") as part:
+            part.write(INSTALLER[:5000])
+
+        self.assertTrue(self.checker.downloadInstaller())
+        self.assertEqual(self.host.downloads, [5000])
+        self.assertEqual(self.read(self.installerFile), INSTALLER)
+        self.assertFalse(os.path.exists(self.installerFile + ".part"))
+
+    def test_rejectsChecksumMismatch(self):
+        self.host.data = INSTALLER[:-1] + b"\0"
+
+        self.assertFalse(self.checker.downloadInstaller())
+        self.assertFalse(os.path.exists(self.installerFile))
+        self.assertFalse(os.path.exists(self.installerFile + ".part"))
+
+    def test_skipsInstallerAlreadyOnDisk(self):
+        with open(self.installerFile, "wb") as installer:
+            installer.write(INSTALLER)
+
+        self.assertTrue(self.checker.downloadInstaller())
+        self.assertEqual(self.host.downloads, [])
+
+    def test_nothingToDownloadWhenUpToDate(self):
+        self.checker.currentVersion = "2.0.0"
+
+        self.assertFalse(self.checker.downloadInstaller())
+        self.assertEqual(self.host.downloads, [])
+
+
+class UpdateCheckerCreation(unittest.TestCase):
+
+    def test_createdOnFirstUse(self):
+        with mock.patch("common.version._updateChecker", None), \
+                mock.patch("common.version.getCurrentVersion", return_value="1.0.0") as getCurrentVersion:
+            self.assertIsNone(common.version._updateChecker)
+
+            checker = getUpdateChecker()
+            self.assertIs(getUpdateChecker(), checker)
+            self.assertEqual(checker.currentVersion, "1.0.0")
+            self.assertEqual(getCurrentVersion.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()